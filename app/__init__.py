@@ -2,6 +2,7 @@ import os
 from flask import Flask
 from app.extensions import db, login_manager
 from app.models import User, Vendor
+from app import cli, events, federation, jobs, profiling, response_cache, templating, versions
 
 def create_app():
     app = Flask(__name__)
@@ -12,9 +13,54 @@ def create_app():
     app.config['SQLALCHEMY_DATABASE_URI'] = f'sqlite:///{db_path}'
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
 
+    # --- CONFIG: Caches (shared by all workers through the instance folder) ---
+    instance_dir = os.path.join(os.getcwd(), 'instance')
+    app.config['TABLE_VERSION_DIR'] = os.path.join(instance_dir, 'versions')
+    app.config['JINJA_BYTECODE_DIR'] = os.path.join(instance_dir, 'jinja_cache')
+    app.config['FRAGMENT_CACHE_SIZE'] = 256
+
+    # --- CONFIG: Whole-page cache for read-only views ('memory', 'disk' or 'off') ---
+    # 'disk' lets every gunicorn worker serve pages another one rendered
+    app.config['RESPONSE_CACHE'] = os.environ.get('KPS_RESPONSE_CACHE', 'memory')
+    app.config['RESPONSE_CACHE_DIR'] = os.path.join(instance_dir, 'response_cache')
+    app.config['RESPONSE_CACHE_BYTES'] = 32 * 1024 * 1024
+
+    # --- CONFIG: Request profiler (armed from the system tab or with ?_profile=1) ---
+    app.config['PROFILE_DIR'] = os.path.join(instance_dir, 'profiles')
+    app.config['PROFILE_SETTINGS'] = os.path.join(instance_dir, 'profiling.json')
+    app.config['PROFILE_KEEP'] = 20
+
+    # --- CONFIG: Background jobs (VACUUM, backups, log cleanup); 0 workers = only 'flask jobs work' runs them ---
+    app.config['JOB_WORKERS'] = int(os.environ.get('KPS_JOB_WORKERS', 2))
+    app.config['BACKUP_DIR'] = os.path.join(instance_dir, 'backups')
+    app.config['BACKUP_KEEP'] = 5
+
+    # --- CONFIG: Archive tier (closed months older than the horizon leave the live table) ---
+    app.config['ARCHIVE_DIR'] = os.path.join(instance_dir, 'archive')
+    app.config['ARCHIVE_HORIZON_MONTHS'] = 24
+
+    # --- CONFIG: Live counters (SSE); each open stream holds one server thread ---
+    app.config['EVENT_SOCKET_DIR'] = os.path.join(instance_dir, 'events')
+    app.config['EVENT_MAX_STREAMS'] = int(os.environ.get('KPS_MAX_STREAMS', 4))
+
+    # --- CONFIG: Branches ---
+    # KPS_BRANCH names this server's branch (its entries stay in instance/logistics.db).
+    # KPS_SHARDS lists other branches' databases for the cross-branch reports:
+    #   KPS_SHARDS="pune=/srv/pune/instance/logistics.db,goa=/mnt/goa/logistics.db"
+    # See scripts/seed_shards.py for a local multi-branch setup.
+    app.config['BRANCH'] = os.environ.get('KPS_BRANCH', 'main')
+    app.config['BRANCH_ORIGIN'] = os.environ.get('KPS_BRANCH_ORIGIN', 'Mumbai')
+    federation.configure(app, os.environ.get('KPS_SHARDS', ''))
+
     # Initialize Extensions
     db.init_app(app)
     login_manager.init_app(app)
+    versions.init_app(app)
+    events.init_app(app)
+    response_cache.init_app(app)
+    templating.init_app(app)
+    profiling.init_app(app)
+    jobs.init_app(app)
 
     @login_manager.user_loader
     def load_user(user_id):
@@ -26,26 +72,22 @@ def create_app():
     from app.routes.admin import admin_bp
     from app.routes.reports import reports_bp
     from app.routes.chat import chat_bp  # <--- 1. IMPORT CHAT
+    from app.routes.search import search_bp
+    from app.routes.anomalies import anomalies_bp
+    from app.routes.events import events_bp
 
     app.register_blueprint(auth_bp)
     app.register_blueprint(core_bp)
     app.register_blueprint(admin_bp)
     app.register_blueprint(reports_bp)
     app.register_blueprint(chat_bp)      # <--- 2. REGISTER CHAT
+    app.register_blueprint(search_bp)
+    app.register_blueprint(anomalies_bp)
+    app.register_blueprint(events_bp)
 
-    # Initialize DB Content
-    with app.app_context():
-        db.create_all()
-
-        # Default Admin (Keep this to ensure you can always login)
-        if not User.query.first():
-            admin = User(username='admin', is_admin=True, is_active=True)
-            admin.set_password('admin123')
-            db.session.add(admin)
-            db.session.commit()
-            print(" System: Default Admin Created")
-
-        # Vendors are now managed via 'setup_vendors.py'
+    # Schema creation and admin seeding are explicit CLI steps
+    # ('flask db init' / 'flask db upgrade'), not part of every worker start.
+    cli.register(app)
 
     # Logging Signals
     from flask_login import user_logged_in, user_logged_out
@@ -0,0 +1,231 @@
+from datetime import datetime
+from sqlalchemy import func
+from app.extensions import db
+from app.models import Anomaly, Entry, Vendor
+
+# --- RULES ---
+# Each rule looks at one entry (plus its vendor) and returns a details string
+# when it fires, or None. Duplicate RR numbers need the rest of the ledger and
+# are handled separately in _duplicate_details().
+RULE_LABELS = {
+    'missing_rr': 'Missing RR number',
+    'duplicate_rr': 'Duplicate RR number',
+    'zero_parcels': 'Zero parcels',
+    'disabled_charge': 'Charge in a disabled column',
+}
+
+
+def _missing_rr(entry, vendor):
+    if not (entry.rr_no or '').strip():
+        return "RR number is blank"
+
+
+def _zero_parcels(entry, vendor):
+    if not entry.parcels or entry.parcels <= 0:
+        return f"Parcels = {entry.parcels or 0}"
+
+
+def _disabled_charge(entry, vendor):
+    if vendor is None:
+        return None
+    columns = []
+    if not vendor.show_handling and entry.handling_chg:
+        columns.append(f"handling {entry.handling_chg:g}")
+    if not vendor.show_railway and entry.railway_chg:
+        columns.append(f"railway {entry.railway_chg:g}")
+    if not vendor.show_transport and entry.transport_chg:
+        columns.append(f"transport {entry.transport_chg:g}")
+    if columns:
+        return f"{vendor.name} has these columns off: " + ", ".join(columns)
+
+
+ROW_RULES = {
+    'missing_rr': _missing_rr,
+    'zero_parcels': _zero_parcels,
+    'disabled_charge': _disabled_charge,
+}
+
+
+def _duplicate_details(entry):
+    rr_no = (entry.rr_no or '').strip()
+    if not rr_no:
+        return None, []
+    peers = [row[0] for row in db.session.query(Entry.id).filter(Entry.rr_no == rr_no, Entry.id != entry.id)]
+    return _duplicate_text(rr_no, peers), peers
+
+
+def _duplicate_text(rr_no, peers):
+    if not peers:
+        return None
+    return f"RR {rr_no} also on entr{'y' if len(peers) == 1 else 'ies'} #" + ", #".join(map(str, peers[:5]))
+
+
+# --- RECORDING ---
+def _apply(existing, entry, rule, details, now):
+    """Moves one (entry, rule) pair to the right state. Returns the row, if any."""
+    row = existing.get(rule)
+    if details:
+        if row is None:
+            row = Anomaly(entry_id=entry.id, entry_date=entry.date, rule=rule,
+                          details=details, status='open', created_at=now, updated_at=now)
+            db.session.add(row)
+            existing[rule] = row
+        else:
+            if row.status == 'cleared':
+                row.status = 'open'
+            row.details = details
+            row.entry_date = entry.date
+            row.updated_at = now
+    elif row is not None and row.status == 'open':
+        row.status = 'cleared'
+        row.updated_at = now
+    return row
+
+
+def _existing_for(entry_ids):
+    existing = {}
+    if entry_ids:
+        for row in Anomaly.query.filter(Anomaly.entry_id.in_(entry_ids)):
+            existing.setdefault(row.entry_id, {})[row.rule] = row
+    return existing
+
+
+def check_entry(entry, vendor=None, previous_rr=None):
+    """
+    Evaluates every rule for one entry after an insert or edit. Entries that
+    shared its old or new RR number are re-checked for duplicates too.
+    Needs entry.id (flush first); the caller commits.
+    """
+    now = datetime.utcnow()
+    vendor = vendor or Vendor.query.get(entry.vendor_id)
+    existing = _existing_for([entry.id]).get(entry.id, {})
+
+    for rule, check in ROW_RULES.items():
+        _apply(existing, entry, rule, check(entry, vendor), now)
+
+    details, peers = _duplicate_details(entry)
+    _apply(existing, entry, 'duplicate_rr', details, now)
+
+    if previous_rr and previous_rr != entry.rr_no:
+        peers += [row[0] for row in db.session.query(Entry.id).filter(Entry.rr_no == previous_rr, Entry.id != entry.id)]
+    _recheck_duplicates(peers, now)
+
+
+def forget_entry(entry):
+    """Drops an entry's anomalies before it is deleted. The caller commits."""
+    Anomaly.query.filter(Anomaly.entry_id == entry.id).delete(synchronize_session=False)
+    if entry.rr_no:
+        peers = [row[0] for row in db.session.query(Entry.id).filter(Entry.rr_no == entry.rr_no, Entry.id != entry.id)]
+        # The entry is still in the table at this point, so hide it from the peers' check
+        _recheck_duplicates(peers, datetime.utcnow(), ignore_id=entry.id)
+
+
+def check_entries(entry_ids):
+    """Re-evaluates the row rules for many entries after a bulk edit. The caller commits."""
+    vendors = {v.id: v for v in Vendor.query.all()}
+    # populate_existing: the rows were just changed behind the session's back
+    entries = Entry.query.filter(Entry.id.in_(entry_ids)).populate_existing().all()
+    _check_rows(entries, vendors, datetime.utcnow())
+
+
+def check_new_entries(entries):
+    """
+    check_entry() for many just-flushed entries in a fixed number of queries
+    (the batch API). Only RR numbers that now appear more than once are
+    re-checked for duplicates. The caller commits.
+    """
+    if not entries:
+        return
+    now = datetime.utcnow()
+    vendors = {v.id: v for v in Vendor.query.all()}
+    _check_rows(entries, vendors, now)
+
+    rr_numbers = {(entry.rr_no or '').strip() for entry in entries} - {''}
+    if rr_numbers:
+        rows = db.session.query(Entry.id, Entry.rr_no).filter(Entry.rr_no.in_(rr_numbers)).all()
+        counts = {}
+        for row in rows:
+            counts[row.rr_no] = counts.get(row.rr_no, 0) + 1
+        _recheck_duplicates([row.id for row in rows if counts[row.rr_no] > 1], now)
+
+
+def forget_entries(entry_ids, rr_numbers):
+    """
+    Bulk counterpart of forget_entry(), called after the entries are deleted:
+    drops their anomalies and re-checks whoever shared their RR numbers.
+    """
+    Anomaly.query.filter(Anomaly.entry_id.in_(entry_ids)).delete(synchronize_session=False)
+    rr_numbers = [rr for rr in set(rr_numbers) if rr]
+    if rr_numbers:
+        peers = [row[0] for row in db.session.query(Entry.id).filter(Entry.rr_no.in_(rr_numbers))]
+        _recheck_duplicates(peers, datetime.utcnow())
+
+
+def _check_rows(entries, vendors, now):
+    existing = _existing_for([e.id for e in entries])
+    for entry in entries:
+        rows = existing.setdefault(entry.id, {})
+        for rule, check in ROW_RULES.items():
+            _apply(rows, entry, rule, check(entry, vendors.get(entry.vendor_id)), now)
+
+
+def _recheck_duplicates(entry_ids, now, ignore_id=None):
+    if not entry_ids:
+        return
+    existing = _existing_for(entry_ids)
+    entries = Entry.query.filter(Entry.id.in_(entry_ids)).all()
+    # Everyone sharing these RR numbers in one query, instead of one per entry
+    sharing = {}
+    rr_numbers = {(entry.rr_no or '').strip() for entry in entries} - {''}
+    if rr_numbers:
+        for entry_id, rr_no in sorted(db.session.query(Entry.id, Entry.rr_no).filter(Entry.rr_no.in_(rr_numbers))):
+            sharing.setdefault(rr_no, []).append(entry_id)
+    for peer in entries:
+        rr_no = (peer.rr_no or '').strip()
+        others = [entry_id for entry_id in sharing.get(rr_no, []) if entry_id not in (peer.id, ignore_id)]
+        details = _duplicate_text(rr_no, others)
+        _apply(existing.setdefault(peer.id, {}), peer, 'duplicate_rr', details, now)
+
+
+# --- BACKFILL ---
+def backfill(chunk_size=2000, start_id=0, progress=None):
+    """
+    One-time scan of existing entries in id order, committing after every
+    chunk. Pass the last reported id as start_id to resume an interrupted run.
+    Returns the total number of open anomalies afterwards.
+    """
+    last_id = start_id
+    while True:
+        chunk = Entry.query.filter(Entry.id > last_id).order_by(Entry.id).limit(chunk_size).all()
+        if not chunk:
+            break
+
+        # Re-read each chunk: the commit below expires everything loaded
+        vendors = {v.id: v for v in Vendor.query.all()}
+
+        _check_rows(chunk, vendors, datetime.utcnow())
+        db.session.commit()
+        last_id = chunk[-1].id
+        if progress:
+            progress(last_id)
+
+    # Duplicates in one grouped pass over the rr_no index instead of per row
+    duplicated = db.session.query(Entry.rr_no).filter(Entry.rr_no != '') \
+        .group_by(Entry.rr_no).having(func.count(Entry.id) > 1).all()
+    for (rr_no,) in duplicated:
+        ids = [row[0] for row in db.session.query(Entry.id).filter(Entry.rr_no == rr_no)]
+        _recheck_duplicates(ids, datetime.utcnow())
+        db.session.commit()
+
+    return sum(open_counts().values())
+
+
+# --- COUNTERS ---
+def open_counts(rule=None, entry_date=None):
+    """Open anomalies per rule, read from the (status, rule, entry_date) index."""
+    query = db.session.query(Anomaly.rule, func.count(Anomaly.id)).filter(Anomaly.status == 'open')
+    if rule:
+        query = query.filter(Anomaly.rule == rule)
+    if entry_date:
+        query = query.filter(Anomaly.entry_date == entry_date)
+    return dict(query.group_by(Anomaly.rule).all())
@@ -0,0 +1,323 @@
+import os
+import sqlite3
+import threading
+from datetime import date, datetime
+from flask import current_app
+from sqlalchemy import event, text
+from sqlalchemy.orm import Session
+from app.extensions import db
+from app.models import ArchivedMonth, Entry
+from app.money import to_rupees
+from app.readmodels import EntryRow, entry_select, entry_rows, parse_date
+from app import versions
+
+# --- ARCHIVE TIER ---
+# Closed months older than ARCHIVE_HORIZON_MONTHS are moved out of the live
+# 'entry' table into one SQLite file per year (instance/archive/entries_2023.db).
+# Rows are copied over an ATTACHed database first and only then deleted from
+# the live table; under WAL a transaction spanning both files is not atomic,
+# so an interrupted run can leave a row in both tiers but never in neither.
+# The facade below drops such duplicates, and re-running finishes the move.
+# The archived_month catalog in the live DB says which months to look for in
+# the archive.
+ARCHIVE_DDL = [
+    """CREATE TABLE IF NOT EXISTS entry (
+           id INTEGER PRIMARY KEY,
+           date DATE NOT NULL,
+           month TEXT NOT NULL,
+           vendor_id INTEGER NOT NULL,
+           vendor_name TEXT,
+           ship_from TEXT,
+           ship_to TEXT,
+           rr_no TEXT,
+           parcels INTEGER,
+           handling_paise INTEGER,
+           railway_paise INTEGER,
+           transport_paise INTEGER,
+           total_paise INTEGER,
+           created_at DATETIME,
+           updated_at DATETIME,
+           invoice_id INTEGER
+       )""",
+    "CREATE INDEX IF NOT EXISTS ix_entry_month_vendor ON entry (month, vendor_id)",
+]
+# Amounts are whole paise, as in the live table (app/money.py). Files written
+# before that keep their REAL rupee columns and get these added by _upgrade().
+PAISE_COLUMNS = [('handling_chg', 'handling_paise'), ('railway_chg', 'railway_paise'),
+                 ('transport_chg', 'transport_paise'), ('grand_total', 'total_paise')]
+
+# EntryRow order, amounts back in rupees
+SELECT_ENTRIES = """
+    SELECT id, date, vendor_id, vendor_name, ship_from, ship_to, rr_no, parcels,
+           handling_paise / 100.0, railway_paise / 100.0, transport_paise / 100.0, total_paise / 100.0,
+           invoice_id
+      FROM entry
+"""
+
+
+class ArchivedEntry(EntryRow):
+    """Read-only stand-in for an Entry that lives in an archive file."""
+    __slots__ = ()
+    archived = True
+
+    def __init__(self, row):
+        super().__init__(row)
+        self.date = parse_date(self.date)
+
+
+# --- PATHS & BOUNDS ---
+def archive_dir():
+    return current_app.config['ARCHIVE_DIR']
+
+
+def archive_path(year):
+    return os.path.join(archive_dir(), f"entries_{year}.db")
+
+
+def month_bounds(month):
+    """'2024-02' -> ('2024-02-01', '2024-03-01'), for index-friendly range filters."""
+    year, mon = int(month[:4]), int(month[5:7])
+    end = date(year + mon // 12, mon % 12 + 1, 1)
+    return f"{month}-01", end.isoformat()
+
+
+def cutoff(today=None, horizon=None):
+    """First day of the oldest month that stays live."""
+    today = today or date.today()
+    horizon = current_app.config['ARCHIVE_HORIZON_MONTHS'] if horizon is None else horizon
+    index = today.year * 12 + today.month - 1 - horizon
+    return date(index // 12, index % 12 + 1, 1)
+
+
+def _open(year, readonly=True):
+    path = archive_path(year)
+    if readonly:
+        if not os.path.exists(path):
+            return None
+        conn = sqlite3.connect(f"file:{path}?mode=ro", uri=True)
+    else:
+        os.makedirs(archive_dir(), exist_ok=True)
+        conn = sqlite3.connect(path)
+        for ddl in ARCHIVE_DDL:
+            conn.execute(ddl)
+        _upgrade(conn)
+        conn.commit()
+    conn.row_factory = sqlite3.Row
+    return conn
+
+
+def _upgrade(conn):
+    have = {row[1] for row in conn.execute("PRAGMA table_info(entry)")}
+    missing = [(old, new) for old, new in PAISE_COLUMNS if new not in have]
+    if not missing:
+        return
+    for _, new in missing:
+        conn.execute(f"ALTER TABLE entry ADD COLUMN {new} INTEGER")
+    # One year of rows, off the request path: a single UPDATE is fine here
+    conn.execute("UPDATE entry SET " + ', '.join(
+        f"{new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS INTEGER)" for old, new in missing))
+
+
+def upgrade_files():
+    """Brings every year file in ARCHIVE_DIR up to the current schema (see migrations.money_in_paise)."""
+    directory = archive_dir()
+    if not os.path.isdir(directory):
+        return
+    for name in sorted(os.listdir(directory)):
+        if name.startswith('entries_') and name.endswith('.db') and name[8:-3].isdigit():
+            _open(int(name[8:-3]), readonly=False).close()
+
+
+# --- CATALOG ---
+_catalog_lock = threading.Lock()
+_catalog = {'version': None, 'months': {}}
+
+
+def archived_months():
+    """{'YYYY-MM': year} for every archived month; re-read only after an archive run."""
+    version = versions.get('archived_month')
+    with _catalog_lock:
+        if _catalog['version'] != version:
+            _catalog['months'] = dict(db.session.query(ArchivedMonth.month, ArchivedMonth.year).all())
+            _catalog['version'] = version
+        return _catalog['months']
+
+
+# --- FACADE (Reads) ---
+def month_entries(month, vendor_id=None, unbilled_only=False, newest_first=False):
+    """Live and archived entries for one month, as a single date-ordered list."""
+    start, end = month_bounds(month)
+    stmt = entry_select().where(Entry.date >= start, Entry.date < end)
+    if vendor_id is not None:
+        stmt = stmt.where(Entry.vendor_id == int(vendor_id))
+    if unbilled_only:
+        stmt = stmt.where(Entry.invoice_id.is_(None))
+    rows = entry_rows(stmt)
+
+    year = archived_months().get(month)
+    if year is not None:
+        live_ids = {e.id for e in rows}
+        rows += [e for e in _archived_entries(year, month, vendor_id, unbilled_only) if e.id not in live_ids]
+
+    rows.sort(key=lambda e: (e.date, e.id), reverse=newest_first)
+    return rows
+
+
+def _archived_entries(year, month, vendor_id, unbilled_only):
+    conn = _open(year)
+    if conn is None:
+        print(f"⚠️ Archive file missing for {month}: {archive_path(year)}")
+        return []
+    sql = SELECT_ENTRIES + " WHERE month = ?"
+    params = [month]
+    if vendor_id is not None:
+        sql += " AND vendor_id = ?"
+        params.append(int(vendor_id))
+    if unbilled_only:
+        sql += " AND invoice_id IS NULL"
+    try:
+        return [ArchivedEntry(row) for row in conn.execute(sql, params)]
+    finally:
+        conn.close()
+
+
+def cube_rows():
+    """Every archived row in the analytics cube's column order, one year file at a time."""
+    years = sorted(set(archived_months().values()))
+    for year in years:
+        conn = _open(year)
+        if conn is None:
+            continue
+        try:
+            cursor = conn.execute("""
+                SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), vendor_id, ship_to,
+                       parcels, handling_paise, railway_paise, transport_paise, total_paise, NULL
+                  FROM entry ORDER BY id
+            """)
+            yield from (tuple(row) for row in cursor)
+        finally:
+            conn.close()
+
+
+# --- FACADE (Billing) ---
+# Invoicing archived rows writes their invoice_id into the year file. The
+# write is held open on its own connection and only committed once the live
+# session commits the invoice, so a failed bill never leaves rows marked.
+def mark_invoiced(entries, invoice_id, session=None):
+    session = session or db.session
+    by_year = {}
+    for entry in entries:
+        by_year.setdefault(entry.date.year, []).append(entry.id)
+
+    pending = session.info.setdefault('archive_writes', [])
+    for year, ids in by_year.items():
+        conn = _open(year, readonly=False)
+        conn.execute("BEGIN IMMEDIATE")
+        billed = conn.executemany("UPDATE entry SET invoice_id = ? WHERE id = ? AND invoice_id IS NULL",
+                                  [(invoice_id, i) for i in ids]).rowcount
+        if billed != len(ids):
+            # Years already queued are rolled back with the session
+            conn.rollback()
+            conn.close()
+            raise ValueError(f"{len(ids) - billed} archived entries of {year} were billed by another invoice meanwhile")
+        pending.append(conn)
+
+
+@event.listens_for(Session, 'after_commit')
+def _commit_archive_writes(session):
+    for conn in session.info.pop('archive_writes', []):
+        try:
+            conn.commit()
+        except Exception as e:
+            print(f"⚠️ Archive Write Failed: {e}")
+        finally:
+            conn.close()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_archive_writes(session):
+    for conn in session.info.pop('archive_writes', []):
+        conn.rollback()
+        conn.close()
+
+
+# --- ARCHIVING (Writes) ---
+def candidate_months(before):
+    """Live months dated before `before`, with their row counts and totals."""
+    months = db.session.execute(text("""
+        SELECT substr(date, 1, 7) AS month, COUNT(*), COALESCE(SUM(total_paise), 0)
+          FROM entry
+         WHERE date < :before
+         GROUP BY month
+         ORDER BY month
+    """), {'before': before.isoformat()}).fetchall()
+    return [(month, rows, to_rupees(total)) for month, rows, total in months]
+
+
+def archive_month(month):
+    """
+    Moves one month's live rows (and their anomalies) into its year file and
+    updates the catalog. Safe to re-run: rows already archived are replaced.
+    Returns the number of rows moved.
+    """
+    year = int(month[:4])
+    _open(year, readonly=False).close()  # Make sure the file and schema exist
+    start, end = month_bounds(month)
+    params = {'start': start, 'end': end, 'month': month}
+
+    # ATTACH is not allowed inside a transaction, so use a dedicated connection
+    with db.engine.connect() as conn:
+        conn.exec_driver_sql("ATTACH DATABASE ? AS archive", (archive_path(year),))
+        conn.commit()
+        try:
+            with conn.begin():
+                moved = conn.execute(text("""
+                    INSERT OR REPLACE INTO archive.entry
+                           (id, date, month, vendor_id, vendor_name, ship_from, ship_to, rr_no, parcels,
+                            handling_paise, railway_paise, transport_paise, total_paise,
+                            created_at, updated_at, invoice_id)
+                    SELECT e.id, e.date, :month, e.vendor_id, v.name, e.ship_from, e.ship_to, e.rr_no,
+                           e.parcels, e.handling_paise, e.railway_paise, e.transport_paise, e.total_paise,
+                           e.created_at, e.updated_at, e.invoice_id
+                      FROM entry e LEFT JOIN vendor v ON v.id = e.vendor_id
+                     WHERE e.date >= :start AND e.date < :end
+                """), params).rowcount
+            with conn.begin():
+                conn.execute(text("""
+                    DELETE FROM anomaly WHERE entry_id IN
+                        (SELECT id FROM entry WHERE date >= :start AND date < :end)
+                """), params)
+                conn.execute(text("DELETE FROM entry WHERE date >= :start AND date < :end"), params)
+                conn.execute(text("""
+                    INSERT OR REPLACE INTO archived_month (month, year, row_count, total_paise, archived_at)
+                    SELECT :month, :year, COUNT(*), COALESCE(SUM(total_paise), 0), :now
+                      FROM archive.entry WHERE month = :month
+                """), {**params, 'year': year, 'now': datetime.utcnow()})
+        finally:
+            conn.rollback()
+            conn.exec_driver_sql("DETACH DATABASE archive")
+            conn.commit()
+
+    # Raw SQL skips the session hooks, so announce the change ourselves
+    versions.bump('entry', 'anomaly', 'archived_month')
+    return moved
+
+
+def run(dry_run=False, horizon=None, progress=None):
+    """Archives every live month older than the horizon. Returns [(month, rows, total)]."""
+    months = candidate_months(cutoff(horizon=horizon))
+    if dry_run:
+        return months
+
+    done = []
+    for month, rows, total in months:
+        moved = archive_month(month)
+        done.append((month, moved, total))
+        if progress:
+            progress(month, moved)
+
+    for year in sorted({int(month[:4]) for month, _, _ in done}):
+        conn = _open(year, readonly=False)
+        conn.execute("VACUUM")
+        conn.close()
+    return done
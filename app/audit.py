@@ -0,0 +1,89 @@
+from datetime import datetime, timedelta
+from sqlalchemy import text, tuple_
+from app.extensions import db
+from app.models import AuditLog
+
+# --- AUDIT SEARCH ---
+# Newest first, paged by keyset: the cursor is the (timestamp, id) of the
+# last row sent, and the next page continues strictly below it. Every page
+# is an index range scan, however deep the user scrolls:
+#   no filter      -> ix_audit_log_timestamp
+#   username       -> ix_audit_log_username_timestamp
+#   action         -> ix_audit_log_action_timestamp
+# id is the rowid, so it is already the last column of each index.
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+
+
+def encode_cursor(log):
+    return f"{log.timestamp.isoformat()}|{log.id}"
+
+
+def decode_cursor(cursor):
+    stamp, _, log_id = (cursor or '').partition('|')
+    try:
+        return datetime.fromisoformat(stamp), int(log_id)
+    except ValueError:
+        raise ValueError("Invalid cursor")
+
+
+def search(username=None, action=None, start=None, end=None, text=None, cursor=None, limit=PAGE_SIZE):
+    """
+    One page of audit records, newest first. start/end are dates (end
+    inclusive); text matches inside details. Returns (rows, next cursor or None).
+    """
+    limit = max(1, min(int(limit), MAX_PAGE_SIZE))
+    query = AuditLog.query
+    if username:
+        query = query.filter(AuditLog.username == username)
+    if action:
+        query = query.filter(AuditLog.action == action)
+    if start:
+        query = query.filter(AuditLog.timestamp >= datetime.combine(start, datetime.min.time()))
+    if end:
+        query = query.filter(AuditLog.timestamp < datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    if text:
+        query = query.filter(AuditLog.details.contains(text, autoescape=True))
+    if cursor:
+        query = query.filter(tuple_(AuditLog.timestamp, AuditLog.id) < decode_cursor(cursor))
+
+    # One extra row tells us whether another page exists
+    rows = query.order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).limit(limit + 1).all()
+    if len(rows) > limit:
+        rows = rows[:limit]
+        return rows, encode_cursor(rows[-1])
+    return rows, None
+
+
+def recent(limit=3):
+    return search(limit=limit)[0]
+
+
+# Loose index scan: each step seeks the next distinct value in the column's
+# index, so the cost grows with the number of users/actions, not of records.
+DISTINCT_SQL = """
+    WITH RECURSIVE v(value) AS (
+        SELECT MIN({column}) FROM audit_log
+        UNION ALL
+        SELECT (SELECT MIN({column}) FROM audit_log WHERE {column} > v.value) FROM v WHERE v.value IS NOT NULL
+    )
+    SELECT value FROM v WHERE value IS NOT NULL
+"""
+
+
+def facets():
+    """Usernames and actions for the filter dropdowns."""
+    return {
+        'usernames': [u for (u,) in db.session.execute(text(DISTINCT_SQL.format(column='username'))) if u],
+        'actions': [a for (a,) in db.session.execute(text(DISTINCT_SQL.format(column='action'))) if a],
+    }
+
+
+def as_dict(log):
+    return {
+        'id': log.id,
+        'timestamp': log.timestamp.isoformat() if log.timestamp else None,
+        'username': log.username,
+        'action': log.action,
+        'details': log.details,
+    }
@@ -0,0 +1,183 @@
+import click
+from flask.cli import AppGroup
+
+# --- CLI COMMANDS ---
+# Schema changes and seeding live here instead of create_app(), so worker
+# processes never touch the schema at startup. Run 'flask db init' once on
+# a new install and 'flask db upgrade' after every deploy.
+db_cli = AppGroup('db', help='Database schema and seed data.')
+
+
+@db_cli.command('upgrade')
+def upgrade_command():
+    """Apply pending schema migrations."""
+    from app import migrations
+
+    applied = migrations.upgrade()
+    for name in applied:
+        print(f" Migration: {name}")
+    print(f" System: Schema at version {migrations.current_version()}")
+
+
+@db_cli.command('init')
+def init_command():
+    """Apply migrations and create the default admin."""
+    from app import migrations
+
+    migrations.upgrade()
+    if migrations.seed_admin():
+        print(" System: Default Admin Created")
+    print(f" System: Schema at version {migrations.current_version()}")
+
+
+@db_cli.command('status')
+def status_command():
+    """Show the schema version and pending migrations."""
+    from app import migrations
+
+    print(f" Schema version: {migrations.current_version()} of {len(migrations.MIGRATIONS)}")
+    for func in migrations.pending():
+        print(f" Pending: {func.__name__}")
+
+
+anomalies_cli = AppGroup('anomalies', help='Data-quality anomaly queue.')
+
+
+@anomalies_cli.command('backfill')
+@click.option('--chunk-size', default=2000, show_default=True, help='Entries per transaction.')
+@click.option('--start-id', default=0, show_default=True, help='Resume after this entry id.')
+def anomalies_backfill_command(chunk_size, start_id):
+    """Scan existing entries once and record their anomalies."""
+    from app import anomalies
+
+    total = anomalies.backfill(chunk_size=chunk_size, start_id=start_id,
+                               progress=lambda last_id: print(f" Scanned up to entry #{last_id}"))
+    print(f" System: {total} open anomalies")
+
+
+archive_cli = AppGroup('archive', help='Move closed months out of the live ledger.')
+
+
+@archive_cli.command('run')
+@click.option('--dry-run', is_flag=True, help='Only list the months that would move.')
+@click.option('--horizon', type=int, default=None, help='Months to keep live (default ARCHIVE_HORIZON_MONTHS).')
+@click.option('--vacuum', is_flag=True, help='VACUUM the live database afterwards to return the space.')
+def archive_run_command(dry_run, horizon, vacuum):
+    """Archive every month older than the horizon."""
+    from app import archive
+    from app.extensions import db
+    from sqlalchemy import text
+
+    months = archive.run(dry_run=dry_run, horizon=horizon,
+                         progress=lambda month, rows: print(f" Archived {month}: {rows} entries"))
+    if dry_run:
+        for month, rows, total in months:
+            print(f" Would archive {month}: {rows} entries, ₹{total:,.0f}")
+    if vacuum and months and not dry_run:
+        db.session.execute(text("VACUUM"))
+    print(f" System: {len(months)} month(s) {'eligible' if dry_run else 'archived'}")
+
+
+@archive_cli.command('status')
+def archive_status_command():
+    """List archived months."""
+    from app.models import ArchivedMonth
+
+    for row in ArchivedMonth.query.order_by(ArchivedMonth.month):
+        print(f" {row.month}: {row.row_count} entries, ₹{row.grand_total:,.0f} (entries_{row.year}.db)")
+
+
+rates_cli = AppGroup('rates', help='Vendor rate history and re-pricing.')
+
+
+@rates_cli.command('reprice')
+@click.option('--vendor', 'vendor_name', required=True, help='Vendor name.')
+@click.option('--start', type=click.DateTime(formats=['%Y-%m-%d']), required=True)
+@click.option('--end', type=click.DateTime(formats=['%Y-%m-%d']), required=True)
+@click.option('--apply', is_flag=True, help='Write the new charges (default is a dry run).')
+def rates_reprice_command(vendor_name, start, end, apply):
+    """Re-price a vendor's un-invoiced entries from its rate history."""
+    from app import pricing
+    from app.models import Vendor
+
+    vendor = Vendor.query.filter_by(name=vendor_name).first()
+    if not vendor:
+        raise click.ClickException(f"Vendor not found: {vendor_name}")
+
+    result = pricing.reprice(vendor, start.date(), end.date(), dry_run=not apply)
+    for row in result['rows']:
+        print(f" {row['date']} #{row['id']}: ₹{row['old_total'] or 0:,.2f} -> ₹{row['new_total']:,.2f}")
+    print(f" System: {result['changed']} entries {'updated' if result['applied'] else 'would change'}"
+          f" (₹{result['total_delta']:+,.2f}), {result['skipped_invoiced']} invoiced left as billed")
+
+
+shards_cli = AppGroup('shards', help='Other branches read by the cross-branch reports.')
+
+
+@shards_cli.command('status')
+def shards_status_command():
+    """Check that every KPS_SHARDS database can be read."""
+    from sqlalchemy import text
+    from app import federation
+
+    def count(name, engine):
+        with engine.connect() as conn:
+            return conn.execute(text("SELECT COUNT(*), MAX(date) FROM entry")).one()
+
+    print(f" Branch: {federation.local_branch()} (this server)")
+    results, failed = federation.fan_out(count)
+    for name in federation.shard_names():
+        if name in failed:
+            print(f" {name}: UNREADABLE")
+        else:
+            rows, latest = results[name]
+            print(f" {name}: {rows} entries, latest {latest or '-'}")
+
+
+jobs_cli = AppGroup('jobs', help='Background job queue.')
+
+
+@jobs_cli.command('work')
+@click.option('--once', is_flag=True, help='Run the jobs that are due, then exit.')
+def jobs_work_command(once):
+    """Run queued jobs in the foreground (e.g. on a server started with KPS_JOB_WORKERS=0)."""
+    import time
+    from flask import current_app
+    from app import jobs
+
+    app = current_app._get_current_object()
+    while True:
+        if jobs.work_once(app):
+            continue
+        if once:
+            break
+        time.sleep(jobs.POLL_INTERVAL)
+
+
+@jobs_cli.command('list')
+def jobs_list_command():
+    """Show the latest jobs."""
+    from app import jobs
+
+    for job in jobs.recent():
+        print(f" #{job.id} {job.kind}: {job.status} {job.progress or 0}% "
+              f"(attempt {job.attempts}/{job.max_attempts}) {job.message or ''}")
+
+
+def register(app):
+    app.cli.add_command(db_cli)
+    app.cli.add_command(anomalies_cli)
+    app.cli.add_command(archive_cli)
+    app.cli.add_command(rates_cli)
+    app.cli.add_command(shards_cli)
+    app.cli.add_command(jobs_cli)
+
+    @app.cli.command('warm-templates')
+    def warm_templates_command():
+        """Compile templates ahead of time so forked workers start warm."""
+        from app import templating
+
+        count = templating.warm_templates(app)
+        print(f" System: Compiled {count} templates")
+
+    return app
@@ -0,0 +1,395 @@
+import heapq
+import threading
+import time
+from datetime import date, timedelta
+import numpy as np
+from sqlalchemy import text
+from app.extensions import db
+from app import metrics, versions
+
+# --- ANALYTICS CUBE ---
+# A column store of the ledger in NumPy arrays, one slot per entry in id
+# order. It is loaded once per worker and then kept current incrementally:
+#   * rows with a new id, or a newer updated_at, are appended / patched in place
+#   * deletions are detected by comparing row counts and masked out
+#   * archived months (app/archive.py) are read once per archive run
+# Group-by/sum queries are then vectorised bincounts over the masked arrays.
+# Charges are held as whole paise (int64, as stored); bincount sums them in
+# float64, which is exact for integers below 2**53, and results are converted
+# to rupees once at the end.
+BUCKETS = ('day', 'week', 'month', 'quarter', 'year')
+GROUPS = ('vendor', 'route')
+MEASURES = ('entries', 'parcels', 'handling_chg', 'railway_chg', 'transport_chg', 'grand_total')
+CHARGES = ('handling_chg', 'railway_chg', 'transport_chg', 'grand_total')
+
+EPOCH = date(1970, 1, 1)
+LOAD_BATCH = 50000
+
+SELECT_ROWS = """
+    SELECT id, CAST(julianday(date) - 2440587.5 AS INTEGER), vendor_id, ship_to,
+           parcels, handling_paise, railway_paise, transport_paise, total_paise, updated_at
+      FROM entry
+"""
+
+
+def to_day(value):
+    return (value - EPOCH).days
+
+
+def from_day(day):
+    return EPOCH + timedelta(days=int(day))
+
+
+class _OutOfOrder(Exception):
+    """An id below max_id that the cube has never seen; only a full reload can place it."""
+
+
+class AnalyticsCube:
+    def __init__(self):
+        self.lock = threading.RLock()
+        self.reset()
+
+    def reset(self):
+        self.size = 0
+        self.ids = np.zeros(0, dtype=np.int64)
+        self.day = np.zeros(0, dtype=np.int32)
+        self.vendor = np.zeros(0, dtype=np.int32)
+        self.route = np.zeros(0, dtype=np.int32)
+        self.alive = np.zeros(0, dtype=bool)
+        self.values = {m: np.zeros(0, dtype=np.int64) for m in ('parcels',) + CHARGES}
+        self.routes = []          # route code -> ship_to
+        self.route_codes = {}     # ship_to -> route code
+        self.vendor_names = {}
+        self.max_id = 0
+        self.synced_at = None     # newest updated_at seen, as stored by SQLite
+        self.entry_version = None
+        self.vendor_version = None
+        self.archive_version = None
+        self.archived_ids = np.zeros(0, dtype=np.int64)
+        self.loaded = False
+
+    # --- STORAGE ---
+    def _reserve(self, extra):
+        needed = self.size + extra
+        if needed <= len(self.ids):
+            return
+        capacity = max(needed, len(self.ids) * 2, 1024)
+
+        def grow(arr):
+            out = np.zeros(capacity, dtype=arr.dtype)
+            out[:self.size] = arr[:self.size]
+            return out
+
+        self.ids, self.day, self.vendor, self.route, self.alive = (
+            grow(self.ids), grow(self.day), grow(self.vendor), grow(self.route), grow(self.alive))
+        self.values = {m: grow(arr) for m, arr in self.values.items()}
+
+    def _route_code(self, name):
+        name = name or ''
+        code = self.route_codes.get(name)
+        if code is None:
+            code = self.route_codes[name] = len(self.routes)
+            self.routes.append(name)
+        return code
+
+    def _ingest(self, rows):
+        """Appends new ids and overwrites known ones. Rows arrive in id order."""
+        if not rows:
+            return
+        ids, days, vendors, routes, parcels, handling, railway, transport, totals, updated = zip(*rows)
+        ids = np.asarray(ids, dtype=np.int64)
+        columns = {
+            'day': np.asarray(days, dtype=np.int32),
+            'vendor': np.asarray(vendors, dtype=np.int32),
+            'route': np.asarray([self._route_code(r) for r in routes], dtype=np.int32),
+            'parcels': np.asarray([p or 0 for p in parcels], dtype=np.int64),
+            'handling_chg': np.asarray([v or 0 for v in handling], dtype=np.int64),
+            'railway_chg': np.asarray([v or 0 for v in railway], dtype=np.int64),
+            'transport_chg': np.asarray([v or 0 for v in transport], dtype=np.int64),
+            'grand_total': np.asarray([v or 0 for v in totals], dtype=np.int64),
+        }
+
+        known = ids <= self.max_id
+        if known.any():
+            slots = np.searchsorted(self.ids[:self.size], ids[known])
+            slots = np.minimum(slots, self.size - 1)
+            if not np.array_equal(self.ids[slots], ids[known]):
+                raise _OutOfOrder()
+            self._write(slots, columns, known)
+
+        fresh = ~known
+        count = int(fresh.sum())
+        if count:
+            self._reserve(count)
+            slots = np.arange(self.size, self.size + count)
+            self.ids[slots] = ids[fresh]
+            self.size += count
+            self._write(slots, columns, fresh)
+            self.max_id = int(self.ids[self.size - 1])
+
+        stamps = [u for u in updated if u is not None]
+        if stamps:
+            newest = max(stamps)
+            if self.synced_at is None or newest > self.synced_at:
+                self.synced_at = newest
+
+    def _write(self, slots, columns, pick):
+        self.day[slots] = columns['day'][pick]
+        self.vendor[slots] = columns['vendor'][pick]
+        self.route[slots] = columns['route'][pick]
+        self.alive[slots] = True
+        for m in self.values:
+            self.values[m][slots] = columns[m][pick]
+
+    # --- SYNC ---
+    def _versions(self):
+        """(entry, vendor, archive) versions; the cube re-reads whatever moved."""
+        return versions.get('entry'), versions.get('vendor'), versions.get('archived_month')
+
+    def _archived_rows(self):
+        from app import archive
+
+        return archive.cube_rows()
+
+    def refresh(self, session=None):
+        """Brings the cube up to date with the entry table. Cheap when nothing changed."""
+        session = session or db.session
+        with self.lock:
+            entry_version, vendor_version, archive_version = self._versions()
+            changed = self._sync_entries(session, entry_version, archive_version)
+
+            # After the rows: a full load resets the cube, names included
+            if vendor_version != self.vendor_version:
+                self.vendor_names = dict(session.execute(text("SELECT id, name FROM vendor")).fetchall())
+                self.vendor_version = vendor_version
+            return changed
+
+    def _sync_entries(self, session, entry_version, archive_version):
+        if self.loaded and entry_version == self.entry_version and archive_version == self.archive_version:
+            return False
+
+        started = time.perf_counter()
+        try:
+            if self.loaded and archive_version == self.archive_version:
+                self._load_changes(session)
+            else:
+                self._load_all(session)
+        except _OutOfOrder:
+            self._load_all(session)
+        self.entry_version = entry_version
+        self.archive_version = archive_version
+        self.loaded = True
+        metrics.observe('cube.refresh', time.perf_counter() - started)
+        return True
+
+    def _load_all(self, session):
+        self.reset()
+        archived = list(self._archived_rows())
+        self.archived_ids = np.asarray(sorted(row[0] for row in archived), dtype=np.int64)
+        archived.sort(key=lambda row: row[0])
+
+        # Both tiers in one id-ordered stream, as _ingest expects
+        live = session.execute(text(SELECT_ROWS + " ORDER BY id"))
+        stream = heapq.merge(live, archived, key=lambda row: row[0])
+        batch = []
+        previous = None
+        for row in stream:
+            if row[0] == previous:
+                continue  # Left in both tiers by an interrupted archive run
+            previous = row[0]
+            batch.append(row)
+            if len(batch) == LOAD_BATCH:
+                self._ingest(batch)
+                batch = []
+        self._ingest(batch)
+
+    def _load_changes(self, session):
+        # Two range reads (new ids, then edited rows) rather than one 'id > x OR
+        # updated_at >= y', which SQLite answers with a scan of the whole table
+        rows = session.execute(text(SELECT_ROWS + " WHERE id > :max_id ORDER BY id"),
+                               {'max_id': self.max_id}).fetchall()
+        # '>=' re-reads rows stamped in the same instant; applying them twice is harmless.
+        # Without a stamp yet (rows loaded before updated_at was filled) any stamped row may be an edit
+        if self.synced_at is not None:
+            edited = session.execute(text(SELECT_ROWS + " WHERE updated_at >= :synced_at AND id <= :max_id"),
+                                     {'synced_at': self.synced_at, 'max_id': self.max_id}).fetchall()
+        else:
+            edited = session.execute(text(SELECT_ROWS + " WHERE updated_at IS NOT NULL AND id <= :max_id"),
+                                     {'max_id': self.max_id}).fetchall()
+        rows = sorted(edited, key=lambda row: row[0]) + rows
+        self._ingest(rows)
+
+        live = session.execute(text("SELECT COUNT(*) FROM entry")).scalar()
+        if live + len(self.archived_ids) != int(self.alive[:self.size].sum()):
+            present = np.fromiter((row[0] for row in session.execute(text("SELECT id FROM entry"))), dtype=np.int64)
+            present = np.concatenate([present, self.archived_ids])
+            self.alive[:self.size] &= np.isin(self.ids[:self.size], present)
+
+    # --- QUERY ---
+    def span(self):
+        """(first, last) date that has entries, or None for an empty cube."""
+        with self.lock:
+            days = self.day[:self.size][self.alive[:self.size]]
+            if not len(days):
+                return None
+            return from_day(days.min()), from_day(days.max())
+
+    def vendor_id(self, name):
+        """This cube's id for a vendor name (ids differ between branch databases)."""
+        return next((vid for vid, vname in self.vendor_names.items() if vname == name), None)
+
+    def query(self, start=None, end=None, bucket='month', group=None, vendor_id=None,
+              route=None, measures=MEASURES, top=None, order_by='grand_total'):
+        """
+        Sums the measures per bucket (and per vendor/route when grouped) for
+        entries dated start..end inclusive. Empty buckets are filled with zeros.
+        """
+        if bucket not in BUCKETS:
+            raise ValueError(f"bucket must be one of {', '.join(BUCKETS)}")
+        if group not in (None,) + GROUPS:
+            raise ValueError(f"group must be one of {', '.join(GROUPS)}")
+
+        started = time.perf_counter()
+        with self.lock:
+            n = self.size
+            mask = self.alive[:n].copy()
+            days = self.day[:n]
+            if start is not None:
+                mask &= days >= to_day(start)
+            if end is not None:
+                mask &= days <= to_day(end)
+            if vendor_id is not None:
+                mask &= self.vendor[:n] == int(vendor_id)
+            if route is not None:
+                code = self.route_codes.get(route)
+                mask &= (self.route[:n] == code) if code is not None else False
+
+            picked_days = days[mask]
+            cols = {m: self.values[m][:n][mask] for m in measures if m != 'entries'}
+            if group == 'vendor':
+                group_codes = self.vendor[:n][mask]
+            elif group == 'route':
+                group_codes = self.route[:n][mask]
+            else:
+                group_codes = np.zeros(len(picked_days), dtype=np.int32)
+            routes = list(self.routes)
+            vendor_names = dict(self.vendor_names)
+
+        # Bucket keys for every day in range, so empty periods still show up
+        first = to_day(start) if start is not None else (int(picked_days.min()) if len(picked_days) else to_day(date.today()))
+        last = to_day(end) if end is not None else (int(picked_days.max()) if len(picked_days) else first)
+        span_keys = bucket_keys(np.arange(first, last + 1, dtype=np.int32), bucket)
+        key_min, key_max = int(span_keys[0]), int(span_keys[-1])
+        n_buckets = key_max - key_min + 1
+        bucket_index = bucket_keys(picked_days, bucket) - key_min
+
+        uniq, group_index = np.unique(group_codes, return_inverse=True)
+        flat = group_index.astype(np.int64) * n_buckets + bucket_index
+        size = len(uniq) * n_buckets
+
+        grids = {}
+        for m in measures:
+            weights = None if m == 'entries' else cols[m]
+            grids[m] = np.bincount(flat, weights=weights, minlength=size).reshape(len(uniq), n_buckets)
+        # Charges turn from paise into rupees only after summing
+        scale = {m: 100 if m in CHARGES else 1 for m in measures}
+
+        groups = []
+        for i, code in enumerate(uniq.tolist()):
+            if group == 'vendor':
+                label = vendor_names.get(code, f"Vendor #{code}")
+            elif group == 'route':
+                label = routes[code]
+            else:
+                label = 'All'
+            groups.append({
+                'key': code if group == 'vendor' else label,
+                'label': label,
+                'totals': {m: _number(grids[m][i].sum() / scale[m], m) for m in measures},
+                'series': {m: [_number(v / scale[m], m) for v in grids[m][i]] for m in measures},
+            })
+
+        if group and order_by in measures:
+            groups.sort(key=lambda g: g['totals'][order_by], reverse=True)
+        if top:
+            groups = groups[:top]
+
+        result = {
+            'bucket': bucket,
+            'group': group,
+            'start': from_day(first).isoformat(),
+            'end': from_day(last).isoformat(),
+            'labels': [bucket_label(k, bucket) for k in range(key_min, key_max + 1)],
+            'groups': groups,
+            'totals': {m: _number(grids[m].sum() / scale[m], m) for m in measures},
+        }
+        metrics.observe('cube.query', time.perf_counter() - started)
+        return result
+
+
+class ShardCube(AnalyticsCube):
+    """
+    Cube over another branch's database (app/federation.py). That server
+    bumps no version counters here, so any change to its file triggers a
+    sync, and its archive tier lives on its own disk, out of reach.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        super().__init__()
+
+    def _versions(self):
+        stamp = versions.file_stamp(self.path)
+        return stamp, stamp, None
+
+    def _archived_rows(self):
+        return []
+
+
+# --- BUCKETING ---
+def bucket_keys(days, bucket):
+    """Maps day numbers (since 1970-01-01) to consecutive integer bucket keys."""
+    days = np.asarray(days, dtype=np.int64)
+    if bucket == 'day':
+        return days
+    if bucket == 'week':
+        return (days + 3) // 7  # 1970-01-01 was a Thursday; weeks start on Monday
+    months = days.astype('datetime64[D]').astype('datetime64[M]').astype(np.int64)
+    if bucket == 'month':
+        return months
+    if bucket == 'quarter':
+        return months // 3
+    return months // 12
+
+
+def bucket_label(key, bucket):
+    if bucket == 'day':
+        return from_day(key).isoformat()
+    if bucket == 'week':
+        return from_day(key * 7 - 3).isoformat()
+    if bucket == 'month':
+        return f"{1970 + key // 12}-{key % 12 + 1:02d}"
+    if bucket == 'quarter':
+        return f"{1970 + key // 4}-Q{key % 4 + 1}"
+    return str(1970 + key)
+
+
+def _number(value, measure):
+    if measure in ('entries', 'parcels'):
+        return int(value)
+    return round(float(value), 2)
+
+
+# --- PER-PROCESS INSTANCE ---
+_cube = None
+_cube_lock = threading.Lock()
+
+
+def get_cube():
+    """Returns this worker's cube, refreshed against the current ledger."""
+    global _cube
+    with _cube_lock:
+        if _cube is None:
+            _cube = AnalyticsCube()
+    _cube.refresh()
+    return _cube
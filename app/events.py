@@ -0,0 +1,202 @@
+import atexit
+import json
+import os
+import queue
+import socket
+import threading
+from datetime import date
+from sqlalchemy import func
+from app.extensions import db
+from app.money import add
+from app import versions
+
+# --- EVENT BUS ---
+# Entry writes are published here after they commit and handed to every open
+# /api/stream connection. Each connection reads from its own bounded queue, so
+# a stalled browser can only lose its own events: when its queue overflows
+# it is emptied and the client is told to 'resync' (reload its totals).
+#
+# Workers are separate processes, so each one that has open streams binds a
+# unix datagram socket in EVENT_SOCKET_DIR. Publishing delivers locally and
+# then sends one datagram to every other worker's socket.
+QUEUE_SIZE = 100
+MAX_DATAGRAM = 8192
+
+_lock = threading.Lock()
+_subscribers = set()
+_socket_dir = None
+_max_streams = None
+_listener = {'pid': None, 'sock': None, 'path': None}
+
+
+def init_app(app):
+    global _socket_dir, _max_streams
+    _socket_dir = app.config.get('EVENT_SOCKET_DIR')
+    _max_streams = app.config.get('EVENT_MAX_STREAMS')
+    if _socket_dir:
+        os.makedirs(_socket_dir, exist_ok=True)
+
+
+class Subscriber:
+    def __init__(self):
+        self.queue = queue.Queue(maxsize=QUEUE_SIZE)
+
+    def offer(self, event):
+        try:
+            self.queue.put_nowait(event)
+        except queue.Full:
+            while True:
+                try:
+                    self.queue.get_nowait()
+                except queue.Empty:
+                    break
+            self.queue.put_nowait({'type': 'resync'})
+
+
+def subscribe():
+    """Registers a stream. Returns None when this worker already serves EVENT_MAX_STREAMS."""
+    with _lock:
+        if _max_streams and len(_subscribers) >= _max_streams:
+            return None
+        _ensure_listener()
+        subscriber = Subscriber()
+        _subscribers.add(subscriber)
+        return subscriber
+
+
+def unsubscribe(subscriber):
+    with _lock:
+        _subscribers.discard(subscriber)
+
+
+def _dispatch(event):
+    with _lock:
+        for subscriber in _subscribers:
+            subscriber.offer(event)
+
+
+def publish(event):
+    """Delivers an event to every stream in every worker. Call after the commit."""
+    _dispatch(event)
+    if not _socket_dir:
+        return
+
+    data = json.dumps(event).encode()
+    own = _listener['path'] if _listener['pid'] == os.getpid() else None
+    sender = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    sender.setblocking(False)
+    try:
+        for name in os.listdir(_socket_dir):
+            path = os.path.join(_socket_dir, name)
+            if not name.endswith('.sock') or path == own:
+                continue
+            try:
+                sender.sendto(data, path)
+            except (ConnectionRefusedError, FileNotFoundError):
+                # Left behind by a worker that has exited
+                try:
+                    os.unlink(path)
+                except OSError:
+                    pass
+            except BlockingIOError:
+                pass  # That worker's buffer is full; its streams will resync on reconnect
+    finally:
+        sender.close()
+
+
+# --- CROSS-WORKER FAN-OUT ---
+# Bound lazily on the first subscription, so the preloading master and
+# workers without streams never receive anything.
+def _ensure_listener():
+    pid = os.getpid()
+    if not _socket_dir or _listener['pid'] == pid:
+        return
+    path = os.path.join(_socket_dir, f"{pid}.sock")
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_DGRAM)
+    try:
+        sock.bind(path)
+    except OSError as e:
+        print(f"⚠️ Event Fan-out Disabled: {e}")
+        sock.close()
+        _listener.update(pid=pid, sock=None, path=None)
+        return
+    _listener.update(pid=pid, sock=sock, path=path)
+    threading.Thread(target=_listen, args=(sock,), name='event-fanout', daemon=True).start()
+
+
+def _listen(sock):
+    while True:
+        try:
+            data = sock.recv(MAX_DATAGRAM)
+            event = json.loads(data)
+        except ValueError:
+            continue
+        except OSError:
+            return
+        _dispatch(event)
+
+
+@atexit.register
+def _remove_socket():
+    if _listener['pid'] == os.getpid() and _listener['path']:
+        try:
+            os.unlink(_listener['path'])
+        except OSError:
+            pass
+
+
+# --- ENTRY EVENTS ---
+def snapshot(entry):
+    """The fields a live counter needs from an entry, before or after a change."""
+    return {
+        'date': entry.date.strftime('%Y-%m-%d'),
+        'vendor_id': entry.vendor_id,
+        'grand_total': entry.grand_total or 0.0,
+        'parcels': entry.parcels or 0,
+    }
+
+
+def entry_event(kind, entry_id, before=None, after=None):
+    """
+    kind is 'created', 'updated' or 'deleted'. Carries both snapshots so pages
+    can apply their own filters, plus the change to today's dashboard counters.
+    """
+    today = date.today().isoformat()
+    delta = {'revenue': 0.0, 'parcels': 0, 'entries': 0}
+    for snap, sign in ((before, -1), (after, 1)):
+        if snap and snap['date'] == today:
+            delta['revenue'] = add(delta['revenue'], sign * snap['grand_total'])
+            delta['parcels'] += sign * snap['parcels']
+            delta['entries'] += sign
+    return {'type': f"entry.{kind}", 'id': entry_id, 'before': before, 'after': after, 'today': delta}
+
+
+# --- TODAY'S COUNTERS ---
+# Cached per worker until the entry table version moves, so page loads and
+# new streams share one indexed SUM instead of each loading today's rows.
+_totals = {'key': None, 'value': None}
+
+
+def today_totals():
+    from app.models import Entry
+
+    today = date.today()
+    key = (today, versions.get('entry'))
+    with _lock:
+        if _totals['key'] == key:
+            return _totals['value']
+
+    count, revenue, parcels = db.session.query(
+        func.count(Entry.id),
+        func.coalesce(func.sum(Entry.grand_total), 0.0),
+        func.coalesce(func.sum(Entry.parcels), 0),
+    ).filter(Entry.date == today).one()
+    value = {'date': today.isoformat(), 'entries': count, 'revenue': float(revenue), 'parcels': int(parcels)}
+
+    with _lock:
+        _totals.update(key=key, value=value)
+    return value
@@ -1,6 +1,39 @@
+import sqlite3
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
 
 db = SQLAlchemy()
 login_manager = LoginManager()
-login_manager.login_view = 'auth.login'
\ No newline at end of file
+login_manager.login_view = 'auth.login'
+
+# --- SQLITE TUNING (Multi-worker) ---
+# WAL lets every worker keep reading while one of them writes, and the busy
+# timeout makes a second writer wait for the lock instead of failing with
+# "database is locked". synchronous=NORMAL is safe under WAL and saves an
+# fsync per commit.
+SQLITE_BUSY_TIMEOUT_MS = 15000
+
+
+@event.listens_for(Engine, 'connect')
+def _sqlite_pragmas(dbapi_connection, connection_record):
+    if not isinstance(dbapi_connection, sqlite3.Connection):
+        return
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute(f"PRAGMA busy_timeout={SQLITE_BUSY_TIMEOUT_MS}")
+    cursor.close()
+
+
+# --- EXPLICIT TRANSACTIONS ---
+# pysqlite only opens a transaction by itself in front of INSERT/UPDATE/DELETE.
+# A SAVEPOINT issued before any of those (session.begin_nested() as the first
+# write) runs outside a transaction, and its RELEASE commits on the spot.
+def begin_write(session):
+    """Opens the write transaction now, so later savepoints nest inside it until commit/rollback."""
+    dbapi_connection = session.connection().connection.dbapi_connection
+    if isinstance(dbapi_connection, sqlite3.Connection) and not dbapi_connection.in_transaction:
+        # IMMEDIATE takes the write lock up front instead of failing to upgrade a read lock midway
+        session.connection().exec_driver_sql("BEGIN IMMEDIATE")
@@ -0,0 +1,287 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import current_app
+from sqlalchemy import bindparam, text
+from sqlalchemy.exc import IntegrityError
+from app.extensions import db
+from app import archive, metrics, versions
+
+# --- BRANCH SHARDS ---
+# Every branch server writes only to its own instance/logistics.db. The
+# databases of the other branches are registered as SQLAlchemy binds named
+# 'shard_<branch>' (KPS_SHARDS) and used by the reports that span branches:
+# the ledger view, billing and analytics. Reads fan out over a small thread
+# pool and are merged by vendor and route *name*, because every branch
+# numbers its own vendors.
+#
+# A shard that cannot be read is left out of the page and reported in the
+# log, so one branch going offline never takes the others' reports down.
+BIND_PREFIX = 'shard_'
+FANOUT_THREADS = 4
+SHARD_TIMEOUT = 30
+
+_pool = None
+_pool_lock = threading.Lock()
+_cubes = {}
+
+
+def parse_shards(spec):
+    """'pune=/srv/pune/logistics.db,goa=/mnt/goa/logistics.db' -> {'pune': path, 'goa': path}"""
+    shards = {}
+    for part in (spec or '').split(','):
+        if not part.strip():
+            continue
+        name, sep, path = part.partition('=')
+        if not sep or not name.strip() or not path.strip():
+            print(f"⚠️ Ignoring Shard Spec: {part!r} (expected name=path)")
+            continue
+        shards[name.strip()] = path.strip()
+    return shards
+
+
+def configure(app, spec):
+    """Registers one bind per shard. Must run before db.init_app()."""
+    shards = parse_shards(spec)
+    shards.pop(app.config['BRANCH'], None)  # Our own database is the default bind
+    app.config['SHARDS'] = shards
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    for name, path in shards.items():
+        binds[BIND_PREFIX + name] = f'sqlite:///{path}'
+    app.config['SQLALCHEMY_BINDS'] = binds
+
+
+def local_branch():
+    return current_app.config['BRANCH']
+
+
+def shard_names():
+    return sorted(current_app.config.get('SHARDS', {}))
+
+
+def branch_names():
+    """This branch first, then the shards."""
+    return [local_branch()] + shard_names()
+
+
+def stamp():
+    """Changes whenever any shard's file does; part of the cache key of federated pages."""
+    shards = current_app.config.get('SHARDS', {})
+    return tuple((name, versions.file_stamp(shards[name])) for name in sorted(shards))
+
+
+# --- FAN-OUT ---
+def _executor():
+    # Created on first use, so a preloading gunicorn master starts no threads
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ThreadPoolExecutor(max_workers=FANOUT_THREADS, thread_name_prefix='shard')
+        return _pool
+
+
+def fan_out(func, names=None):
+    """
+    Runs func(name, engine) for every shard (or the given names) in parallel.
+    Returns ({name: result}, [names that failed]).
+    """
+    names = shard_names() if names is None else names
+    # Engines are looked up here: the pool threads have no app context
+    engines = {name: db.engines[BIND_PREFIX + name] for name in names}
+    futures = {name: _executor().submit(func, name, engine) for name, engine in engines.items()}
+
+    results, failed = {}, []
+    for name, future in futures.items():
+        try:
+            results[name] = future.result(timeout=SHARD_TIMEOUT)
+        except Exception as e:
+            print(f"⚠️ Shard Unavailable ({name}): {e}")
+            metrics.incr(f'federation.error.{name}')
+            failed.append(name)
+    return results, failed
+
+
+# --- LEDGER (Reads) ---
+class ShardEntry(archive.ArchivedEntry):
+    """Read-only row from another branch; edits happen on that branch's server."""
+    __slots__ = ('branch',)
+
+    def __init__(self, row, branch):
+        super().__init__(row)
+        self.branch = branch
+
+
+SHARD_MONTH_SQL = """
+    SELECT e.id, e.date, e.vendor_id, v.name AS vendor_name, e.ship_from, e.ship_to, e.rr_no,
+           e.parcels, e.handling_paise / 100.0, e.railway_paise / 100.0, e.transport_paise / 100.0,
+           e.total_paise / 100.0, e.invoice_id
+      FROM entry e JOIN vendor v ON v.id = e.vendor_id
+     WHERE e.date >= :start AND e.date < :end
+"""
+
+
+def month_entries(month, vendor_id=None, unbilled_only=False, newest_first=False, branch=None):
+    """
+    archive.month_entries() across branches. vendor_id is this branch's id
+    and is matched by name elsewhere; branch narrows to one branch.
+    """
+    names = [n for n in shard_names() if branch in (None, n)]
+    rows = []
+    if branch in (None, local_branch()):
+        rows = archive.month_entries(month, vendor_id, unbilled_only)
+    if names:
+        rows += _shard_month_entries(names, month, vendor_id, unbilled_only)
+    if unbilled_only and rows and shard_names():
+        billed = billed_elsewhere(rows)
+        rows = [e for e in rows if (e.branch or local_branch(), e.id) not in billed]
+
+    # Ids repeat between branches, so the branch breaks ties
+    rows.sort(key=lambda e: (e.date, e.branch or '', e.id), reverse=newest_first)
+    return rows
+
+
+def _shard_month_entries(names, month, vendor_id, unbilled_only):
+    sql = SHARD_MONTH_SQL
+    start, end = archive.month_bounds(month)
+    params = {'start': start, 'end': end}
+    if vendor_id is not None:
+        from app.models import Vendor
+
+        vendor = db.session.get(Vendor, int(vendor_id))
+        if vendor is None:
+            return []
+        sql += " AND v.name = :vendor_name"
+        params['vendor_name'] = vendor.name
+    if unbilled_only:
+        sql += " AND e.invoice_id IS NULL"
+
+    def read(name, engine):
+        with engine.connect() as conn:
+            return [ShardEntry(row, name) for row in conn.execute(text(sql), params)]
+
+    results, _ = fan_out(read, names)
+    rows = []
+    for name in names:
+        rows += results.get(name, [])
+    return rows
+
+
+# --- BILLING ---
+# Billing another branch's entries records them in our branch_billing table
+# (BranchBilling), in the invoice's own transaction. Their rows in that
+# branch's database are not touched: its invoice_id column refers to its own
+# invoices. "Unbilled" therefore means no invoice_id in the entry's own
+# database and no branch_billing record in any branch's database.
+BILLED_SQL = text("SELECT branch, entry_id FROM branch_billing WHERE branch = :branch AND entry_id IN :ids") \
+    .bindparams(bindparam('ids', expanding=True))
+
+
+def billed_elsewhere(entries):
+    """{(branch, entry id)} of the given rows that some branch has billed through branch_billing."""
+    by_branch = {}
+    for entry in entries:
+        by_branch.setdefault(entry.branch or local_branch(), []).append(entry.id)
+
+    def read(conn):
+        found = set()
+        for name, ids in by_branch.items():
+            found.update((row[0], row[1]) for row in conn.execute(BILLED_SQL, {'branch': name, 'ids': ids}))
+        return found
+
+    def read_shard(name, engine):
+        with engine.connect() as conn:
+            return read(conn)
+
+    billed = read(db.session.connection())
+    results, _ = fan_out(read_shard)
+    for found in results.values():
+        billed |= found
+    return billed
+
+
+def mark_invoiced(entries, invoice, session=None):
+    """Records other branches' entries as billed on our invoice. The caller commits."""
+    from app.models import BranchBilling
+
+    session = session or db.session
+    session.add_all(BranchBilling(branch=entry.branch, entry_id=entry.id, invoice_id=invoice.id,
+                                  invoice_no=invoice.invoice_no) for entry in entries)
+    try:
+        session.flush()
+    except IntegrityError:
+        raise ValueError("Some entries from other branches were billed meanwhile, generate the bill again")
+
+
+# --- ANALYTICS ---
+def _shard_cube(name, engine):
+    from app.cube import ShardCube
+
+    cube = _cubes.get(name)
+    if cube is None:
+        cube = _cubes.setdefault(name, ShardCube(engine.url.database))
+    with engine.connect() as conn:
+        cube.refresh(conn)
+    return cube
+
+
+def cube_query(start=None, end=None, vendor_id=None, top=None, order_by='grand_total', **kwargs):
+    """
+    AnalyticsCube.query() over every branch. vendor_id is this branch's id;
+    groups are merged by label (vendor / route name).
+    """
+    from app.cube import get_cube
+
+    local = get_cube()
+    if not shard_names():
+        return local.query(start, end, vendor_id=vendor_id, top=top, order_by=order_by, **kwargs)
+
+    shard_cubes, _ = fan_out(_shard_cube)
+    cubes = [local] + [shard_cubes[name] for name in sorted(shard_cubes)]
+
+    # Open-ended ranges take the span of all branches, so every result has the same labels
+    if start is None or end is None:
+        spans = [span for span in (c.span() for c in cubes) if span]
+        if spans:
+            start = start or min(s[0] for s in spans)
+            end = end or max(s[1] for s in spans)
+
+    vendor_name = local.vendor_names.get(int(vendor_id)) if vendor_id is not None else None
+    results = []
+    for cube in cubes:
+        cube_vendor = vendor_id if cube is local else (cube.vendor_id(vendor_name) if vendor_name else None)
+        if vendor_id is not None and cube_vendor is None:
+            continue  # That branch doesn't serve this vendor
+        results.append(cube.query(start, end, vendor_id=cube_vendor, **kwargs))
+    return _merge(results, local, top, order_by)
+
+
+def _merge(results, local, top, order_by):
+    from app.cube import _number
+
+    merged = dict(results[0], groups=[])
+    group = merged['group']
+    by_label = {}
+    for result in results:
+        for g in result['groups']:
+            into = by_label.get(g['label'])
+            if into is None:
+                key = local.vendor_id(g['label']) if group == 'vendor' else g['key']
+                by_label[g['label']] = {'key': key, 'label': g['label'], 'totals': dict(g['totals']),
+                                        'series': {m: list(s) for m, s in g['series'].items()}}
+                continue
+            for m, value in g['totals'].items():
+                into['totals'][m] += value
+            for m, series in g['series'].items():
+                into['series'][m] = [a + b for a, b in zip(into['series'][m], series)]
+
+    groups = list(by_label.values())
+    for g in groups:
+        g['totals'] = {m: _number(v, m) for m, v in g['totals'].items()}
+        g['series'] = {m: [_number(v, m) for v in s] for m, s in g['series'].items()}
+    if group and groups and order_by in groups[0]['totals']:
+        groups.sort(key=lambda g: g['totals'][order_by], reverse=True)
+    if top:
+        groups = groups[:top]
+
+    merged['groups'] = groups
+    merged['totals'] = {m: _number(sum(r['totals'][m] for r in results), m) for m in merged['totals']}
+    return merged
@@ -0,0 +1,106 @@
+import json
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.dialects.sqlite import insert
+from app.extensions import db
+from app.models import Entry, Invoice, InvoiceSequence
+from app.money import add, to_paise
+
+
+# --- INVOICE NUMBERING ---
+def allocate_invoice_no(month):
+    """
+    Returns the next number for the billing month, e.g. INV-202310-0007.
+    Must run inside the transaction that stores the invoice: the UPDATE takes
+    SQLite's write lock, so two workers can never receive the same value.
+    """
+    period = month.replace('-', '')
+    db.session.execute(
+        insert(InvoiceSequence).values(period=period, last_value=0).on_conflict_do_nothing()
+    )
+    value = db.session.execute(
+        update(InvoiceSequence)
+        .where(InvoiceSequence.period == period)
+        .values(last_value=InvoiceSequence.last_value + 1)
+        .returning(InvoiceSequence.last_value)
+    ).scalar_one()
+    return f"INV-{period}-{value:04d}"
+
+
+def amount_in_words(amount):
+    """'one thousand, two hundred and five Rupees and fifty Paise Only', worked out from whole paise."""
+    from num2words import num2words  # Loaded on first invoice, not at startup
+
+    paise = to_paise(amount or 0)
+    rupees, rest = divmod(abs(paise), 100)
+    try:
+        words = num2words(rupees, lang='en_IN') + " Rupees"
+        if rest:
+            words += f" and {num2words(rest, lang='en_IN')} Paise"
+    except Exception:
+        return f"{paise / 100:.2f} Rupees Only"
+    return ("minus " if paise < 0 else "") + words + " Only"
+
+
+# --- SNAPSHOT ---
+def create_invoice(vendor, month, entries, include_pending, user):
+    """
+    Freezes the given entries into a new Invoice and marks them as billed.
+    Entries may come from either tier or another branch (app.federation.month_entries).
+    The caller reads them after begin_write() and commits. Raises ValueError,
+    leaving the caller to roll back, if another bill took any of them first.
+    """
+    items = [{
+        'date': e.date.strftime('%Y-%m-%d'),
+        'rr_no': e.rr_no,
+        'ship_to': e.ship_to,
+        'parcels': e.parcels or 0,
+        'handling_chg': e.handling_chg or 0.0,
+        'railway_chg': e.railway_chg or 0.0,
+        'transport_chg': e.transport_chg or 0.0,
+        'grand_total': e.grand_total or 0.0,
+    } for e in entries]
+
+    # Summed in paise: entries can come from several tiers and branches, so there is no one table to SUM()
+    current_bill_total = add(*(item['grand_total'] for item in items))
+    pending_amount = (vendor.pending_balance or 0.0) if include_pending else 0.0
+    grand_total = add(current_bill_total, pending_amount)
+
+    invoice = Invoice(
+        invoice_no=allocate_invoice_no(month),
+        vendor_id=vendor.id,
+        month=month,
+        created_at=datetime.utcnow(),
+        created_by=getattr(user, 'username', 'System'),
+        bill_to_name=vendor.billing_name or vendor.name,
+        bill_to_address=vendor.billing_address or "Manipal / Udupi",
+        show_rr=vendor.show_rr,
+        show_handling=vendor.show_handling,
+        show_railway=vendor.show_railway,
+        show_transport=vendor.show_transport,
+        items=json.dumps(items),
+        total_parcels=sum(item['parcels'] for item in items),
+        current_bill_total=current_bill_total,
+        pending_amount=pending_amount,
+        grand_total=grand_total,
+        total_words=amount_in_words(grand_total),
+    )
+    db.session.add(invoice)
+    db.session.flush()
+
+    live_ids = [e.id for e in entries if not e.archived]
+    if live_ids:
+        billed = Entry.query.filter(Entry.id.in_(live_ids), Entry.invoice_id.is_(None)).update(
+            {Entry.invoice_id: invoice.id}, synchronize_session=False
+        )
+        if billed != len(live_ids):
+            raise ValueError(f"{len(live_ids) - billed} of these entries were billed by another invoice meanwhile")
+    archived = [e for e in entries if e.archived and not getattr(e, 'branch', None)]
+    if archived:
+        from app.archive import mark_invoiced
+        mark_invoiced(archived, invoice.id)
+    remote = [e for e in entries if getattr(e, 'branch', None)]
+    if remote:
+        from app.federation import mark_invoiced as mark_remote_invoiced
+        mark_remote_invoiced(remote, invoice)
+    return invoice
@@ -0,0 +1,329 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import select
+from app.extensions import db
+from app.models import Job
+from app import metrics
+
+# --- BACKGROUND JOBS ---
+# Slow admin work (VACUUM, backups, log cleanup) is queued in the 'job' table
+# and run by JOB_WORKERS threads per process, so the request that asks for it
+# returns at once and a worker is never tied up for minutes. Threads start on
+# the first request a process serves (or with 'flask jobs work'); queued rows
+# survive restarts.
+#
+# Claiming is one UPDATE ... WHERE status = 'queued', so a job runs in exactly
+# one thread even with several gunicorn workers. Running jobs heartbeat every
+# HEARTBEAT seconds; a job whose heartbeat is STALE_AFTER seconds old lost its
+# worker and is queued again. A failed attempt is retried after
+# RETRY_BACKOFF * 2^(attempt - 1) seconds, up to the job's max_attempts.
+POLL_INTERVAL = 2
+HEARTBEAT = 30
+STALE_AFTER = 5 * HEARTBEAT
+RETRY_BACKOFF = 10
+FINISHED = ('done', 'failed', 'cancelled')
+
+HANDLERS = {}
+_table = Job.__table__  # Core statements: queue bookkeeping bumps no cache versions
+_workers = {'pid': None, 'app': None}
+_workers_lock = threading.Lock()
+_wakeup = threading.Event()
+_running = set()
+
+
+class Cancelled(Exception):
+    pass
+
+
+def handler(kind):
+    def decorator(func):
+        HANDLERS[kind] = func
+        return func
+    return decorator
+
+
+class JobContext:
+    """What a handler gets: its params, the requesting user and progress()."""
+
+    def __init__(self, job):
+        self.id = job.id
+        self.params = json.loads(job.params or '{}')
+        self.username = job.created_by or 'System'  # Lets AuditLog.log() attribute the work
+
+    def progress(self, percent, message=None):
+        """Stores progress; raises Cancelled once an admin has asked the job to stop."""
+        values = {'progress': max(0, min(100, int(percent))), 'heartbeat_at': datetime.utcnow()}
+        if message is not None:
+            values['message'] = message[:255]
+        cancel = db.session.execute(
+            _table.update().where(_table.c.id == self.id).values(**values).returning(_table.c.cancel_requested)
+        ).scalar()
+        db.session.commit()
+        if cancel:
+            raise Cancelled()
+
+
+# --- QUEUE ---
+def enqueue(kind, params=None, user=None, max_attempts=3, unique=True):
+    """
+    Queues a job and returns it. With unique, a job of the same kind that is
+    still queued or running is returned instead of adding a second one.
+    """
+    if kind not in HANDLERS:
+        raise ValueError(f"Unknown job: {kind}")
+    if unique:
+        existing = Job.query.filter(Job.kind == kind, Job.status.in_(('queued', 'running'))).first()
+        if existing:
+            return existing
+
+    job = Job(kind=kind, params=json.dumps(params or {}), created_by=getattr(user, 'username', 'System'),
+              max_attempts=max_attempts)
+    db.session.add(job)
+    db.session.commit()
+    metrics.incr(f'jobs.queued.{kind}')
+    ensure_workers()
+    _wakeup.set()
+    return job
+
+
+def cancel(job):
+    """A queued job is dropped at once; a running one stops at its next progress()."""
+    if job.status == 'queued':
+        job.status, job.finished_at, job.message = 'cancelled', datetime.utcnow(), 'Cancelled before it started'
+    elif job.status == 'running':
+        job.cancel_requested = True
+    db.session.commit()
+    return job
+
+
+def recent(limit=20):
+    return Job.query.order_by(Job.id.desc()).limit(limit).all()
+
+
+def as_dict(job):
+    return {
+        'id': job.id,
+        'kind': job.kind,
+        'status': job.status,
+        'progress': job.progress or 0,
+        'message': job.message,
+        'result': json.loads(job.result) if job.result else None,
+        'attempts': job.attempts,
+        'max_attempts': job.max_attempts,
+        'cancel_requested': bool(job.cancel_requested),
+        'created_by': job.created_by,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+
+def _claim():
+    now = datetime.utcnow()
+    # Jobs whose worker died mid-run go back to the queue (or fail, if out of attempts)
+    stale = (_table.c.status == 'running') & (_table.c.heartbeat_at < now - timedelta(seconds=STALE_AFTER))
+    db.session.execute(_table.update().where(stale, _table.c.attempts < _table.c.max_attempts)
+                       .values(status='queued', message='Worker stopped, retrying'))
+    db.session.execute(_table.update().where(stale)
+                       .values(status='failed', finished_at=now, message='Worker stopped'))
+
+    next_id = (select(_table.c.id)
+               .where(_table.c.status == 'queued', _table.c.run_after <= now)
+               .order_by(_table.c.run_after, _table.c.id).limit(1).scalar_subquery())
+    job_id = db.session.execute(
+        _table.update().where(_table.c.id == next_id, _table.c.status == 'queued')
+        .values(status='running', attempts=_table.c.attempts + 1, started_at=now, heartbeat_at=now,
+                cancel_requested=False)
+        .returning(_table.c.id)
+    ).scalar()
+    db.session.commit()
+    return job_id
+
+
+def _run(job_id):
+    job = db.session.get(Job, job_id)
+    func = HANDLERS.get(job.kind)
+    started = time.perf_counter()
+    _running.add(job_id)
+    try:
+        if func is None:
+            raise LookupError(f"No handler for {job.kind}")
+        result = func(JobContext(job))
+        db.session.rollback()  # Drop anything the handler left uncommitted
+        job = db.session.get(Job, job_id)
+        job.status, job.progress, job.finished_at = 'done', 100, datetime.utcnow()
+        job.result = json.dumps(result) if result is not None else None
+        job.message = 'Done'
+    except Cancelled:
+        db.session.rollback()
+        job = db.session.get(Job, job_id)
+        job.status, job.finished_at, job.message = 'cancelled', datetime.utcnow(), 'Cancelled'
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Job Failed ({job_id} {getattr(job, 'kind', '?')}): {e}")
+        job = db.session.get(Job, job_id)
+        if job.attempts < job.max_attempts:
+            delay = RETRY_BACKOFF * 2 ** (job.attempts - 1)
+            job.status, job.run_after = 'queued', datetime.utcnow() + timedelta(seconds=delay)
+            job.message = f"Attempt {job.attempts} failed ({e}), retrying in {delay}s"[:255]
+        else:
+            job.status, job.finished_at = 'failed', datetime.utcnow()
+            job.message = str(e)[:255]
+    finally:
+        _running.discard(job_id)
+    db.session.commit()
+    metrics.incr(f'jobs.{job.status}.{job.kind}')
+    metrics.observe(f'jobs.{job.kind}', time.perf_counter() - started)
+
+
+# --- WORKERS ---
+def work_once(app):
+    """Claims and runs one job. Returns False when the queue had nothing due."""
+    with app.app_context():
+        job_id = _claim()
+        if job_id is None:
+            return False
+        _run(job_id)
+        return True
+
+
+def _work(app):
+    while True:
+        try:
+            if work_once(app):
+                continue
+        except Exception as e:
+            print(f"⚠️ Job Worker Error: {e}")
+        _wakeup.wait(POLL_INTERVAL)
+        _wakeup.clear()
+
+
+def _heartbeat(app):
+    while True:
+        time.sleep(HEARTBEAT)
+        if not _running:
+            continue
+        try:
+            with app.app_context():
+                db.session.execute(_table.update().where(_table.c.id.in_(list(_running)))
+                                   .values(heartbeat_at=datetime.utcnow()))
+                db.session.commit()
+        except Exception as e:
+            print(f"⚠️ Job Heartbeat Failed: {e}")
+
+
+def ensure_workers(app=None):
+    """Starts this process's worker threads once; a preloading master starts none."""
+    pid = os.getpid()
+    if _workers['pid'] == pid:
+        return
+    app = app or current_app._get_current_object()
+    with _workers_lock:
+        if _workers['pid'] == pid:
+            return
+        for i in range(app.config.get('JOB_WORKERS', 2)):
+            threading.Thread(target=_work, args=(app,), name=f'job-worker-{i}', daemon=True).start()
+        threading.Thread(target=_heartbeat, args=(app,), name='job-heartbeat', daemon=True).start()
+        _workers.update(pid=pid, app=app)
+
+
+def init_app(app):
+    if app.config.get('JOB_WORKERS', 2) > 0:
+        app.before_request(lambda: ensure_workers())
+
+
+# --- HANDLERS ---
+def _db_path():
+    return db.engine.url.database
+
+
+def _size(path):
+    return os.path.getsize(path) if os.path.exists(path) else 0
+
+
+@handler('vacuum')
+def vacuum_job(ctx):
+    """Rebuilds the database file to reclaim free space."""
+    from app import response_cache
+    from app.models import AuditLog
+
+    path = _db_path()
+    before = _size(path)
+    ctx.progress(5, "Vacuuming")
+    # VACUUM cannot run inside a transaction
+    with db.engine.connect().execution_options(isolation_level='AUTOCOMMIT') as conn:
+        conn.exec_driver_sql("VACUUM")
+    response_cache.clear()
+    after = _size(path)
+    AuditLog.log(ctx, "SYSTEM", f"Ran Database Optimization (VACUUM), {before - after} bytes reclaimed")
+    return {'bytes_before': before, 'bytes_after': after}
+
+
+@handler('clear_logs')
+def clear_logs_job(ctx):
+    """Deletes audit records older than params['days'] in short transactions."""
+    from app.models import AuditLog
+
+    days = int(ctx.params.get('days', 7))
+    chunk = int(ctx.params.get('chunk', 1000))
+    cutoff = datetime.utcnow() - timedelta(days=days)
+    total = AuditLog.query.filter(AuditLog.timestamp < cutoff).count()
+    deleted = 0
+    while True:
+        ids = [i for (i,) in db.session.query(AuditLog.id).filter(AuditLog.timestamp < cutoff)
+               .order_by(AuditLog.timestamp).limit(chunk)]
+        if not ids:
+            break
+        deleted += AuditLog.query.filter(AuditLog.id.in_(ids)).delete(synchronize_session=False)
+        db.session.commit()
+        ctx.progress(deleted * 100 // max(total, 1), f"Deleted {deleted} of {total}")
+    AuditLog.log(ctx, "SYSTEM", f"Cleared {deleted} logs older than {days} days")
+    return {'deleted': deleted}
+
+
+def backup_dir():
+    return current_app.config['BACKUP_DIR']
+
+
+def list_backups():
+    directory = backup_dir()
+    if not os.path.isdir(directory):
+        return []
+    return sorted((n for n in os.listdir(directory) if n.endswith('.db')), reverse=True)
+
+
+@handler('backup')
+def backup_job(ctx):
+    """
+    Consistent copy of the live database through SQLite's backup API, which
+    (unlike copying the file) includes commits still in the -wal file.
+    """
+    directory = backup_dir()
+    os.makedirs(directory, exist_ok=True)
+    name = f"logistics-{datetime.utcnow().strftime('%Y%m%d-%H%M%S')}.db"
+    path = os.path.join(directory, name)
+    ctx.progress(5, "Copying database")
+
+    # One step: a stepped backup restarts whenever anyone writes to the
+    # source, which on a busy server (or our own progress updates) is always
+    source = sqlite3.connect(_db_path())
+    target = sqlite3.connect(path + '.tmp')
+    try:
+        source.backup(target)
+    finally:
+        target.close()
+        source.close()
+    os.replace(path + '.tmp', path)
+    ctx.progress(90, "Pruning old backups")
+
+    for old in list_backups()[current_app.config.get('BACKUP_KEEP', 5):]:
+        try:
+            os.unlink(os.path.join(directory, old))
+        except FileNotFoundError:
+            pass
+    return {'file': name, 'bytes': _size(path)}
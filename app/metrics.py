@@ -0,0 +1,37 @@
+import threading
+
+# --- IN-PROCESS METRICS ---
+# Counters and timings are kept per worker process and exposed (admin only)
+# through /settings/metrics. They reset whenever the worker restarts.
+_lock = threading.Lock()
+_counters = {}
+_timings = {}
+
+
+def incr(name, amount=1):
+    with _lock:
+        _counters[name] = _counters.get(name, 0) + amount
+
+
+def observe(name, seconds):
+    """Records one duration sample (in seconds) under the given name."""
+    with _lock:
+        stat = _timings.get(name)
+        if stat is None:
+            stat = _timings[name] = {'count': 0, 'total': 0.0, 'max': 0.0}
+        stat['count'] += 1
+        stat['total'] += seconds
+        if seconds > stat['max']:
+            stat['max'] = seconds
+
+
+def snapshot():
+    with _lock:
+        timings = {}
+        for name, stat in _timings.items():
+            timings[name] = {
+                'count': stat['count'],
+                'avg_ms': round(stat['total'] * 1000 / stat['count'], 3),
+                'max_ms': round(stat['max'] * 1000, 3),
+            }
+        return {'counters': dict(_counters), 'timings': timings}
@@ -0,0 +1,251 @@
+from sqlalchemy import text
+from app.extensions import db
+
+# --- SCHEMA MIGRATIONS ---
+# Each migration runs once, in order, and the last applied number is kept in
+# SQLite's PRAGMA user_version. Migrations must be idempotent: a fresh database
+# gets its tables from create_all() in migration 1, so later steps have to
+# tolerate finding their tables/columns already there.
+MIGRATIONS = []
+
+
+def migration(func):
+    MIGRATIONS.append(func)
+    return func
+
+
+def current_version():
+    return db.session.execute(text("PRAGMA user_version")).scalar() or 0
+
+
+def pending():
+    return MIGRATIONS[current_version():]
+
+
+def upgrade():
+    """Applies every pending migration. Returns the names of the ones that ran."""
+    applied = []
+    version = current_version()
+    for number, func in enumerate(MIGRATIONS[version:], start=version + 1):
+        func()
+        db.session.execute(text(f"PRAGMA user_version = {number}"))
+        db.session.commit()
+        applied.append(func.__name__)
+    return applied
+
+
+def seed_admin():
+    """Creates the default admin when the user table is empty."""
+    from app.models import User
+
+    if User.query.first():
+        return False
+
+    admin = User(username='admin', is_admin=True, is_active=True)
+    admin.set_password('admin123')
+    db.session.add(admin)
+    db.session.commit()
+    return True
+
+
+# --- HELPERS ---
+def has_column(table, column):
+    rows = db.session.execute(text(f"PRAGMA table_info({table})")).fetchall()
+    return any(row[1] == column for row in rows)
+
+
+def add_column(table, column, ddl):
+    if not has_column(table, column):
+        db.session.execute(text(f"ALTER TABLE {table} ADD COLUMN {column} {ddl}"))
+
+
+def fill_in_chunks(table, sets, todo, chunk=5000):
+    """
+    UPDATE table SET <sets> WHERE <todo>, `chunk` rows (by rowid) per
+    transaction, so the write lock is never held for long. `todo` must stop
+    matching a row once it is filled: an interrupted run then picks up where
+    it stopped. Returns the number of rows updated.
+    """
+    converted, last = 0, 0
+    while True:
+        upto = db.session.execute(text(f"""
+            SELECT MAX(rowid) FROM (SELECT rowid FROM {table} WHERE rowid > :last ORDER BY rowid LIMIT :chunk)
+        """), {'last': last, 'chunk': chunk}).scalar()
+        if upto is None:
+            return converted
+        converted += db.session.execute(text(f"""
+            UPDATE {table} SET {sets} WHERE rowid > :last AND rowid <= :upto AND ({todo})
+        """), {'last': last, 'upto': upto}).rowcount
+        db.session.commit()
+        last = upto
+
+
+def fill_paise(table, pairs):
+    """Copies REAL rupee columns into their INTEGER paise columns; see fill_in_chunks()."""
+    pairs = [(old, new) for old, new in pairs if has_column(table, old)]
+    if not pairs:
+        return 0  # Created with the paise columns, nothing to convert
+    # ROUND() goes half away from zero, like app.money.to_paise()
+    sets = ', '.join(f"{new} = CAST(ROUND(COALESCE({old}, 0) * 100) AS INTEGER)" for old, new in pairs)
+    return fill_in_chunks(table, sets, ' OR '.join(f"{new} IS NULL" for _, new in pairs))
+
+
+def backfill_updated_at():
+    """Existing rows get their creation time; the cube only re-reads rows whose updated_at moves."""
+    db.session.commit()
+    fill_in_chunks('entry', "updated_at = COALESCE(created_at, CURRENT_TIMESTAMP)", "updated_at IS NULL")
+
+
+def fill_opening_rates():
+    """Vendors without rate history get their old vendor-table rate as the opening row, valid for all past entries."""
+    if not has_column('vendor', 'rate_per_parcel'):
+        return  # Created after rates moved to vendor_rate
+    db.session.execute(text("""
+        INSERT INTO vendor_rate (vendor_id, effective_from, rate_per_parcel, transport_rate, created_at, created_by)
+        SELECT v.id, '1970-01-01', COALESCE(v.rate_per_parcel, 0), COALESCE(v.transport_rate, 0),
+               CURRENT_TIMESTAMP, 'System'
+          FROM vendor v
+         WHERE NOT EXISTS (SELECT 1 FROM vendor_rate r WHERE r.vendor_id = v.id)
+    """))
+
+
+# --- MIGRATIONS (append only, never reorder) ---
+@migration
+def baseline_schema():
+    db.create_all()
+
+
+@migration
+def invoice_snapshots():
+    db.create_all()  # invoice, invoice_sequence
+    add_column('entry', 'invoice_id', 'INTEGER REFERENCES invoice(id)')
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_invoice_id ON entry (invoice_id)"))
+
+
+@migration
+def entry_search_index():
+    from app.search import create_search_schema, rebuild_index
+
+    create_search_schema()
+    rebuild_index()
+
+
+@migration
+def anomaly_queue():
+    db.create_all()  # anomaly
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_rr_no ON entry (rr_no)"))
+    # Existing rows are scanned by anomaly_backfill
+
+
+@migration
+def entry_updated_at():
+    add_column('entry', 'updated_at', 'DATETIME')
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_updated_at ON entry (updated_at)"))
+    backfill_updated_at()
+
+
+@migration
+def archive_catalog():
+    db.create_all()  # archived_month
+
+
+@migration
+def entry_date_index():
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_date ON entry (date)"))
+
+
+@migration
+def vendor_rates():
+    db.create_all()  # vendor_rate
+    fill_opening_rates()
+
+
+@migration
+def entry_idempotency_key():
+    add_column('entry', 'idempotency_key', 'VARCHAR(64)')
+    db.session.execute(text("CREATE UNIQUE INDEX IF NOT EXISTS ix_entry_idempotency_key ON entry (idempotency_key)"))
+
+
+@migration
+def audit_log_indexes():
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_audit_log_timestamp ON audit_log (timestamp)"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_audit_log_username_timestamp ON audit_log (username, timestamp)"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_audit_log_action_timestamp ON audit_log (action, timestamp)"))
+
+
+@migration
+def job_queue():
+    db.create_all()  # job
+
+
+@migration
+def query_plan_indexes():
+    # Lookups flagged by scripts/check_query_plans.py
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_vendor_name ON vendor (name)"))
+    db.session.execute(text(
+        "CREATE INDEX IF NOT EXISTS ix_invoice_vendor_created_at ON invoice (vendor_id, created_at)"))
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_anomaly_status_id ON anomaly (status, id)"))
+
+
+# Charges, balances and bill totals moved from REAL rupees to INTEGER paise
+# (app/money.py). SQLite cannot change a column's type in place, so each
+# amount gets a new *_paise column filled from the old one. The REAL columns
+# stay behind unused: dropping one rewrites the whole table in one go.
+PAISE_COLUMNS = {
+    'entry': [('handling_chg', 'handling_paise'), ('railway_chg', 'railway_paise'),
+              ('transport_chg', 'transport_paise'), ('grand_total', 'total_paise')],
+    'vendor': [('pending_balance', 'pending_balance_paise')],
+    'invoice': [('current_bill_total', 'current_bill_paise'), ('pending_amount', 'pending_paise'),
+                ('grand_total', 'total_paise')],
+    'archived_month': [('grand_total', 'total_paise')],
+}
+
+
+@migration
+def money_in_paise():
+    from app import archive
+
+    for table, pairs in PAISE_COLUMNS.items():
+        for _, new in pairs:
+            add_column(table, new, 'INTEGER')
+    db.session.commit()
+    for table, pairs in PAISE_COLUMNS.items():
+        fill_paise(table, pairs)
+    archive.upgrade_files()
+
+
+@migration
+def entry_updated_at_backfill():
+    # Databases upgraded before entry_updated_at filled the column
+    backfill_updated_at()
+
+
+@migration
+def branch_billing():
+    db.create_all()  # branch_billing
+
+
+@migration
+def anomaly_backfill():
+    from app import anomalies
+
+    # Missing RR numbers are counted from the anomaly queue now; the old partial index is unused
+    db.session.execute(text("DROP INDEX IF EXISTS ix_entry_missing_rr"))
+    db.session.commit()
+    # Commits every chunk; a rerun after an interruption re-checks rows without duplicating anomalies
+    anomalies.backfill()
+
+
+@migration
+def entry_vendor_date_index():
+    # Reprice and per-vendor month reads: vendor_id = ? AND date range, in date order
+    db.session.execute(text("CREATE INDEX IF NOT EXISTS ix_entry_vendor_date ON entry (vendor_id, date)"))
+
+
+@migration
+def vendor_opening_rates():
+    # Vendors added without a rate row since vendor_rates (seed scripts) priced
+    # off the vendor table, which is no longer read
+    fill_opening_rates()
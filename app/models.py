@@ -1,7 +1,10 @@
 from app.extensions import db
+from app.money import Money
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime
+from collections import namedtuple
+import json
 
 # --- USER MODEL ---
 class User(UserMixin, db.Model):
@@ -20,11 +23,7 @@ class User(UserMixin, db.Model):
 # --- VENDOR MODEL ---
 class Vendor(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    name = db.Column(db.String(100), nullable=False)
-
-    # Rates
-    rate_per_parcel = db.Column(db.Float, default=70.0)
-    transport_rate = db.Column(db.Float, default=0.0)
+    name = db.Column(db.String(100), nullable=False, index=True)  # Entries and the batch API look vendors up by name
 
     # Billing Info
     billing_name = db.Column(db.String(150))
@@ -32,7 +31,7 @@ class Vendor(db.Model):
 
     # Settings
     is_default = db.Column(db.Boolean, default=False)
-    pending_balance = db.Column(db.Float, default=0.0)
+    pending_balance = db.Column('pending_balance_paise', Money, default=0)
 
     # PDF Column Toggles
     show_rr = db.Column(db.Boolean, default=True)
@@ -40,10 +39,28 @@ class Vendor(db.Model):
     show_railway = db.Column(db.Boolean, default=True)
     show_transport = db.Column(db.Boolean, default=True)
 
+# --- VENDOR RATE HISTORY ---
+# Each row applies from effective_from until the vendor's next row; this is
+# the only place a vendor's rates live (see app/pricing.py). The old
+# vendor.rate_per_parcel / transport_rate columns stay behind in older
+# databases, unused.
+class VendorRate(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
+    effective_from = db.Column(db.Date, nullable=False)
+    rate_per_parcel = db.Column(db.Float, default=0.0)
+    transport_rate = db.Column(db.Float, default=0.0)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(150))
+
+    __table_args__ = (
+        db.UniqueConstraint('vendor_id', 'effective_from', name='uq_vendor_rate_from'),
+    )
+
 # --- ENTRY MODEL (Restored Old Structure) ---
 class Entry(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    date = db.Column(db.Date, nullable=False, default=datetime.utcnow)
+    date = db.Column(db.Date, nullable=False, default=datetime.utcnow, index=True)
 
     # Relationship
     vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
@@ -52,27 +69,165 @@ class Entry(db.Model):
     # Route & Reference
     ship_from = db.Column(db.String(100), default="Mumbai")
     ship_to = db.Column(db.String(100), default="Udupi")
-    rr_no = db.Column(db.String(50))
+    rr_no = db.Column(db.String(50), index=True)
 
     # Data
     parcels = db.Column(db.Integer, default=0)
 
-    # Charges
-    handling_chg = db.Column(db.Float, default=0.0)
-    railway_chg = db.Column(db.Float, default=0.0)
-    transport_chg = db.Column(db.Float, default=0.0)
+    # Charges, in rupees here and whole paise in the table (app/money.py)
+    handling_chg = db.Column('handling_paise', Money, default=0)
+    railway_chg = db.Column('railway_paise', Money, default=0)
+    transport_chg = db.Column('transport_paise', Money, default=0)
 
-    grand_total = db.Column(db.Float, default=0.0)
+    grand_total = db.Column('total_paise', Money, default=0)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    # Lets the analytics cube pick up edits incrementally
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow, index=True)
+
+    # Set once the entry is billed; month-close queries skip these rows
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), index=True)
+
+    # Client-generated key from the batch API; a retried upload finds its row instead of adding another
+    idempotency_key = db.Column(db.String(64), unique=True, index=True)
+
+    # Live rows are editable; rows read back from the archive tier are not
+    archived = False
+
+# --- ARCHIVE CATALOG ---
+# One row per month whose entries have been moved out of the live table into
+# instance/archive/entries_<year>.db (see app/archive.py).
+class ArchivedMonth(db.Model):
+    month = db.Column(db.String(7), primary_key=True)  # 'YYYY-MM'
+    year = db.Column(db.Integer, nullable=False)
+    row_count = db.Column(db.Integer, default=0)
+    grand_total = db.Column('total_paise', Money, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+# --- DATA-QUALITY ANOMALY ---
+# One row per (entry, rule). 'open' while the rule fires, 'cleared' once it no
+# longer does, 'resolved' when someone has reviewed it and accepted it as-is.
+class Anomaly(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    entry_id = db.Column(db.Integer, db.ForeignKey('entry.id'), nullable=False)
+    entry_date = db.Column(db.Date)
+    rule = db.Column(db.String(30), nullable=False)
+    details = db.Column(db.String(255))
+    status = db.Column(db.String(10), nullable=False, default='open')
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    resolved_by = db.Column(db.String(150))
+
+    __table_args__ = (
+        db.UniqueConstraint('entry_id', 'rule', name='uq_anomaly_entry_rule'),
+        db.Index('ix_anomaly_status_rule_date', 'status', 'rule', 'entry_date'),
+        db.Index('ix_anomaly_status_id', 'status', 'id'),  # Newest-first queue pages
+    )
+
+# --- INVOICE (Frozen Snapshot) ---
+# Everything printed on the bill is copied here when it is generated, so a
+# reprint is a single lookup and never changes if entries or rates do later.
+InvoiceLine = namedtuple('InvoiceLine', 'date rr_no ship_to parcels handling_chg railway_chg transport_chg grand_total')
+
+class Invoice(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    invoice_no = db.Column(db.String(30), unique=True, nullable=False)
+    vendor_id = db.Column(db.Integer, db.ForeignKey('vendor.id'), nullable=False)
+    month = db.Column(db.String(7), nullable=False)  # 'YYYY-MM'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, index=True)
+    created_by = db.Column(db.String(150))
+
+    # Bill-To and column toggles as they were at generation time
+    bill_to_name = db.Column(db.String(150))
+    bill_to_address = db.Column(db.String(255))
+    show_rr = db.Column(db.Boolean, default=True)
+    show_handling = db.Column(db.Boolean, default=True)
+    show_railway = db.Column(db.Boolean, default=True)
+    show_transport = db.Column(db.Boolean, default=True)
+
+    # Frozen line items (JSON) and totals
+    items = db.Column(db.Text, nullable=False, default='[]')
+    total_parcels = db.Column(db.Integer, default=0)
+    current_bill_total = db.Column('current_bill_paise', Money, default=0)
+    pending_amount = db.Column('pending_paise', Money, default=0)
+    grand_total = db.Column('total_paise', Money, default=0)
+    total_words = db.Column(db.String(255))
+
+    vendor = db.relationship('Vendor')
+
+    __table_args__ = (
+        db.Index('ix_invoice_vendor_month', 'vendor_id', 'month'),
+        db.Index('ix_invoice_vendor_created_at', 'vendor_id', 'created_at'),  # A vendor's invoice history
+    )
+
+    @property
+    def lines(self):
+        rows = []
+        for item in json.loads(self.items or '[]'):
+            item['date'] = datetime.strptime(item['date'], '%Y-%m-%d').date()
+            rows.append(InvoiceLine(**item))
+        return rows
+
+# --- CROSS-BRANCH BILLING ---
+# Another branch's entry billed on one of our invoices. That branch's row is
+# left alone (its invoice_id refers to its own invoices); this record keeps
+# the entry off our next bill, and that branch reads it to keep the entry off
+# its own (app/federation.py).
+class BranchBilling(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    branch = db.Column(db.String(50), nullable=False)
+    entry_id = db.Column(db.Integer, nullable=False)  # Id in that branch's database
+    invoice_id = db.Column(db.Integer, db.ForeignKey('invoice.id'), nullable=False, index=True)
+    invoice_no = db.Column(db.String(30), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        db.UniqueConstraint('branch', 'entry_id', name='uq_branch_billing_entry'),
+    )
+
+class InvoiceSequence(db.Model):
+    # One counter per billing period ('YYYYMM'), bumped inside the invoice transaction
+    period = db.Column(db.String(6), primary_key=True)
+    last_value = db.Column(db.Integer, nullable=False, default=0)
+
+# --- BACKGROUND JOBS ---
+# Queue rows for app/jobs.py. Workers claim 'queued' rows whose run_after has
+# passed; heartbeat_at lets another worker take over a job whose worker died.
+class Job(db.Model):
+    id = db.Column(db.Integer, primary_key=True)
+    kind = db.Column(db.String(30), nullable=False)
+    params = db.Column(db.Text, default='{}')  # JSON
+    status = db.Column(db.String(10), nullable=False, default='queued')  # queued, running, done, failed, cancelled
+    progress = db.Column(db.Integer, default=0)  # 0-100
+    message = db.Column(db.String(255))
+    result = db.Column(db.Text)  # JSON
+    attempts = db.Column(db.Integer, default=0)
+    max_attempts = db.Column(db.Integer, default=3)
+    cancel_requested = db.Column(db.Boolean, default=False)
+    run_after = db.Column(db.DateTime, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    created_by = db.Column(db.String(150))
+    started_at = db.Column(db.DateTime)
+    heartbeat_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    __table_args__ = (
+        db.Index('ix_job_status_run_after', 'status', 'run_after'),
+    )
 
 # --- AUDIT LOG (Fixed to Auto-Commit) ---
 class AuditLog(db.Model):
     id = db.Column(db.Integer, primary_key=True)
-    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow, index=True)
     username = db.Column(db.String(150))
     action = db.Column(db.String(50))
     details = db.Column(db.String(255))
 
+    # Newest-first pages per user / per action (app/audit.py)
+    __table_args__ = (
+        db.Index('ix_audit_log_username_timestamp', 'username', 'timestamp'),
+        db.Index('ix_audit_log_action_timestamp', 'action', 'timestamp'),
+    )
+
     @staticmethod
     def log(user, action, details):
         """
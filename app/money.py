@@ -0,0 +1,52 @@
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+from sqlalchemy.types import Integer, TypeDecorator
+
+# --- MONEY (Integer paise) ---
+# Charges, balances and bill totals are stored as whole paise in INTEGER
+# columns, so SUM() in SQLite is exact integer arithmetic and a month's total
+# never drifts by a paisa however many rows it adds up. Code and templates keep
+# working in rupees: a Money column takes rupees (float, int, Decimal or str),
+# rounds them half away from zero to the paisa, and reads back paise / 100.
+# func.sum(Entry.grand_total) sums the integers first and converts once.
+#
+# Raw SQL sees the integers under the *_paise column names. Amounts combined
+# in Python go through add(), which sums in paise too.
+CENT = Decimal('0.01')
+
+
+def to_paise(amount):
+    """Rupees -> whole paise (int); None stays None. Raises ValueError on inf, nan and non-numbers."""
+    if amount is None:
+        return None
+    if isinstance(amount, int):
+        return amount * 100
+    # str() first: the shortest repr of a float is the amount that was typed (0.29, not 0.28999...)
+    try:
+        value = Decimal(str(amount))
+        if value.is_finite():
+            return int(value.quantize(CENT, rounding=ROUND_HALF_UP) * 100)
+    except InvalidOperation:
+        pass
+    raise ValueError(f"Not a valid amount: {amount!r}")
+
+
+def to_rupees(paise):
+    """Paise -> rupees, the float nearest the exact amount; None stays None."""
+    return None if paise is None else paise / 100
+
+
+def add(*amounts):
+    """Exact sum of rupee amounts; None counts as 0."""
+    return to_rupees(sum(to_paise(amount) or 0 for amount in amounts))
+
+
+class Money(TypeDecorator):
+    """INTEGER column of paise that Python reads and writes in rupees."""
+    impl = Integer
+    cache_ok = True
+
+    def process_bind_param(self, value, dialect):
+        return to_paise(value)
+
+    def process_result_value(self, value, dialect):
+        return to_rupees(value)
@@ -0,0 +1,161 @@
+from datetime import date, datetime
+from sqlalchemy import text
+from app.extensions import db
+from app.models import Vendor, VendorRate
+from app.money import to_paise, to_rupees
+from app import versions
+
+# --- PRICING RULES ---
+# handling  = parcels x rate_per_parcel        (0 if the vendor has handling off)
+# transport = transport_rate, once per entry   (0 without parcels or with transport off)
+# railway is always keyed in by hand. The rate used is the vendor's
+# VendorRate row in force on the entry's date; every vendor has an opening
+# row from OPENING_DATE, so there is always one.
+OPENING_DATE = date(1970, 1, 1)
+
+
+def rate_on(vendor, day):
+    """(rate_per_parcel, transport_rate) in force for the vendor on that day."""
+    row = VendorRate.query.filter(VendorRate.vendor_id == vendor.id, VendorRate.effective_from <= day) \
+        .order_by(VendorRate.effective_from.desc()).first()
+    if row is None:
+        return 0.0, 0.0
+    return row.rate_per_parcel or 0.0, row.transport_rate or 0.0
+
+
+def rates_on(day):
+    """rate_on() for every vendor in one query: {vendor_id: (rate_per_parcel, transport_rate)}."""
+    # One index probe per vendor for its row in force, like the reprice CTE below
+    in_force = db.session.query(VendorRate.id) \
+        .filter(VendorRate.vendor_id == Vendor.id, VendorRate.effective_from <= day) \
+        .order_by(VendorRate.effective_from.desc()).limit(1).correlate(Vendor).scalar_subquery()
+    rows = db.session.query(VendorRate.vendor_id, VendorRate.rate_per_parcel, VendorRate.transport_rate) \
+        .select_from(Vendor).join(VendorRate, VendorRate.id == in_force)
+    return {row.vendor_id: (row.rate_per_parcel or 0.0, row.transport_rate or 0.0) for row in rows}
+
+
+def price(vendor, day, parcels, memo=None):
+    """
+    Handling and transport charges for a new entry. Returns (handling, transport).
+    A dict passed as memo keeps each (vendor, day) rate for the next call in a batch.
+    """
+    if memo is None:
+        rate, transport_rate = rate_on(vendor, day)
+    else:
+        if (vendor.id, day) not in memo:
+            memo[vendor.id, day] = rate_on(vendor, day)
+        rate, transport_rate = memo[vendor.id, day]
+    handling = to_rupees(to_paise(parcels * rate)) if vendor.show_handling else 0.0
+    transport = transport_rate if vendor.show_transport and parcels > 0 else 0.0
+    return handling, transport
+
+
+def set_rate(vendor, effective_from, rate, transport_rate, user=None):
+    """
+    Records a rate from the given date, replacing one on the same date. A new
+    vendor's first rate is recorded from OPENING_DATE. The caller commits.
+    """
+    row = VendorRate.query.filter_by(vendor_id=vendor.id, effective_from=effective_from).first()
+    if row is None:
+        row = VendorRate(vendor_id=vendor.id, effective_from=effective_from)
+        db.session.add(row)
+    row.rate_per_parcel = rate
+    row.transport_rate = transport_rate
+    row.created_at = datetime.utcnow()
+    row.created_by = getattr(user, 'username', 'System')
+    db.session.flush()
+    return row
+
+
+def history(vendor):
+    return VendorRate.query.filter_by(vendor_id=vendor.id).order_by(VendorRate.effective_from.desc()).all()
+
+
+# --- RE-PRICING ---
+# One statement prices every live, un-invoiced entry in the range against the
+# rate row in force on its date (correlated subquery on vendor_rate, the same
+# lookup as rate_on). Amounts are whole
+# paise (app/money.py), so changes are found by plain integer comparison. The
+# dry run reads the same CTE; applying it is a single UPDATE ... FROM.
+PRICED = """
+    WITH priced AS (
+        SELECT e.id, e.date, e.rr_no, e.parcels, e.railway_paise,
+               e.handling_paise AS old_handling, e.transport_paise AS old_transport, e.total_paise AS old_total,
+               CASE WHEN v.show_handling
+                    THEN CAST(ROUND(COALESCE(e.parcels, 0) * COALESCE(r.rate_per_parcel, 0)
+                                    * 100) AS INTEGER)
+                    ELSE 0 END AS new_handling,
+               CASE WHEN v.show_transport AND e.parcels > 0
+                    THEN CAST(ROUND(COALESCE(r.transport_rate, 0) * 100) AS INTEGER)
+                    ELSE 0 END AS new_transport
+          FROM entry e
+          JOIN vendor v ON v.id = e.vendor_id
+          LEFT JOIN vendor_rate r ON r.id = (
+                SELECT id FROM vendor_rate
+                 WHERE vendor_id = e.vendor_id AND effective_from <= e.date
+                 ORDER BY effective_from DESC LIMIT 1)
+         WHERE e.vendor_id = :vendor_id AND e.date >= :start AND e.date <= :end
+           AND e.invoice_id IS NULL
+    ),
+    changed AS (
+        SELECT *, new_handling + COALESCE(railway_paise, 0) + new_transport AS new_total
+          FROM priced
+         WHERE COALESCE(old_handling, 0) != new_handling
+            OR COALESCE(old_transport, 0) != new_transport
+    )
+"""
+
+
+def reprice(vendor, start, end, dry_run=True, limit=200):
+    """
+    Re-computes handling/transport for the vendor's entries dated start..end.
+    Invoiced entries keep their billed amounts. Returns a summary with up to
+    `limit` changed rows; with dry_run=False the changes are written and committed.
+    """
+    params = {'vendor_id': vendor.id, 'start': start.isoformat(), 'end': end.isoformat()}
+    summary = db.session.execute(text(PRICED + """
+        SELECT COUNT(*), COALESCE(SUM(new_total - COALESCE(old_total, 0)), 0) FROM changed
+    """), params).one()
+    rows = db.session.execute(text(PRICED + """
+        SELECT id, date, rr_no, parcels, old_handling, new_handling, old_transport, new_transport,
+               old_total, new_total
+          FROM changed ORDER BY date, id LIMIT :limit
+    """), {**params, 'limit': limit}).mappings().all()
+    invoiced = db.session.execute(text("""
+        SELECT COUNT(*) FROM entry
+         WHERE vendor_id = :vendor_id AND date >= :start AND date <= :end AND invoice_id IS NOT NULL
+    """), params).scalar()
+
+    result = {
+        'vendor': vendor.name,
+        'start': params['start'],
+        'end': params['end'],
+        'changed': summary[0],
+        'total_delta': to_rupees(summary[1]),
+        'skipped_invoiced': invoiced,
+        'rows': [dict({k: to_rupees(v) if k.startswith(('old_', 'new_')) else v for k, v in row.items()},
+                      date=str(row['date'])[:10]) for row in rows],
+        'applied': False,
+    }
+    if dry_run or not summary[0]:
+        return result
+
+    ids = [row[0] for row in db.session.execute(text(PRICED + "SELECT id FROM changed"), params)]
+    db.session.execute(text(PRICED + """
+        UPDATE entry
+           SET handling_paise = changed.new_handling,
+               transport_paise = changed.new_transport,
+               total_paise = changed.new_total,
+               updated_at = :now
+          FROM changed
+         WHERE entry.id = changed.id
+    """), {**params, 'now': datetime.utcnow()})
+
+    from app import anomalies
+    anomalies.check_entries(ids)
+    db.session.commit()
+
+    # Raw SQL skips the session hooks, so announce the change ourselves
+    versions.bump('entry')
+    result['applied'] = True
+    return result
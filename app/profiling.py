@@ -0,0 +1,293 @@
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from flask import request, g
+from flask_login import current_user
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from app import metrics
+
+# --- REQUEST PROFILER ---
+# Off by default. An admin turns it on for one request with ?_profile=1 (or
+# the X-Profile: 1 header), or arms it for chosen endpoints from the system
+# tab; the endpoint list lives in PROFILE_SETTINGS, so every worker sees it.
+# Each profiled request leaves a .json and one profile file in PROFILE_DIR:
+#   <id>.json    request details and every SQL statement it ran, with timings
+#   <id>.folded  'sample' mode: collapsed stacks (flamegraph.pl, speedscope)
+#   <id>.pstats  'cprofile' mode: cProfile stats (snakeviz, pstats)
+# Only the newest PROFILE_KEEP profiles are kept.
+#
+# When nothing is armed, a request costs one stat() of the settings file
+# (cached on its mtime) and a header lookup; each SQL statement one
+# thread-local read.
+MODES = ('sample', 'cprofile')
+SAMPLE_INTERVAL = 0.005
+SQL_LIMIT = 500
+
+_state = threading.local()
+_settings = {'mtime': None, 'value': {}}
+_settings_lock = threading.Lock()
+_config = {}
+
+
+# --- SETTINGS (Shared through a file) ---
+def load_settings():
+    """{'endpoints': [...], 'mode': 'sample', 'until': epoch seconds} or {} when not armed."""
+    path = _config['settings']
+    try:
+        mtime = os.stat(path).st_mtime_ns
+    except FileNotFoundError:
+        return {}
+    with _settings_lock:
+        if _settings['mtime'] != mtime:
+            try:
+                with open(path) as f:
+                    _settings['value'] = json.load(f)
+            except (OSError, ValueError) as e:
+                print(f"⚠️ Profiler Settings Unreadable: {e}")
+                _settings['value'] = {}
+            _settings['mtime'] = mtime
+        return _settings['value']
+
+
+def save_settings(endpoints, mode='sample', minutes=30):
+    """Arms the profiler for the given endpoints; an empty list disarms it."""
+    path = _config['settings']
+    if not endpoints:
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        return {}
+    if mode not in MODES:
+        raise ValueError(f"Unknown mode: {mode}")
+    value = {'endpoints': sorted(set(endpoints)), 'mode': mode, 'until': time.time() + minutes * 60}
+    tmp = f"{path}.{os.getpid()}.tmp"
+    with open(tmp, 'w') as f:
+        json.dump(value, f)
+    os.replace(tmp, path)
+    return value
+
+
+def _armed_mode(endpoint):
+    settings = load_settings()
+    if settings and endpoint in settings.get('endpoints', ()) and settings.get('until', 0) > time.time():
+        return settings.get('mode', 'sample')
+    return None
+
+
+# --- SAMPLER ---
+class Sampler(threading.Thread):
+    """Records the stack of one thread every SAMPLE_INTERVAL seconds, in collapsed form."""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        super().__init__(name='profile-sampler', daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({_short_path(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def folded(self):
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+
+def _short_path(path):
+    for prefix in _config.get('prefixes', ()):
+        if path.startswith(prefix):
+            return path[len(prefix):]
+    return path
+
+
+# --- SQL CAPTURE ---
+@event.listens_for(Engine, 'before_cursor_execute')
+def _sql_started(conn, cursor, statement, parameters, context, executemany):
+    if getattr(_state, 'sql', None) is not None:
+        conn.info.setdefault('profile_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _sql_finished(conn, cursor, statement, parameters, context, executemany):
+    sql = getattr(_state, 'sql', None)
+    if sql is None or not conn.info.get('profile_started'):
+        return
+    elapsed = time.perf_counter() - conn.info['profile_started'].pop()
+    if len(sql) < SQL_LIMIT:
+        sql.append({'sql': statement, 'params': repr(parameters)[:300], 'ms': round(elapsed * 1000, 3),
+                    'executemany': executemany})
+    else:
+        _state.sql_dropped += 1
+
+
+# --- REQUEST HOOKS ---
+def _requested():
+    if request.args.get('_profile') or request.headers.get('X-Profile'):
+        return current_user.is_authenticated and current_user.is_admin
+    return False
+
+
+def _start():
+    mode = None
+    if _requested():
+        mode = request.args.get('_profile_mode') or request.headers.get('X-Profile-Mode') or 'sample'
+        mode = mode if mode in MODES else 'sample'
+    elif request.endpoint:
+        mode = _armed_mode(request.endpoint)
+    if mode is None:
+        return
+
+    profiler = None
+    if mode == 'cprofile':
+        profiler = cProfile.Profile()
+        try:
+            profiler.enable()
+        except ValueError:
+            # Only one cProfile can run at a time (Python 3.12+); fall back to sampling
+            profiler, mode = None, 'sample'
+    if profiler is None:
+        profiler = Sampler(threading.get_ident())
+        profiler.start()
+
+    _state.sql, _state.sql_dropped = [], 0
+    g._profile = {'mode': mode, 'profiler': profiler, 'started': time.perf_counter(),
+                  'at': datetime.utcnow()}
+
+
+def _finish(response):
+    profile = g.pop('_profile', None)
+    if profile is None:
+        return response
+
+    profiler = profile['profiler']
+    if profile['mode'] == 'cprofile':
+        profiler.disable()
+    else:
+        profiler.stop()
+    elapsed = time.perf_counter() - profile['started']
+    sql, dropped = _state.sql, _state.sql_dropped
+    _state.sql = None
+
+    try:
+        profile_id = _save(profile, profiler, sql, dropped, elapsed, response)
+        response.headers['X-Profile-Id'] = profile_id
+        metrics.incr('profiler.saved')
+    except OSError as e:
+        print(f"⚠️ Profile Not Saved: {e}")
+    return response
+
+
+def _abandon(exc):
+    # A request that failed before after_request still has to release the profiler
+    profile = g.pop('_profile', None)
+    if profile is not None:
+        if profile['mode'] == 'cprofile':
+            profile['profiler'].disable()
+        else:
+            profile['profiler'].stop()
+        _state.sql = None
+
+
+# --- STORAGE (Bounded ring on disk) ---
+def _save(profile, profiler, sql, dropped, elapsed, response):
+    directory = _config['directory']
+    os.makedirs(directory, exist_ok=True)
+    profile_id = f"{profile['at'].strftime('%Y%m%d-%H%M%S-%f')}-{request.endpoint or 'unknown'}"
+    base = os.path.join(directory, profile_id)
+
+    if profile['mode'] == 'cprofile':
+        profiler.dump_stats(base + '.pstats')
+    else:
+        with open(base + '.folded', 'w') as f:
+            f.write(profiler.folded())
+
+    meta = {
+        'id': profile_id,
+        'at': profile['at'].isoformat(),
+        'endpoint': request.endpoint,
+        'method': request.method,
+        'path': request.full_path.rstrip('?'),
+        'user': current_user.username if current_user.is_authenticated else None,
+        'status': response.status_code,
+        'mode': profile['mode'],
+        'duration_ms': round(elapsed * 1000, 1),
+        'sql_count': len(sql) + dropped,
+        'sql_ms': round(sum(s['ms'] for s in sql), 1),
+        'sql': sql,
+    }
+    # The .json goes last: list_profiles() only shows complete profiles
+    with open(base + '.json', 'w') as f:
+        json.dump(meta, f, indent=1)
+    _prune(directory)
+    return profile_id
+
+
+def _prune(directory):
+    metas = sorted(name for name in os.listdir(directory) if name.endswith('.json'))
+    for name in metas[:max(0, len(metas) - _config['keep'])]:
+        base = os.path.join(directory, name[:-len('.json')])
+        for ext in ('.json', '.folded', '.pstats'):
+            try:
+                os.unlink(base + ext)
+            except FileNotFoundError:
+                pass
+
+
+def list_profiles():
+    """Newest first, without the SQL lists."""
+    directory = _config['directory']
+    if not os.path.isdir(directory):
+        return []
+    profiles = []
+    for name in sorted((n for n in os.listdir(directory) if n.endswith('.json')), reverse=True):
+        try:
+            with open(os.path.join(directory, name)) as f:
+                meta = json.load(f)
+        except (OSError, ValueError):
+            continue
+        meta.pop('sql', None)
+        profiles.append(meta)
+    return profiles
+
+
+def profile_file(profile_id, kind):
+    """Path of one stored file ('json', 'folded' or 'pstats'), or None."""
+    if kind not in ('json', 'folded', 'pstats') or os.sep in profile_id or profile_id.startswith('.'):
+        return None
+    path = os.path.join(_config['directory'], f"{profile_id}.{kind}")
+    return path if os.path.exists(path) else None
+
+
+def active():
+    """True while the current request is being profiled; the response cache stands aside."""
+    return '_profile' in g
+
+
+# --- SETUP ---
+def init_app(app):
+    _config['directory'] = app.config['PROFILE_DIR']
+    _config['settings'] = app.config['PROFILE_SETTINGS']
+    _config['keep'] = app.config.get('PROFILE_KEEP', 20)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    _config['prefixes'] = sorted({root + os.sep, os.path.dirname(os.__file__) + os.sep}, key=len, reverse=True)
+    app.before_request(_start)
+    app.after_request(_finish)
+    app.teardown_request(_abandon)
@@ -0,0 +1,57 @@
+from collections import namedtuple
+from datetime import datetime
+from sqlalchemy import select
+from app.extensions import db
+from app.models import Entry, Vendor
+
+# --- READ MODELS ---
+# Listings and bills only display and sum entries, so they read plain column
+# tuples instead of ORM instances: no identity map, no change tracking, no
+# lazy vendor load per row. Each row becomes an EntryRow, a __slots__ object
+# with the vendor name already joined in. It answers to the same attribute
+# names as Entry (entry.vendor.name included), so templates and the invoicing
+# code take either. Rows from the archive tier and from other branches are
+# EntryRows too (app.archive.ArchivedEntry, app.federation.ShardEntry).
+COLUMNS = ('id', 'date', 'vendor_id', 'vendor_name', 'ship_from', 'ship_to', 'rr_no', 'parcels',
+           'handling_chg', 'railway_chg', 'transport_chg', 'grand_total', 'invoice_id')
+
+VendorRef = namedtuple('VendorRef', 'id name')
+
+
+class EntryRow:
+    """Read-only entry; build from a tuple in COLUMNS order."""
+    __slots__ = COLUMNS
+    archived = False
+    branch = None
+
+    def __init__(self, row):
+        (self.id, self.date, self.vendor_id, self.vendor_name, self.ship_from, self.ship_to, self.rr_no,
+         self.parcels, self.handling_chg, self.railway_chg, self.transport_chg, self.grand_total,
+         self.invoice_id) = row
+
+    @property
+    def vendor(self):
+        return VendorRef(self.vendor_id, self.vendor_name)
+
+    def __repr__(self):
+        return f"<EntryRow {self.id} {self.date} {self.vendor_name}>"
+
+
+def parse_date(value):
+    """Raw SQL hands back dates as text ('2024-05-07' or '2024-05-07 00:00:00.000000')."""
+    return datetime.strptime(value[:10], '%Y-%m-%d').date() if isinstance(value, str) else value
+
+
+# --- LIVE QUERIES ---
+def entry_select():
+    """SELECT of the live entry columns in COLUMNS order; add filters and run through entry_rows()."""
+    return (
+        select(Entry.id, Entry.date, Entry.vendor_id, Vendor.name, Entry.ship_from, Entry.ship_to,
+               Entry.rr_no, Entry.parcels, Entry.handling_chg, Entry.railway_chg, Entry.transport_chg,
+               Entry.grand_total, Entry.invoice_id)
+        .outerjoin(Vendor, Vendor.id == Entry.vendor_id)
+    )
+
+
+def entry_rows(stmt, session=None):
+    return [EntryRow(row) for row in (session or db.session).execute(stmt)]
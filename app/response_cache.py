@@ -0,0 +1,216 @@
+import hashlib
+import os
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import date
+from functools import wraps
+from flask import request, session, make_response
+from flask_login import current_user
+from app import metrics, profiling, versions
+
+# --- RESPONSE CACHE ---
+# Read-only pages are stored whole after their first render. The key holds
+# everything the HTML depends on: endpoint, query args, the user (the nav
+# shows their name and role), today's date (pages default to the current
+# month) and the version counter of every table the page reads. A write to
+# any of those tables changes the key, so stale pages are never looked up
+# again and simply age out of the LRU.
+#
+# RESPONSE_CACHE picks the backend: 'memory' (per worker), 'disk' (shared by
+# every worker through RESPONSE_CACHE_DIR) or 'off'.
+_backend = None
+
+
+class MemoryBackend:
+    """LRU bounded by the total size of the stored bodies."""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.bytes = 0
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            item = self._items.get(key)
+            if item is not None:
+                self._items.move_to_end(key)
+            return item
+
+    def set(self, key, item):
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old[3])
+            self._items[key] = item
+            self.bytes += len(item[3])
+            while self.bytes > self.max_bytes and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self.bytes -= len(evicted[3])
+                metrics.incr('response_cache.evicted')
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+            self.bytes = 0
+
+    def stats(self):
+        return {'backend': 'memory', 'entries': len(self._items), 'bytes': self.bytes}
+
+
+class DiskBackend:
+    """
+    One pickle per key in a shared directory. Hits touch the file, so pruning
+    the oldest mtimes once the directory passes max_bytes is LRU order.
+    """
+
+    def __init__(self, directory, max_bytes):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, key):
+        return os.path.join(self.directory, key)
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                item = pickle.load(f)
+            os.utime(path)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return None
+        return item
+
+    def set(self, key, item):
+        # Write then rename, so other workers never read half a file
+        path = self._path(key)
+        tmp = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp, 'wb') as f:
+            pickle.dump(item, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, path)
+        self._prune()
+
+    def _files(self):
+        files = []
+        with os.scandir(self.directory) as it:
+            for e in it:
+                if e.name.endswith('.tmp'):
+                    continue
+                try:
+                    st = e.stat()
+                except FileNotFoundError:
+                    continue
+                files.append((st.st_mtime_ns, st.st_size, e.path))
+        return files
+
+    def _prune(self):
+        files = self._files()
+        total = sum(size for _, size, _ in files)
+        if total <= self.max_bytes:
+            return
+        for _, size, path in sorted(files):
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+            metrics.incr('response_cache.evicted')
+            total -= size
+            if total <= self.max_bytes:
+                break
+
+    def clear(self):
+        for _, _, path in self._files():
+            try:
+                os.unlink(path)
+            except FileNotFoundError:
+                pass
+
+    def stats(self):
+        files = self._files()
+        return {'backend': 'disk', 'entries': len(files), 'bytes': sum(size for _, size, _ in files)}
+
+
+def init_app(app):
+    global _backend
+    kind = app.config.get('RESPONSE_CACHE', 'memory')
+    max_bytes = app.config.get('RESPONSE_CACHE_BYTES', 32 * 1024 * 1024)
+    if kind == 'memory':
+        _backend = MemoryBackend(max_bytes)
+    elif kind == 'disk':
+        _backend = DiskBackend(app.config['RESPONSE_CACHE_DIR'], max_bytes)
+    else:
+        _backend = None
+
+
+# --- KEYS ---
+def _key(tables, vary):
+    # Blank args are dropped so '?vendor=' and no vendor share an entry
+    args = sorted((k, v) for k, v in request.args.items(multi=True) if v != '')
+    user = (current_user.get_id(), bool(getattr(current_user, 'is_admin', False)))
+    parts = (request.endpoint, args, user, date.today().isoformat(), versions.get_many(tables),
+             vary() if vary else None)
+    return hashlib.sha1(repr(parts).encode()).hexdigest()
+
+
+def cached(*tables, ttl=None, vary=None):
+    """
+    Caches a GET view's 200 response until one of `tables` is written.
+    ttl (seconds) also expires it, for pages that show things no table
+    tracks, such as the live system stats in settings. vary is a callable
+    whose value joins the key (e.g. other branches' database stamps).
+    The user table is always part of the key.
+    """
+    tables = tuple(sorted(set(tables) | {'user'}))
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            # A pending flash message is rendered once, so that page is never shared.
+            # A profiled request has to run the view to be worth profiling.
+            if _backend is None or request.method != 'GET' or session.get('_flashes') or profiling.active():
+                return view(*args, **kwargs)
+
+            key = _key(tables, vary)
+            item = _backend.get(key)
+            if item is not None and (item[0] is None or item[0] > time.time()):
+                metrics.incr('response_cache.hit')
+                metrics.incr(f'response_cache.hit.{request.endpoint}')
+                _, status, content_type, body = item
+                response = make_response(body, status)
+                response.content_type = content_type
+                response.headers['X-Cache'] = 'HIT'
+                return response
+
+            metrics.incr('response_cache.miss')
+            metrics.incr(f'response_cache.miss.{request.endpoint}')
+            response = make_response(view(*args, **kwargs))
+            # Skip redirects, errors, streams and anything that changed the session
+            if response.status_code == 200 and not response.direct_passthrough and not session.modified:
+                expires = time.time() + ttl if ttl else None
+                _backend.set(key, (expires, response.status_code, response.content_type, response.get_data()))
+            response.headers['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def stats():
+    """Hit ratio and size for /settings/metrics."""
+    counters = metrics.snapshot()['counters']
+    hits = counters.get('response_cache.hit', 0)
+    misses = counters.get('response_cache.miss', 0)
+    result = {'hits': hits, 'misses': misses,
+              'hit_ratio': round(hits / (hits + misses), 3) if hits + misses else None}
+    if _backend is None:
+        result['backend'] = 'off'
+    else:
+        result.update(_backend.stats())
+    return result
+
+
+def clear():
+    if _backend is not None:
+        _backend.clear()
@@ -1,14 +1,18 @@
 from flask import render_template
 from flask_login import login_required, current_user
-from app.models import Vendor, User, Entry, AuditLog
+from app.models import Vendor, User, Entry
+from app import pricing, response_cache
 from . import admin_bp
-import psutil
-import platform
 import os
-from datetime import datetime
+from datetime import date, datetime
+
+# psutil and platform are imported inside the functions that use them, so
+# workers that never open the settings page don't pay for loading them.
 
 # --- HELPER ---
 def get_uptime():
+    import psutil
+
     try:
         boot_time = datetime.fromtimestamp(psutil.boot_time())
         now = datetime.now()
@@ -21,15 +25,20 @@ def get_uptime():
         return "Unknown"
 
 # --- ROUTE ---
+# The system tab shows live CPU/RAM figures, so the page also expires after 30s
 @admin_bp.route('/settings', methods=['GET'])
 @login_required
+@response_cache.cached('vendor', 'vendor_rate', 'entry', ttl=30)
 def settings():
+    import platform
+    import psutil
+
     # 1. Vendor Data (Visible to everyone)
     vendors = Vendor.query.all()
+    rates = pricing.rates_on(date.today())
 
     # 2. Defaults for Admin Data
     users = []
-    audit_logs = []
     system_stats = {
         'cpu_percent': 0, 'cpu_cores': 0, 'cpu_freq': "N/A",
         'ram_percent': 0, 'ram_used': "0", 'ram_total': "0",
@@ -42,7 +51,7 @@ def settings():
 
     if current_user.is_admin:
         users = User.query.all()
-        audit_logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(100).all()
+        # The audit tab fetches its own pages from /settings/audit when opened
         total_entries = Entry.query.count()
 
         try:
@@ -90,6 +99,6 @@ def settings():
             print(f"Metrics Error: {e}")
 
     return render_template('settings.html',
-                           vendors=vendors, users=users,
+                           vendors=vendors, rates=rates, users=users,
                            system_stats=system_stats, db_size=db_size,
-                           total_entries=total_entries, audit_logs=audit_logs)
\ No newline at end of file
+                           total_entries=total_entries)
\ No newline at end of file
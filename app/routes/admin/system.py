@@ -1,11 +1,21 @@
-from flask import redirect, url_for, send_file, flash
+from flask import redirect, url_for, send_file, flash, jsonify, current_app, request, abort
 from flask_login import login_required, current_user
-from app.models import AuditLog
-from app.extensions import db
-from sqlalchemy import text
+from app.models import AuditLog, Job
+from app import audit, jobs, metrics, profiling, response_cache
 from . import admin_bp
 import os
-from datetime import datetime, timedelta
+from datetime import datetime
+
+# --- MAINTENANCE (Queued, see app/jobs.py) ---
+# These links only queue the work; the system tab polls /settings/jobs for
+# progress. Without JavaScript they flash the job number and come back here.
+def _queue_job(kind, label, params=None):
+    try:
+        job = jobs.enqueue(kind, params, current_user)
+        flash(f"{label} started in the background (job #{job.id})")
+    except Exception as e:
+        flash(f"Error starting {label.lower()}: {e}")
+    return redirect(url_for('admin.settings', tab='system'))
 
 # --- OPTIMIZE DATABASE (VACUUM) ---
 @admin_bp.route('/settings/optimize_db')
@@ -13,19 +23,7 @@ from datetime import datetime, timedelta
 def optimize_db():
     if not current_user.is_admin:
         return redirect(url_for('admin.settings', tab='system'))
-
-    try:
-        # VACUUM rebuilds the DB file, reclaiming free space
-        db.session.execute(text("VACUUM"))
-        db.session.commit()
-
-        AuditLog.log(current_user, "SYSTEM", "Ran Database Optimization (VACUUM)")
-        flash("Database optimized successfully!")
-    except Exception as e:
-        flash(f"Error optimizing: {e}")
-
-    # Redirect back to the System tab
-    return redirect(url_for('admin.settings', tab='system'))
+    return _queue_job('vacuum', "Database optimization")
 
 # --- CLEAR OLD LOGS ---
 @admin_bp.route('/settings/clear_logs')
@@ -33,34 +31,131 @@ def optimize_db():
 def clear_logs():
     if not current_user.is_admin:
         return redirect(url_for('admin.settings', tab='system'))
+    # Deleted in chunks of 1000, so audit writes elsewhere never wait long for the lock
+    return _queue_job('clear_logs', "Log cleanup", {'days': 7})
 
-    try:
-        # Delete logs older than 7 days
-        cutoff_date = datetime.now() - timedelta(days=7)
-        deleted_count = AuditLog.query.filter(AuditLog.timestamp < cutoff_date).delete()
-        db.session.commit()
+# --- AUDIT LOG SEARCH (Loaded by the audit tab) ---
+# GET /settings/audit?user=admin&action=LOGIN&start=2024-05-07&end=2024-05-07&q=Shiva&cursor=...
+@admin_bp.route('/settings/audit')
+@login_required
+def audit_search():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
 
-        AuditLog.log(current_user, "SYSTEM", f"Manually cleared {deleted_count} logs older than 7 days")
-        flash(f"Success! Cleared {deleted_count} old log entries.")
-    except Exception as e:
-        flash(f"Error clearing logs: {e}")
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        rows, cursor = audit.search(username=request.args.get('user') or None,
+                                    action=request.args.get('action') or None,
+                                    start=datetime.strptime(start, '%Y-%m-%d').date() if start else None,
+                                    end=datetime.strptime(end, '%Y-%m-%d').date() if end else None,
+                                    text=request.args.get('q') or None,
+                                    cursor=request.args.get('cursor') or None,
+                                    limit=request.args.get('limit', audit.PAGE_SIZE, type=int))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    # Redirect back to the System tab (where the button is)
-    return redirect(url_for('admin.settings', tab='system'))
+    result = {'items': [audit.as_dict(log) for log in rows], 'next': cursor}
+    if not request.args.get('cursor'):
+        result.update(audit.facets())  # First page fills the filter dropdowns
+    return jsonify(result)
 
-# --- DOWNLOAD BACKUP ---
+# --- BACKUP (Made by a job, downloaded when ready) ---
 @admin_bp.route('/settings/backup')
 @login_required
 def backup():
+    if not current_user.is_admin:
+        return redirect(url_for('core.home'))
+    return _queue_job('backup', "Backup")
+
+@admin_bp.route('/settings/backups/<name>')
+@login_required
+def download_backup(name):
+    if not current_user.is_admin:
+        return redirect(url_for('core.home'))
+    if name not in jobs.list_backups():
+        abort(404)
+
+    AuditLog.log(current_user, "SYSTEM", f"Downloaded Database Backup {name}")
+    return send_file(os.path.join(jobs.backup_dir(), name), as_attachment=True)
+
+# --- JOB STATUS (Polled by the system tab) ---
+@admin_bp.route('/settings/jobs', methods=['GET', 'POST'])
+@login_required
+def job_list():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+
+    if request.method == 'POST':
+        kind = request.form.get('kind')
+        params = {'days': 7} if kind == 'clear_logs' else None
+        try:
+            job = jobs.enqueue(kind, params, current_user)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        return jsonify(jobs.as_dict(job)), 202
+
+    return jsonify({'jobs': [jobs.as_dict(job) for job in jobs.recent()], 'backups': jobs.list_backups()})
+
+@admin_bp.route('/settings/jobs/<int:job_id>')
+@login_required
+def job_status(job_id):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+    return jsonify(jobs.as_dict(Job.query.get_or_404(job_id)))
+
+@admin_bp.route('/settings/jobs/<int:job_id>/cancel', methods=['POST'])
+@login_required
+def job_cancel(job_id):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+
+    job = jobs.cancel(Job.query.get_or_404(job_id))
+    AuditLog.log(current_user, "SYSTEM", f"Cancelled job #{job.id} ({job.kind})")
+    return jsonify(jobs.as_dict(job))
+
+# --- PERFORMANCE METRICS (JSON) ---
+@admin_bp.route('/settings/metrics')
+@login_required
+def metrics_snapshot():
     if not current_user.is_admin:
         return redirect(url_for('core.home'))
 
-    AuditLog.log(current_user, "SYSTEM", "Downloaded Database Backup")
+    data = metrics.snapshot()
+    data['fragment_cache_size'] = len(current_app.jinja_env.fragment_cache)
+    data['response_cache'] = response_cache.stats()
+    return jsonify(data)
 
-    # Point explicitly to the 'instance' folder
-    db_path = os.path.join(os.getcwd(), 'instance', 'logistics.db')
+# --- REQUEST PROFILER (Loaded by the system tab) ---
+@admin_bp.route('/settings/profiles', methods=['GET', 'POST'])
+@login_required
+def profiles():
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
 
-    if os.path.exists(db_path):
-        return send_file(db_path, as_attachment=True)
+    if request.method == 'POST':
+        endpoints = [e for e in request.form.getlist('endpoints') if e in current_app.view_functions]
+        try:
+            settings = profiling.save_settings(endpoints, request.form.get('mode', 'sample'),
+                                               request.form.get('minutes', 30, type=int))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        detail = f"Armed profiler for {', '.join(endpoints)} ({settings['mode']})" if endpoints else "Disarmed profiler"
+        AuditLog.log(current_user, "SYSTEM", detail)
+
+    return jsonify({
+        'settings': profiling.load_settings(),
+        'endpoints': sorted(e for e in current_app.view_functions if e != 'static'),
+        'profiles': profiling.list_profiles(),
+    })
+
+@admin_bp.route('/settings/profiles/<profile_id>/<kind>')
+@login_required
+def download_profile(profile_id, kind):
+    if not current_user.is_admin:
+        return redirect(url_for('core.home'))
 
-    return "Database file not found in instance folder.", 404
\ No newline at end of file
+    path = profiling.profile_file(profile_id, kind)
+    if path is None:
+        abort(404)
+    return send_file(path, as_attachment=True)
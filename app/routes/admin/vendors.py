@@ -1,7 +1,9 @@
-from flask import request, redirect, url_for, flash
+from flask import request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
-from app.models import Vendor, AuditLog
+from datetime import date, datetime
+from app.models import Vendor, VendorRate, AuditLog
 from app.extensions import db
+from app import pricing
 from . import admin_bp
 
 # --- ADD NEW VENDOR ---
@@ -17,14 +19,16 @@ def add_vendor():
         if Vendor.query.filter_by(name=name).first():
             flash(f"Vendor '{name}' already exists.")
         else:
-            db.session.add(Vendor(
+            vendor = Vendor(
                 name=name,
-                rate_per_parcel=float(request.form.get('rate', 70.0)),
-                transport_rate=float(request.form.get('transport', 0.0)),
                 billing_name=request.form.get('billing_name'),
                 billing_address=request.form.get('billing_address'),
                 show_rr=True, show_handling=True, show_railway=True, show_transport=True
-            ))
+            )
+            db.session.add(vendor)
+            db.session.flush()
+            pricing.set_rate(vendor, pricing.OPENING_DATE, float(request.form.get('rate', 70.0)),
+                             float(request.form.get('transport', 0.0)), current_user)
             db.session.commit()
 
             AuditLog.log(current_user, "ADD VENDOR", f"Added new vendor: {name}")
@@ -51,11 +55,17 @@ def update_vendor(id):
 
         # 2. Update Critical Info (Admin Only)
         if current_user.is_admin:
-            old_rate = vendor.rate_per_parcel
+            # The form shows today's rate
+            old_rate, old_transport = pricing.rate_on(vendor, date.today())
             new_rate = float(request.form.get('rate'))
+            new_transport = float(request.form.get('transport'))
+
+            # Rate changes are recorded from a date (default today) instead of overwriting history
+            if new_rate != old_rate or new_transport != old_transport:
+                rate_from = request.form.get('rate_from')
+                rate_from = datetime.strptime(rate_from, '%Y-%m-%d').date() if rate_from else date.today()
+                pricing.set_rate(vendor, rate_from, new_rate, new_transport, current_user)
 
-            vendor.rate_per_parcel = new_rate
-            vendor.transport_rate = float(request.form.get('transport'))
             vendor.billing_name = request.form.get('billing_name')
             vendor.billing_address = request.form.get('billing_address')
             vendor.show_rr = bool(request.form.get('show_rr'))
@@ -64,7 +74,7 @@ def update_vendor(id):
             vendor.show_transport = bool(request.form.get('show_transport'))
 
             if old_rate != new_rate:
-                AuditLog.log(current_user, "UPDATE RATE", f"{vendor.name}: Rate changed {old_rate} -> {new_rate}")
+                AuditLog.log(current_user, "UPDATE RATE", f"{vendor.name}: Rate changed {old_rate} -> {new_rate} from {rate_from}")
             else:
                 AuditLog.log(current_user, "UPDATE VENDOR", f"Updated details for {vendor.name}")
 
@@ -85,6 +95,7 @@ def delete_vendor(id):
 
     v = Vendor.query.get_or_404(id)
     name = v.name # Capture name before delete
+    VendorRate.query.filter_by(vendor_id=v.id).delete()
     db.session.delete(v)
     db.session.commit()
 
@@ -106,4 +117,41 @@ def set_default_vendor(id):
     db.session.commit()
 
     AuditLog.log(current_user, "UPDATE VENDOR", f"Set {v.name} as default")
-    return redirect(url_for('admin.settings', tab='vendors'))
\ No newline at end of file
+    return redirect(url_for('admin.settings', tab='vendors'))
+
+# --- RATE HISTORY (JSON) ---
+@admin_bp.route('/settings/vendor/<int:id>/rates')
+@login_required
+def vendor_rates(id):
+    vendor = Vendor.query.get_or_404(id)
+    return jsonify([{
+        'effective_from': r.effective_from.isoformat(),
+        'rate_per_parcel': r.rate_per_parcel,
+        'transport_rate': r.transport_rate,
+        'created_by': r.created_by,
+    } for r in pricing.history(vendor)])
+
+# --- RE-PRICE ENTRIES (Dry run unless apply=1) ---
+@admin_bp.route('/settings/vendor/<int:id>/reprice', methods=['POST'])
+@login_required
+def reprice_vendor(id):
+    if not current_user.is_admin:
+        return jsonify({'error': 'Admin only'}), 403
+
+    vendor = Vendor.query.get_or_404(id)
+    data = request.get_json(silent=True) or request.form
+    try:
+        start = datetime.strptime(data.get('start', ''), '%Y-%m-%d').date()
+        end = datetime.strptime(data.get('end', ''), '%Y-%m-%d').date()
+    except ValueError:
+        return jsonify({'error': 'start and end must be YYYY-MM-DD'}), 400
+
+    apply = str(data.get('apply', '')).lower() in ('1', 'true', 'on')
+    result = pricing.reprice(vendor, start, end, dry_run=not apply)
+    if result['applied']:
+        AuditLog.log(current_user, "REPRICE", f"{vendor.name} {start} to {end}: {result['changed']} entries, "
+                                              f"change {result['total_delta']:+,.2f}")
+        # Totals moved without per-entry events; open dashboards reload theirs
+        from app import events
+        events.publish({'type': 'resync'})
+    return jsonify(result)
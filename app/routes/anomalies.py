@@ -0,0 +1,72 @@
+from flask import Blueprint, request, jsonify, url_for
+from flask_login import login_required, current_user
+from datetime import datetime
+from app.models import Anomaly, AuditLog
+from app.extensions import db
+from app.anomalies import RULE_LABELS, open_counts
+
+anomalies_bp = Blueprint('anomalies', __name__)
+
+# --- SUMMARY (Counters) ---
+@anomalies_bp.route('/api/anomalies/summary')
+@login_required
+def summary():
+    counts = open_counts()
+    return jsonify({
+        'open_total': sum(counts.values()),
+        'by_rule': {rule: {'label': label, 'open': counts.get(rule, 0)} for rule, label in RULE_LABELS.items()},
+    })
+
+# --- QUEUE ---
+@anomalies_bp.route('/api/anomalies')
+@login_required
+def queue():
+    status = request.args.get('status', 'open')
+    rule = request.args.get('rule')
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    before_id = request.args.get('before', type=int)
+
+    query = Anomaly.query.filter(Anomaly.status == status)
+    if rule:
+        query = query.filter(Anomaly.rule == rule)
+    if before_id:
+        query = query.filter(Anomaly.id < before_id)
+    rows = query.order_by(Anomaly.id.desc()).limit(limit).all()
+
+    return jsonify({
+        'items': [{
+            'id': a.id,
+            'entry_id': a.entry_id,
+            'entry_date': a.entry_date.isoformat() if a.entry_date else None,
+            'rule': a.rule,
+            'label': RULE_LABELS.get(a.rule, a.rule),
+            'details': a.details,
+            'status': a.status,
+            'updated_at': a.updated_at.isoformat() if a.updated_at else None,
+            'edit_url': url_for('core.edit_entry', id=a.entry_id),
+        } for a in rows],
+        'next_before': rows[-1].id if len(rows) == limit else None,
+    })
+
+# --- RESOLVE / REOPEN ---
+@anomalies_bp.route('/api/anomalies/<int:id>/resolve', methods=['POST'])
+@login_required
+def resolve(id):
+    anomaly = Anomaly.query.get_or_404(id)
+    anomaly.status = 'resolved'
+    anomaly.resolved_by = current_user.username
+    anomaly.updated_at = datetime.utcnow()
+    db.session.commit()
+
+    AuditLog.log(current_user, "RESOLVE ANOMALY", f"Accepted {anomaly.rule} on Entry #{anomaly.entry_id}")
+    return jsonify({'id': anomaly.id, 'status': anomaly.status})
+
+@anomalies_bp.route('/api/anomalies/<int:id>/reopen', methods=['POST'])
+@login_required
+def reopen(id):
+    anomaly = Anomaly.query.get_or_404(id)
+    anomaly.status = 'open'
+    anomaly.resolved_by = None
+    anomaly.updated_at = datetime.utcnow()
+    db.session.commit()
+    return jsonify({'id': anomaly.id, 'status': anomaly.status})
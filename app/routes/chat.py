@@ -1,7 +1,10 @@
 from flask import Blueprint, request, jsonify
-from datetime import date, datetime, timedelta
+from datetime import date, datetime
 from app.models import Entry, Vendor, AuditLog
 from app.extensions import db
+from app.anomalies import open_counts, RULE_LABELS
+from app import archive, audit, federation
+from app.money import add
 from sqlalchemy import func
 
 chat_bp = Blueprint('chat', __name__)
@@ -12,11 +15,7 @@ def chat_response():
         user_msg = request.json.get('message', '').lower().strip()
         today = date.today()
         month_now = today.strftime('%Y-%m')
-
-        # Date Logic for Comparisons
-        first_this_month = today.replace(day=1)
-        last_month_end = first_this_month - timedelta(days=1)
-        month_last = last_month_end.strftime('%Y-%m')
+        month_start, month_end = archive.month_bounds(month_now)  # Range filter, so ix_entry_date is used
 
         res = {"text": "DATA_INSUFFICIENT: Command outside neural mapping. Try 'Help'.", "type": "neutral", "link": None}
 
@@ -29,8 +28,8 @@ def chat_response():
             target_v = next((v for v in vendors if v.name.lower() in user_msg), None)
 
             if target_v and amount:
-                old_bal = target_v.pending_balance
-                target_v.pending_balance -= amount
+                old_bal = target_v.pending_balance or 0.0
+                target_v.pending_balance = add(old_bal, -amount)
                 db.session.commit()
                 AuditLog.log(None, "CHAT_UPDATE", f"Reduced {target_v.name} balance by {amount}")
                 res["text"] = f"✅ <b>TRANSACTION_SUCCESS:</b> Updated {target_v.name}.<br>Old Bal: ₹{old_bal:,.0f}<br>New Bal: <b>₹{target_v.pending_balance:,.0f}</b>"
@@ -53,7 +52,7 @@ def chat_response():
         # --- 1. SMART GREETING & DAILY BRIEFING ---
         if any(x in user_msg for x in intents["GREET"]):
             d_rev = db.session.query(func.sum(Entry.grand_total)).filter(Entry.date == today).scalar() or 0
-            missing = Entry.query.filter(Entry.date == today, (Entry.rr_no == '') | (Entry.rr_no == None)).count()
+            missing = open_counts(rule='missing_rr', entry_date=today).get('missing_rr', 0)
             res["text"] = f"""
                 <div class='space-y-1'>
                     <p class='text-blue-400 font-bold uppercase tracking-widest'>System_Online_v3.0</p>
@@ -68,11 +67,11 @@ def chat_response():
             data = db.session.query(
                 func.sum(Entry.grand_total),
                 func.sum(Entry.railway_chg)
-            ).filter(func.strftime('%Y-%m', Entry.date) == month_now).first()
+            ).filter(Entry.date >= month_start, Entry.date < month_end).first()
 
             total_rev = data[0] or 0
             rail_cost = data[1] or 0
-            margin = total_rev - rail_cost
+            margin = add(total_rev, -rail_cost)
 
             if 'profit' in user_msg or 'margin' in user_msg:
                 res["text"] = f"PROFIT_ANALYSIS:<br>Total Bill: ₹{total_rev:,.0f}<br>Rail Cost: ₹{rail_cost:,.0f}<br>Net Margin: <b class='text-green-400'>₹{margin:,.0f}</b>"
@@ -98,19 +97,24 @@ def chat_response():
 
         # --- 4. LOGISTICS & ROUTE OPTIMIZATION ---
         elif any(x in user_msg for x in intents["ROUTE"]):
-            top = db.session.query(Entry.ship_to, func.sum(Entry.parcels)).group_by(Entry.ship_to).order_by(func.sum(Entry.parcels).desc()).first()
+            # Served from the analytics cube instead of a GROUP BY over every entry
+            routes = federation.cube_query(bucket='year', group='route', measures=('parcels',),
+                                           top=1, order_by='parcels')['groups']
+            top = (routes[0]['label'], routes[0]['totals']['parcels']) if routes else None
             res["text"] = f"LOGISTICS_REPORT: <b>{top[0]}</b> is your high-volume hub with <b>{top[1]} parcels</b> handled." if top else "ROUTE_EMPTY."
 
         # --- 5. SYSTEM RECOVERY (Audit) ---
         elif any(x in user_msg for x in intents["ERR"]):
-            errors = Entry.query.filter((Entry.rr_no == '') | (Entry.rr_no == None)).count()
-            res["text"] = f"INTEGRITY_AUDIT: <b class='text-red-500'>{errors} anomalies</b> detected. Correct RR numbers to prevent billing delays."
+            counts = open_counts()
+            errors = sum(counts.values())
+            breakdown = "".join(f"<br>• {RULE_LABELS[rule]}: <b>{counts[rule]}</b>" for rule in RULE_LABELS if counts.get(rule))
+            res["text"] = f"INTEGRITY_AUDIT: <b class='text-red-500'>{errors} anomalies</b> detected.{breakdown}<br>Correct them to prevent billing delays."
             res["type"] = "error"
             res["link"] = "/view"
 
         # --- 6. LOGS & AUTH TRACE ---
         elif any(x in user_msg for x in intents["LOG"]):
-            logs = AuditLog.query.order_by(AuditLog.timestamp.desc()).limit(3).all()
+            logs = audit.recent(3)
             log_text = "<br>".join([f"• {l.username}: {l.action}" for l in logs])
             res["text"] = f"RECENT_TRACE_SEQUENCE:<br>{log_text}"
 
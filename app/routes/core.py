@@ -1,9 +1,12 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import date, datetime
 from app.models import Entry, Vendor, AuditLog
-from app.extensions import db
-from sqlalchemy import func
+from app.extensions import db, begin_write
+from app import anomalies, events, federation, pricing, response_cache
+from app.money import add, to_paise
+from sqlalchemy import delete, func, insert, literal, update
+from sqlalchemy import inspect as sa_inspect
 
 core_bp = Blueprint('core', __name__)
 
@@ -20,6 +23,52 @@ def safe_int(value):
         return int(value)
     except: return 0
 
+def build_entry(fields, vendor_obj=None, rates=None):
+    """
+    A new Entry from form-style fields (vendor, date, parcels, handling, railway,
+    transport, rr_no, from, to). Blank handling/transport are priced from the
+    vendor's rate on that date (rates: see pricing.price). Raises ValueError on
+    bad input; not added to the session.
+    """
+    # 1. Get Vendor
+    vendor_name = fields.get('vendor')
+    vendor_obj = vendor_obj or Vendor.query.filter_by(name=vendor_name).first()
+    if not vendor_obj:
+        raise ValueError("Vendor not found")
+
+    # 2. Get Inputs
+    parcels = safe_int(fields.get('parcels'))
+    entry_date = datetime.strptime(fields.get('date') or '', '%Y-%m-%d')
+
+    # 3. Get Raw Charges (blank handling/transport = price from the vendor's rate on that date)
+    auto_handling, auto_transport = pricing.price(vendor_obj, entry_date.date(), parcels, rates)
+    typed_handling = str(fields.get('handling') or '').strip()
+    typed_transport = str(fields.get('transport') or '').strip()
+    raw_handling = safe_float(typed_handling) if typed_handling else auto_handling
+    raw_railway = safe_float(fields.get('railway'))
+    raw_transport = safe_float(typed_transport) if typed_transport else auto_transport
+
+    # 4. ENFORCE VENDOR SETTINGS (If column disabled -> Charge is 0)
+    handling = raw_handling if vendor_obj.show_handling else 0.0
+    railway = raw_railway if vendor_obj.show_railway else 0.0
+    transport = raw_transport if vendor_obj.show_transport else 0.0
+
+    # 5. Calculate Total (in paise, so 0.1 + 0.2 is 0.3)
+    grand_total = add(handling, railway, transport)
+
+    return Entry(
+        date=entry_date,
+        vendor_id=vendor_obj.id,
+        ship_from=fields.get('from'),
+        ship_to=fields.get('to'),
+        rr_no=fields.get('rr_no'),
+        parcels=parcels,
+        handling_chg=handling,
+        railway_chg=railway,
+        transport_chg=transport,
+        grand_total=grand_total
+    )
+
 # --- 1. HOME (DASHBOARD) ---
 @core_bp.route('/', methods=['GET', 'POST'])
 @core_bp.route('/home', methods=['GET', 'POST'])
@@ -29,71 +78,42 @@ def home():
 
     if request.method == 'POST':
         try:
-            # 1. Get Vendor
-            vendor_name = request.form.get('vendor')
-            vendor_obj = Vendor.query.filter_by(name=vendor_name).first()
-            if not vendor_obj:
-                raise ValueError("Vendor not found")
-
-            # 2. Get Inputs
-            parcels = safe_int(request.form.get('parcels'))
-
-            # 3. Get Raw Charges
-            raw_handling = safe_float(request.form.get('handling'))
-            raw_railway = safe_float(request.form.get('railway'))
-            raw_transport = safe_float(request.form.get('transport'))
-
-            # 4. ENFORCE VENDOR SETTINGS (If column disabled -> Charge is 0)
-            handling = raw_handling if vendor_obj.show_handling else 0.0
-            railway = raw_railway if vendor_obj.show_railway else 0.0
-            transport = raw_transport if vendor_obj.show_transport else 0.0
-
-            # 5. Calculate Total
-            grand_total = handling + railway + transport
-
-            # 6. Create Entry
-            new_entry = Entry(
-                date=datetime.strptime(request.form['date'], '%Y-%m-%d'),
-                vendor_id=vendor_obj.id,
-                ship_from=request.form.get('from'),
-                ship_to=request.form.get('to'),
-                rr_no=request.form.get('rr_no'),
-                parcels=parcels,
-                handling_chg=handling,
-                railway_chg=railway,
-                transport_chg=transport,
-                grand_total=grand_total
-            )
+            new_entry = build_entry(request.form)
 
             db.session.add(new_entry)
+            db.session.flush()
+            anomalies.check_entry(new_entry, new_entry.vendor)
             db.session.commit()
+            events.publish(events.entry_event('created', new_entry.id, after=events.snapshot(new_entry)))
 
-            AuditLog.log(current_user, "ADD ENTRY", f"Added {parcels} parcels for {vendor_name}")
+            AuditLog.log(current_user, "ADD ENTRY", f"Added {new_entry.parcels} parcels for {new_entry.vendor.name}")
             flash('Entry Added Successfully!')
             return redirect(url_for('core.home'))
 
         except Exception as e:
             flash(f'Error: {str(e)}')
 
-    # Stats
-    today_entries = Entry.query.filter_by(date=today).all()
-    today_rev = sum(e.grand_total for e in today_entries)
-    today_parcels = sum(e.parcels for e in today_entries)
+    # Stats (cached until the next entry write; the page then follows /api/stream)
+    totals = events.today_totals()
     vendors = Vendor.query.all()
 
     return render_template('home.html',
                            today=today,
                            vendors=vendors,
-                           today_rev=today_rev,
-                           today_parcels=today_parcels)
+                           rates=pricing.rates_on(today),
+                           today_rev=totals['revenue'],
+                           today_parcels=totals['parcels'])
 
 # --- 2. VIEW DATA ---
 @core_bp.route('/view', methods=['GET'])
 @login_required
+@response_cache.cached('entry', 'vendor', 'archived_month', vary=federation.stamp)
 def view_data():
     month = request.args.get('month', datetime.today().strftime('%Y-%m'))
     vendor_id = request.args.get('vendor')
     mode = request.args.get('mode', 'normal')
+    branches = federation.branch_names()
+    branch = request.args.get('branch') if request.args.get('branch') in branches else None
 
     admin_mode = (mode == 'admin' and current_user.is_admin)
 
@@ -104,12 +124,9 @@ def view_data():
             default_vendor = Vendor.query.filter_by(is_default=True).first()
             vendor_id = str(default_vendor.id) if default_vendor else 'All'
 
-    query = Entry.query.filter(func.strftime('%Y-%m', Entry.date) == month)
-
-    if vendor_id and vendor_id != 'All':
-        query = query.filter_by(vendor_id=int(vendor_id))
-
-    entries = query.order_by(Entry.date.desc()).all()
+    # Live and archived rows for the month, plus other branches' rows when shards are configured
+    entries = federation.month_entries(month, None if vendor_id == 'All' else int(vendor_id),
+                                       newest_first=True, branch=branch)
     vendors = Vendor.query.all()
 
     return render_template('view_data.html',
@@ -117,15 +134,24 @@ def view_data():
                            month=month,
                            vendor=vendor_id,
                            vendors=vendors,
-                           admin_mode=admin_mode)
+                           admin_mode=admin_mode,
+                           branches=branches,
+                           branch=branch)
 
 # --- 3. DELETE ENTRY ---
 @core_bp.route('/entry/delete/<int:id>')
 @login_required
 def delete_entry(id):
     entry = Entry.query.get_or_404(id)
+    if entry.invoice_id is not None:
+        # Same rule as the bulk delete: an issued bill must keep agreeing with the ledger
+        flash(f'Entry #{id} is already invoiced and cannot be deleted')
+        return redirect(request.referrer or url_for('core.view_data'))
+    before = events.snapshot(entry)
+    anomalies.forget_entry(entry)
     db.session.delete(entry)
     db.session.commit()
+    events.publish(events.entry_event('deleted', id, before=before))
     flash('Entry Deleted')
     if request.referrer and 'view' in request.referrer:
         return redirect(request.referrer)
@@ -152,27 +178,47 @@ def edit_entry(id):
              # Get Vendor Object to check flags
              v_id = int(request.form['vendor'])
              vendor_obj = Vendor.query.get(v_id)
+             previous_rr = entry.rr_no
+             before = events.snapshot(entry)
 
-             entry.date = datetime.strptime(request.form['date'], '%Y-%m-%d')
-             entry.vendor_id = v_id
-             entry.rr_no = request.form.get('rr_no')
-             entry.ship_from = request.form.get('from')
-             entry.ship_to = request.form.get('to')
-             entry.parcels = safe_int(request.form.get('parcels'))
+             new_date = datetime.strptime(request.form['date'], '%Y-%m-%d').date()
+             parcels = safe_int(request.form.get('parcels'))
 
              # --- ENFORCE FLAGS ---
              raw_handling = safe_float(request.form.get('handling'))
              raw_railway = safe_float(request.form.get('railway'))
              raw_transport = safe_float(request.form.get('transport'))
 
-             entry.handling_chg = raw_handling if vendor_obj.show_handling else 0.0
-             entry.railway_chg = raw_railway if vendor_obj.show_railway else 0.0
-             entry.transport_chg = raw_transport if vendor_obj.show_transport else 0.0
+             handling = raw_handling if vendor_obj.show_handling else 0.0
+             railway = raw_railway if vendor_obj.show_railway else 0.0
+             transport = raw_transport if vendor_obj.show_transport else 0.0
+
+             # Billed entries keep what their invoice printed; only the RR number and route can change
+             if entry.invoice_id is not None:
+                 billed = (entry.vendor_id, entry.date, entry.parcels or 0,
+                           to_paise(entry.handling_chg or 0), to_paise(entry.railway_chg or 0),
+                           to_paise(entry.transport_chg or 0))
+                 if (v_id, new_date, parcels, to_paise(handling), to_paise(railway), to_paise(transport)) != billed:
+                     flash(f"Entry #{id} is already invoiced: only the RR number and route can change")
+                     return redirect(url_for('core.edit_entry', id=id))
+
+             entry.date = new_date
+             entry.vendor_id = v_id
+             entry.rr_no = request.form.get('rr_no')
+             entry.ship_from = request.form.get('from')
+             entry.ship_to = request.form.get('to')
+             entry.parcels = parcels
+             entry.handling_chg = handling
+             entry.railway_chg = railway
+             entry.transport_chg = transport
 
              # Recalculate Total
-             entry.grand_total = entry.handling_chg + entry.railway_chg + entry.transport_chg
+             entry.grand_total = add(entry.handling_chg, entry.railway_chg, entry.transport_chg)
 
+             db.session.flush()
+             anomalies.check_entry(entry, vendor_obj, previous_rr=previous_rr)
              db.session.commit()
+             events.publish(events.entry_event('updated', entry.id, before, events.snapshot(entry)))
              AuditLog.log(current_user, "EDIT ENTRY", f"Updated Entry #{entry.id}")
 
              flash("Entry Updated Successfully")
@@ -181,4 +227,231 @@ def edit_entry(id):
         except Exception as e:
             flash(f"Error: {e}")
 
-    return render_template('edit.html', entry=entry, vendors=vendors)
\ No newline at end of file
+    return render_template('edit.html', entry=entry, vendors=vendors, rates=pricing.rates_on(entry.date))
+
+# --- 6. BULK OPERATIONS (Multi-select on /view) ---
+# Each action is one set-based UPDATE/DELETE over the selected ids, in one
+# transaction, with one audit record for the whole batch.
+BULK_ACTIONS = ('delete', 'vendor', 'date', 'route')
+BULK_LIMIT = 1000
+# Invoiced entries are left alone by these: deleting, moving or re-dating one
+# would make its issued bill disagree with the ledger (as in pricing.reprice)
+BULK_SKIPS_INVOICED = ('delete', 'vendor', 'date')
+
+def _describe_ids(ids):
+    shown = ", ".join(f"#{i}" for i in ids[:8])
+    return shown + (f" +{len(ids) - 8} more" if len(ids) > 8 else "")
+
+def _bulk_values(action, payload):
+    """The SET clause for an update action, plus its audit summary. Totals are recomputed in SQL."""
+    if action == 'vendor':
+        vendor_obj = Vendor.query.get(safe_int(payload.get('vendor')))
+        if not vendor_obj:
+            raise ValueError("Vendor not found")
+
+        # Same rule as a single edit: a column the vendor has switched off is charged 0.
+        # These are the stored paise, so the new total is an exact integer sum
+        def charge(column, enabled):
+            return func.coalesce(column, literal(0)) if enabled else literal(0)
+
+        handling = charge(Entry.handling_chg, vendor_obj.show_handling)
+        railway = charge(Entry.railway_chg, vendor_obj.show_railway)
+        transport = charge(Entry.transport_chg, vendor_obj.show_transport)
+        values = {Entry.vendor_id: vendor_obj.id, Entry.handling_chg: handling, Entry.railway_chg: railway,
+                  Entry.transport_chg: transport, Entry.grand_total: handling + railway + transport}
+        return values, f"Moved {{count}} entries to {vendor_obj.name}"
+
+    if action == 'date':
+        try:
+            new_date = datetime.strptime(payload.get('date') or '', '%Y-%m-%d').date()
+        except ValueError:
+            raise ValueError("Pick a valid date")
+        return {Entry.date: new_date}, f"Re-dated {{count}} entries to {new_date.strftime('%d %b %Y')}"
+
+    ship_from = (payload.get('ship_from') or '').strip()
+    ship_to = (payload.get('ship_to') or '').strip()
+    if not ship_from and not ship_to:
+        raise ValueError("Enter a new origin or destination")
+    values = {}
+    if ship_from:
+        values[Entry.ship_from] = ship_from
+    if ship_to:
+        values[Entry.ship_to] = ship_to
+    return values, f"Set route of {{count}} entries to {ship_from or '(same)'} → {ship_to or '(same)'}"
+
+def apply_bulk(payload):
+    """Runs one bulk action and commits. Returns (affected ids, summary, invoiced entries skipped)."""
+    action = payload.get('action')
+    if action not in BULK_ACTIONS:
+        raise ValueError("Unknown bulk action")
+    try:
+        ids = sorted({int(i) for i in payload.get('ids') or []})
+    except (TypeError, ValueError):
+        raise ValueError("Invalid entry selection")
+    if not ids:
+        raise ValueError("No entries selected")
+    if len(ids) > BULK_LIMIT:
+        raise ValueError(f"Select at most {BULK_LIMIT} entries at a time")
+
+    rows = db.session.query(Entry.id, Entry.date, Entry.vendor_id, Entry.grand_total,
+                            Entry.parcels, Entry.rr_no, Entry.invoice_id).filter(Entry.id.in_(ids)).all()
+    if not rows:
+        raise ValueError("None of the selected entries exist")
+    skipped = 0
+    if action in BULK_SKIPS_INVOICED:
+        unbilled = [row for row in rows if row.invoice_id is None]
+        skipped = len(rows) - len(unbilled)
+        rows = unbilled
+        if not rows:
+            raise ValueError("The selected entries are all invoiced and stay as billed")
+    ids = [row.id for row in rows]
+    before = {row.id: events.snapshot(row) for row in rows}
+    selected = Entry.id.in_(ids)
+
+    if action == 'delete':
+        db.session.execute(delete(Entry).where(selected).execution_options(synchronize_session=False))
+        anomalies.forget_entries(ids, [row.rr_no for row in rows])
+        summary = "Deleted {count} entries"
+    else:
+        values, summary = _bulk_values(action, payload)
+        values[Entry.updated_at] = datetime.utcnow()
+        db.session.execute(update(Entry).where(selected).values(values)
+                           .execution_options(synchronize_session=False))
+        anomalies.check_entries(ids)
+    db.session.commit()
+
+    # Live counters: one event per row, after the commit
+    if action == 'delete':
+        for entry_id in ids:
+            events.publish(events.entry_event('deleted', entry_id, before=before[entry_id]))
+    else:
+        for row in db.session.query(Entry.id, Entry.date, Entry.vendor_id, Entry.grand_total,
+                                    Entry.parcels).filter(selected):
+            events.publish(events.entry_event('updated', row.id, before[row.id], events.snapshot(row)))
+
+    summary = summary.format(count=len(ids))
+    if skipped:
+        summary += f" ({skipped} invoiced left as billed)"
+    return ids, summary, skipped
+
+@core_bp.route('/entries/bulk', methods=['POST'])
+@login_required
+def bulk_entries():
+    payload = request.get_json(silent=True)
+    wants_json = payload is not None
+    if payload is None:
+        payload = request.form.to_dict()
+        payload['ids'] = request.form.getlist('ids')
+
+    try:
+        ids, summary, skipped = apply_bulk(payload)
+    except ValueError as e:
+        db.session.rollback()
+        if wants_json:
+            return jsonify({'error': str(e)}), 400
+        flash(f"Error: {e}")
+    else:
+        action = "BULK DELETE" if payload.get('action') == 'delete' else "BULK EDIT"
+        AuditLog.log(current_user, action, f"{summary}: {_describe_ids(ids)}"[:255])
+        if wants_json:
+            return jsonify({'action': payload.get('action'), 'count': len(ids), 'ids': ids, 'summary': summary,
+                            'skipped_invoiced': skipped})
+        flash(summary)
+
+    if request.referrer and 'view' in request.referrer:
+        return redirect(request.referrer)
+    return redirect(url_for('core.view_data'))
+
+# --- 7. BATCH ENTRY API (Queued entries from the counter) ---
+# POST /api/entries/batch  {"entries": [{"key": "<uuid>", "vendor": "Shiva", "date": "2024-05-01", "parcels": 3, ...}]}
+# Items use the same fields as the entry form plus a client-generated "key".
+# A key that is already stored is answered with the existing entry, so the
+# client can resend a whole batch after a timeout without creating doubles.
+# The batch is one transaction holding the write lock from the key lookup on,
+# so no other connection can store one of its keys meanwhile. Every item is
+# validated before anything is written (a bad item fails alone), then the
+# valid ones go in with one flush and one anomaly pass: the statement count
+# does not grow with the batch. A failure at commit saves none of them.
+BATCH_LIMIT = 200
+
+def _batch_item(item, vendors, stored, rates):
+    """Validates one queued item and builds its entry. Returns (result, entry or None); the id is set after the flush."""
+    key = str(item.get('key') or '').strip()
+    if not key or len(key) > 64:
+        return {'key': key, 'status': 'error', 'error': "Missing or invalid key"}, None
+
+    if key in stored:
+        # Stored before, or earlier in this batch (an Entry until the flush gives it an id)
+        return {'key': key, 'status': 'duplicate', 'id': stored[key]}, None
+
+    vendor_obj = vendors.get(item.get('vendor'))
+    if vendor_obj is None:
+        return {'key': key, 'status': 'error', 'error': "Vendor not found"}, None
+    try:
+        entry = build_entry(item, vendor_obj, rates)
+    except (ValueError, TypeError) as e:
+        return {'key': key, 'status': 'error', 'error': str(e) or "Invalid entry"}, None
+    entry.idempotency_key = key
+    stored[key] = entry
+    return {'key': key, 'status': 'created', 'id': entry}, entry
+
+def _insert_values(entry):
+    """A built Entry as insert() values; unset fields are left out so their column defaults apply."""
+    return {attr.key: getattr(entry, attr.key) for attr in sa_inspect(Entry).column_attrs
+            if getattr(entry, attr.key) is not None}
+
+@core_bp.route('/api/entries/batch', methods=['POST'])
+@login_required
+def entries_batch():
+    payload = request.get_json(silent=True) or {}
+    items = payload.get('entries')
+    if not isinstance(items, list) or not items:
+        return jsonify({'error': "Send a non-empty 'entries' list"}), 400
+    if len(items) > BATCH_LIMIT:
+        return jsonify({'error': f"Send at most {BATCH_LIMIT} entries per batch"}), 400
+
+    items = [item if isinstance(item, dict) else {} for item in items]
+    keys = [str(item.get('key') or '').strip() for item in items]
+    names = {item.get('vendor') for item in items if isinstance(item.get('vendor'), str)}
+
+    results, created = [], []
+    try:
+        begin_write(db.session)
+        stored = dict(db.session.query(Entry.idempotency_key, Entry.id).filter(Entry.idempotency_key.in_(keys)))
+        vendors = {v.name: v for v in Vendor.query.filter(Vendor.name.in_(names))}
+        rates = {}
+        for item in items:
+            result, entry = _batch_item(item, vendors, stored, rates)
+            results.append(result)
+            if entry is not None:
+                created.append(entry)
+
+        # One executemany (the ORM would INSERT row by row to read each id back), then one read for the ids
+        if created:
+            db.session.execute(insert(Entry), [_insert_values(entry) for entry in created])
+            created = sorted(Entry.query.filter(Entry.idempotency_key.in_([e.idempotency_key for e in created])),
+                             key=lambda entry: entry.id)
+        ids = {entry.idempotency_key: entry.id for entry in created}
+        for result in results:
+            if isinstance(result.get('id'), Entry):
+                result['id'] = ids[result['id'].idempotency_key]
+        anomalies.check_new_entries(created)
+
+        # Read before the commit expires them
+        snapshots = [(entry.id, events.snapshot(entry)) for entry in created]
+        parcels = sum(entry.parcels or 0 for entry in created)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        print(f"⚠️ Batch Entry Error: {e}")
+        return jsonify({'error': "Batch not saved, retry later"}), 503
+
+    for entry_id, snap in snapshots:
+        events.publish(events.entry_event('created', entry_id, after=snap))
+    if created:
+        AuditLog.log(current_user, "ADD ENTRY", f"Added {len(created)} entries ({parcels} parcels) from the entry queue")
+
+    return jsonify({'results': results,
+                    'created': len(created),
+                    'duplicates': sum(1 for r in results if r['status'] == 'duplicate'),
+                    'errors': sum(1 for r in results if r['status'] == 'error')})
@@ -0,0 +1,55 @@
+import json
+import queue
+import time
+from flask import Blueprint, Response, jsonify
+from flask_login import login_required
+from app import events
+
+events_bp = Blueprint('events', __name__)
+
+HEARTBEAT_SECONDS = 15
+# Streams end after a while and the browser reconnects on its own, which keeps
+# graceful restarts and worker recycling from waiting on idle dashboards.
+STREAM_SECONDS = 600
+
+
+def _sse(event_type, data):
+    return f"event: {event_type}\ndata: {json.dumps(data)}\n\n"
+
+# --- LIVE COUNTERS (Server-Sent Events) ---
+@events_bp.route('/api/stream')
+@login_required
+def stream():
+    # Read first: if this raises, no subscription has been taken yet
+    totals = events.today_totals()
+    subscriber = events.subscribe()
+    if subscriber is None:
+        return jsonify({'error': 'Too many live connections on this worker'}), 503, {'Retry-After': '30'}
+
+    # Runs after the request context is gone, so it must not touch the database
+    def generate():
+        try:
+            yield "retry: 5000\n\n"
+            yield _sse('totals', totals)
+            ends_at = time.monotonic() + STREAM_SECONDS
+            while time.monotonic() < ends_at:
+                try:
+                    event = subscriber.queue.get(timeout=HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    yield ": heartbeat\n\n"  # Also how a closed connection gets noticed
+                    continue
+                yield _sse(event['type'], event)
+        finally:
+            events.unsubscribe(subscriber)
+
+    response = Response(generate(), mimetype='text/event-stream',
+                        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'})
+    # A client gone before the first chunk closes a generator that never ran its finally
+    response.call_on_close(lambda: events.unsubscribe(subscriber))
+    return response
+
+# --- CURRENT TOTALS (JSON) ---
+@events_bp.route('/api/today')
+@login_required
+def today():
+    return jsonify(events.today_totals())
@@ -1,28 +1,32 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required, current_user
 from datetime import datetime, date
-from app.models import Entry, Vendor, AuditLog
-from app.extensions import db
-from sqlalchemy import func
-from num2words import num2words
+from app.models import Vendor, AuditLog, Invoice
+from app.invoicing import create_invoice
+from app import federation, response_cache
+from app.extensions import db, begin_write
 import calendar
 
 reports_bp = Blueprint('reports', __name__)
 
-# --- INVOICES SECTION (Unchanged) ---
+# --- INVOICES SECTION ---
 @reports_bp.route('/invoices')
 @login_required
+@response_cache.cached('vendor', 'invoice')
 def selection():
     today = datetime.today().strftime('%Y-%m')
     vendors = Vendor.query.all()
-    return render_template('invoices_select.html', today=today, vendors=vendors)
+    recent_invoices = Invoice.query.order_by(Invoice.created_at.desc()).limit(10).all()
+    return render_template('invoices_select.html', today=today, vendors=vendors,
+                           recent_invoices=recent_invoices)
 
-@reports_bp.route('/generate_bill')
+# POST: every call issues a numbered invoice, so prefetchers and crawlers must not reach it
+@reports_bp.route('/generate_bill', methods=['POST'])
 @login_required
 def generate_bill():
-    month = request.args.get('month')
-    vendor_id = request.args.get('vendor')
-    include_pending = request.args.get('include_pending')
+    month = request.form.get('month')
+    vendor_id = request.form.get('vendor')
+    include_pending = request.form.get('include_pending')
 
     if not month or not vendor_id:
         flash("Please select month and vendor")
@@ -33,139 +37,180 @@ def generate_bill():
         flash("Vendor not found")
         return redirect(url_for('reports.selection'))
 
-    display_name = vendor_obj.billing_name if vendor_obj.billing_name else vendor_obj.name
-    display_address = vendor_obj.billing_address if vendor_obj.billing_address else "Manipal / Udupi"
-
-    entries = Entry.query.filter(
-        func.strftime('%Y-%m', Entry.date) == month,
-        Entry.vendor_id == vendor_obj.id
-    ).order_by(Entry.date).all()
+    # Only entries not billed yet; anything already invoiced stays on its own bill.
+    # Archived months and other branches' entries are read through the facades like live ones.
+    # The write lock is taken first, so a second request (double click) waits and then reads
+    # these entries as billed instead of putting them on a second invoice.
+    begin_write(db.session)
+    entries = federation.month_entries(month, vendor_obj.id, unbilled_only=True)
 
     if not entries:
+        db.session.rollback()
+        latest = Invoice.query.filter_by(vendor_id=vendor_obj.id, month=month) \
+            .order_by(Invoice.id.desc()).first()
+        if latest:
+            flash(f"All entries for {vendor_obj.name} in {month} are already billed on {latest.invoice_no}")
+            return redirect(url_for('reports.view_invoice', invoice_id=latest.id))
+
         flash(f"No records found for {vendor_obj.name} in {month}")
         return redirect(url_for('reports.selection'))
 
-    total_parcels = sum(e.parcels for e in entries)
-    current_bill_total = sum(e.grand_total for e in entries)
-
-    pending_amount = 0.0
-    if include_pending == 'on':
-        pending_amount = vendor_obj.pending_balance
+    try:
+        invoice = create_invoice(vendor_obj, month, entries, include_pending == 'on', current_user)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        flash(f"Error generating invoice: {e}")
+        return redirect(url_for('reports.selection'))
 
-    grand_total = current_bill_total + pending_amount
-    invoice_no = f"INV-{month.replace('-','')}-{datetime.now().strftime('%d%H')}"
-    display_month = datetime.strptime(month, '%Y-%m').strftime('%B %Y')
+    AuditLog.log(current_user, "INVOICE", f"Generated invoice {invoice.invoice_no} for {vendor_obj.name} ({month})")
 
-    try:
-        total_words = num2words(grand_total, lang='en_IN') + " Rupees Only"
-    except:
-        total_words = f"{grand_total} Rupees Only"
+    # Redirect so a browser refresh reprints instead of billing again
+    return redirect(url_for('reports.view_invoice', invoice_id=invoice.id))
 
-    AuditLog.log(current_user, "INVOICE", f"Generated invoice for {vendor_obj.name} ({month})")
+@reports_bp.route('/invoice/<int:invoice_id>')
+@login_required
+def view_invoice(invoice_id):
+    invoice = Invoice.query.get_or_404(invoice_id)
+    display_month = datetime.strptime(invoice.month, '%Y-%m').strftime('%B %Y')
 
     return render_template('invoice_print.html',
-                           vendor=display_name,
-                           address=display_address,
-                           vendor_settings=vendor_obj,
-                           entries=entries,
+                           vendor=invoice.bill_to_name,
+                           address=invoice.bill_to_address,
+                           vendor_settings=invoice,  # Snapshot of the show_* toggles
+                           entries=invoice.lines,
                            month=display_month,
-                           invoice_no=invoice_no,
-                           total_parcels=total_parcels,
-                           current_bill_total=current_bill_total,
-                           pending_amount=pending_amount,
-                           grand_total=grand_total,
-                           total_words=total_words)
-
-# --- ANALYTICS DASHBOARD (Updated with Filters) ---
+                           invoice_no=invoice.invoice_no,
+                           total_parcels=invoice.total_parcels,
+                           current_bill_total=invoice.current_bill_total,
+                           pending_amount=invoice.pending_amount,
+                           grand_total=invoice.grand_total,
+                           total_words=invoice.total_words)
+
+@reports_bp.route('/api/invoices')
+@login_required
+def invoice_history():
+    query = Invoice.query
+    vendor_id = request.args.get('vendor')
+    if vendor_id and vendor_id != 'All':
+        query = query.filter(Invoice.vendor_id == int(vendor_id))
+    month = request.args.get('month')
+    if month:
+        query = query.filter(Invoice.month == month)
+
+    limit = min(request.args.get('limit', 50, type=int), 200)
+    invoices = query.order_by(Invoice.created_at.desc()).limit(limit).all()
+
+    return jsonify([{
+        'id': inv.id,
+        'invoice_no': inv.invoice_no,
+        'vendor_id': inv.vendor_id,
+        'month': inv.month,
+        'created_at': inv.created_at.isoformat(),
+        'created_by': inv.created_by,
+        'grand_total': inv.grand_total,
+        'url': url_for('reports.view_invoice', invoice_id=inv.id),
+    } for inv in invoices])
+
+# --- ANALYTICS DASHBOARD (Served from the in-memory cube) ---
+TREND_PERIODS = {'month': 'Months', 'quarter': 'Quarters', 'year': 'Years'}
+
+def _periods_back(today, period, count):
+    """First day of the period that starts `count - 1` periods before today's."""
+    if period == 'year':
+        return date(today.year - count + 1, 1, 1)
+    months_per = 3 if period == 'quarter' else 1
+    first_month = (today.month - 1) // months_per * months_per
+    index = today.year * 12 + first_month - (count - 1) * months_per
+    return date(index // 12, index % 12 + 1, 1)
+
 @reports_bp.route('/analytics')
 @login_required
+@response_cache.cached('entry', 'vendor', 'archived_month', vary=federation.stamp)
 def analytics():
     today = date.today()
-    current_month_str = today.strftime('%Y-%m')
+    month_start = today.replace(day=1)
+    month_end = today.replace(day=calendar.monthrange(today.year, today.month)[1])
 
-    # 1. GET FILTER
+    # 1. GET FILTERS
     vendor_id = request.args.get('vendor')
-
-    # 2. PREPARE BASE QUERIES
-    # Current Month Query (For Cards)
-    current_month_query = Entry.query.filter(func.strftime('%Y-%m', Entry.date) == current_month_str)
-
-    # Trend Query (For Line Chart)
-    trend_query = db.session.query(
-        func.strftime('%Y-%m', Entry.date).label('month'),
-        func.sum(Entry.grand_total).label('revenue')
-    )
-
-    # Routes Query
-    route_query = db.session.query(
-        Entry.ship_to,
-        func.count(Entry.id).label('count')
-    )
-
-    # Daily Query
-    daily_query = db.session.query(
-        func.strftime('%d', Entry.date).label('day'),
-        func.sum(Entry.parcels).label('parcels')
-    ).filter(func.strftime('%Y-%m', Entry.date) == current_month_str)
-
-    # 3. APPLY VENDOR FILTER
-    if vendor_id and vendor_id != 'All':
-        v_id = int(vendor_id)
-        current_month_query = current_month_query.filter(Entry.vendor_id == v_id)
-        trend_query = trend_query.filter(Entry.vendor_id == v_id)
-        route_query = route_query.filter(Entry.vendor_id == v_id)
-        daily_query = daily_query.filter(Entry.vendor_id == v_id)
-
-    # 4. EXECUTE QUERIES
-    # KPI Cards
-    current_month_entries = current_month_query.all()
-    kpi_revenue = sum(e.grand_total for e in current_month_entries)
-    kpi_parcels = sum(e.parcels for e in current_month_entries)
+    v_id = int(vendor_id) if vendor_id and vendor_id != 'All' else None
+    period = request.args.get('period', 'month')
+    if period not in TREND_PERIODS:
+        period = 'month'
+
+    # 2. KPI CARDS (Current Month; every query also covers the KPS_SHARDS branches)
+    kpi = federation.cube_query(month_start, month_end, bucket='month', group='vendor', vendor_id=v_id,
+                                measures=('entries', 'parcels', 'grand_total'))
+    kpi_revenue = kpi['totals']['grand_total']
+    kpi_parcels = kpi['totals']['parcels']
     kpi_avg_price = (kpi_revenue / kpi_parcels) if kpi_parcels > 0 else 0
-    kpi_vendors_active = len(set(e.vendor_id for e in current_month_entries))
-
-    # Revenue Trend
-    monthly_data = trend_query.group_by('month').order_by('month').limit(6).all()
-    trend_labels = []
-    trend_data = []
-    for d in monthly_data:
-        if d.month:
-            trend_labels.append(datetime.strptime(d.month, '%Y-%m').strftime('%b'))
-            trend_data.append(d.revenue)
-
-    # Vendor Share (Pie Chart)
-    vendor_share_query = db.session.query(
-        Vendor.name,
-        func.sum(Entry.grand_total).label('total_rev')
-    ).join(Vendor, Entry.vendor_id == Vendor.id)
-
-    if vendor_id and vendor_id != 'All':
-         vendor_share_query = vendor_share_query.filter(Entry.vendor_id == int(vendor_id))
-
-    vendor_share_results = vendor_share_query.group_by(Vendor.name).order_by(func.sum(Entry.grand_total).desc()).limit(5).all()
-
-    pie_labels = [row[0] for row in vendor_share_results]
-    pie_data = [row[1] for row in vendor_share_results]
-
-    # Top Routes
-    top_routes = route_query.group_by(Entry.ship_to).order_by(func.count(Entry.id).desc()).limit(5).all()
-
-    # Daily Activity
-    daily_data = daily_query.group_by('day').all()
-    days_in_month = calendar.monthrange(today.year, today.month)[1]
-    daily_map = {int(d.day): d.parcels for d in daily_data}
-
-    bar_labels = [str(i) for i in range(1, days_in_month + 1)]
-    bar_data = [daily_map.get(i, 0) for i in range(1, days_in_month + 1)]
-
-    # 5. RENDER
+    kpi_vendors_active = sum(1 for g in kpi['groups'] if g['totals']['entries'] > 0)
+
+    # 3. REVENUE TREND (Latest 6 periods, oldest first)
+    trend = federation.cube_query(_periods_back(today, period, 6), month_end, bucket=period, vendor_id=v_id,
+                                  measures=('grand_total',))
+    trend_labels = [_trend_label(label, period) for label in trend['labels']]
+    trend_series = trend['groups'][0]['series']['grand_total'] if trend['groups'] else [0] * len(trend_labels)
+
+    # 4. VENDOR SHARE (All time, Top 5)
+    share = federation.cube_query(bucket='year', group='vendor', vendor_id=v_id, measures=('grand_total',), top=5)
+    pie_labels = [g['label'] for g in share['groups']]
+    pie_data = [g['totals']['grand_total'] for g in share['groups']]
+
+    # 5. TOP ROUTES (All time, by number of entries)
+    routes = federation.cube_query(bucket='year', group='route', vendor_id=v_id, measures=('entries',),
+                                   top=5, order_by='entries')
+    top_routes = [(g['label'], g['totals']['entries']) for g in routes['groups']]
+
+    # 6. DAILY ACTIVITY (Current Month)
+    daily = federation.cube_query(month_start, month_end, bucket='day', vendor_id=v_id, measures=('parcels',))
+    bar_labels = [str(i) for i in range(1, month_end.day + 1)]
+    bar_data = daily['groups'][0]['series']['parcels'] if daily['groups'] else [0] * len(bar_labels)
+
+    # 7. RENDER
     return render_template('analytics.html',
                            vendors=Vendor.query.all(), # Passed for dropdown
                            selected_vendor=vendor_id,  # To maintain selection state
                            kpi_revenue=kpi_revenue, kpi_parcels=kpi_parcels,
                            kpi_avg_price=round(kpi_avg_price, 2), kpi_vendors=kpi_vendors_active,
                            current_month_name=today.strftime('%B'),
-                           trend_labels=trend_labels, trend_data=trend_data,
+                           current_month_key=today.strftime('%Y-%m'),
+                           period=period, trend_periods=TREND_PERIODS,
+                           trend_labels=trend_labels, trend_data=trend_series,
                            pie_labels=pie_labels, pie_data=pie_data,
                            bar_labels=bar_labels, bar_data=bar_data,
-                           top_routes=top_routes)
\ No newline at end of file
+                           top_routes=top_routes)
+
+def _trend_label(label, period):
+    if period == 'month':
+        return datetime.strptime(label, '%Y-%m').strftime('%b')
+    return label
+
+# --- ANALYTICS API (JSON) ---
+# GET /api/analytics?start=2024-01-01&end=2024-12-31&bucket=quarter&group=route&vendor=3&top=10
+@reports_bp.route('/api/analytics')
+@login_required
+def analytics_api():
+    try:
+        start = request.args.get('start')
+        end = request.args.get('end')
+        start = datetime.strptime(start, '%Y-%m-%d').date() if start else None
+        end = datetime.strptime(end, '%Y-%m-%d').date() if end else None
+        vendor_id = request.args.get('vendor', type=int)
+        measures = tuple(m for m in request.args.get('measures', '').split(',') if m) or None
+
+        kwargs = {}
+        if measures:
+            kwargs['measures'] = measures
+        result = federation.cube_query(start, end,
+                                       bucket=request.args.get('bucket', 'month'),
+                                       group=request.args.get('group') or None,
+                                       vendor_id=vendor_id,
+                                       route=request.args.get('route') or None,
+                                       top=request.args.get('top', type=int),
+                                       **kwargs)
+    except (ValueError, KeyError) as e:
+        return jsonify({'error': str(e)}), 400
+
+    return jsonify(result)
@@ -0,0 +1,47 @@
+from flask import Blueprint, request, jsonify, url_for
+from flask_login import login_required
+from app.search import search_entries
+from app import archive
+
+search_bp = Blueprint('search', __name__)
+
+# --- ENTRY SEARCH (JSON) ---
+# GET /api/search?q=rr12&page=1&per_page=25&vendor=3
+@search_bp.route('/api/search')
+@login_required
+def search():
+    q = request.args.get('q', '').strip()
+    page = max(request.args.get('page', 1, type=int), 1)
+    per_page = min(max(request.args.get('per_page', 25, type=int), 1), 100)
+    vendor_id = request.args.get('vendor', type=int)
+
+    try:
+        rows, has_more = search_entries(q, page=page, per_page=per_page, vendor_id=vendor_id)
+    except Exception as e:
+        print(f"⚠️ Search Failed: {e}")
+        return jsonify({'error': 'Search index unavailable. Run "flask db upgrade".'}), 503
+
+    results = []
+    for row in rows:
+        # Raw SQL returns the stored ISO date string, not a date object
+        row_date = str(row['date'])[:10]
+        results.append({
+            'id': row['id'],
+            'date': row_date,
+            'vendor_id': row['vendor_id'],
+            'vendor': row['vendor_name'],
+            'rr_no': row['rr_no'],
+            'ship_from': row['ship_from'],
+            'ship_to': row['ship_to'],
+            'parcels': row['parcels'],
+            'grand_total': row['grand_total'],
+            'invoiced': row['invoice_id'] is not None,
+            'view_url': url_for('core.view_data', month=row_date[:7], vendor=row['vendor_id'], mode='admin'),
+            'edit_url': url_for('core.edit_entry', id=row['id']),
+        })
+
+    # Archived months are not in the index (see app/search.py)
+    archived = archive.archived_months()
+    return jsonify({'query': q, 'page': page, 'per_page': per_page,
+                    'has_more': has_more, 'results': results,
+                    'archived_through': max(archived) if archived else None})
@@ -0,0 +1,92 @@
+import re
+from sqlalchemy import text
+from app.extensions import db
+
+# --- FULL-TEXT SEARCH (SQLite FTS5) ---
+# entry_fts mirrors the searchable columns of each entry (rowid = entry.id)
+# plus the vendor name. Triggers keep it in sync, so no application code has
+# to remember to update it. Search covers live months only: archiving a month
+# (app/archive.py) deletes its live rows, and the delete trigger drops them
+# from the index. /api/search reports the last archived month so the UI can say so.
+FTS_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS entry_fts USING fts5(
+           rr_no, ship_from, ship_to, vendor_name,
+           tokenize = 'unicode61', prefix = '2 3'
+       )""",
+    """CREATE TRIGGER IF NOT EXISTS entry_fts_insert AFTER INSERT ON entry BEGIN
+           INSERT INTO entry_fts (rowid, rr_no, ship_from, ship_to, vendor_name)
+           VALUES (new.id, new.rr_no, new.ship_from, new.ship_to,
+                   (SELECT name FROM vendor WHERE id = new.vendor_id));
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS entry_fts_delete AFTER DELETE ON entry BEGIN
+           DELETE FROM entry_fts WHERE rowid = old.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS entry_fts_update
+       AFTER UPDATE OF rr_no, ship_from, ship_to, vendor_id ON entry BEGIN
+           UPDATE entry_fts
+              SET rr_no = new.rr_no, ship_from = new.ship_from, ship_to = new.ship_to,
+                  vendor_name = (SELECT name FROM vendor WHERE id = new.vendor_id)
+            WHERE rowid = new.id;
+       END""",
+    """CREATE TRIGGER IF NOT EXISTS entry_fts_vendor_rename AFTER UPDATE OF name ON vendor BEGIN
+           UPDATE entry_fts SET vendor_name = new.name
+            WHERE rowid IN (SELECT id FROM entry WHERE vendor_id = new.id);
+       END""",
+]
+
+def create_search_schema():
+    for ddl in FTS_DDL:
+        db.session.execute(text(ddl))
+
+
+def rebuild_index():
+    """Re-fills entry_fts from the live tables. Returns the number of rows indexed."""
+    db.session.execute(text("DELETE FROM entry_fts"))
+    result = db.session.execute(text("""
+        INSERT INTO entry_fts (rowid, rr_no, ship_from, ship_to, vendor_name)
+        SELECT e.id, e.rr_no, e.ship_from, e.ship_to, v.name
+          FROM entry e LEFT JOIN vendor v ON v.id = e.vendor_id
+    """))
+    return result.rowcount
+
+
+# --- QUERY ---
+TOKEN_RE = re.compile(r'\w+', re.UNICODE)
+
+
+def build_match(query):
+    """
+    Turns free text into an FTS5 prefix query: 'rr12 udu' -> '"rr12"* "udu"*'.
+    Every token must match. Returns None when there is nothing to search for.
+    """
+    tokens = TOKEN_RE.findall(query or '')[:8]
+    if not tokens:
+        return None
+    return ' '.join(f'"{token}"*' for token in tokens)
+
+
+def search_entries(query, page=1, per_page=25, vendor_id=None):
+    """
+    Ranked prefix search. RR numbers weigh most, then vendor and destination.
+    Returns (rows, has_more); one extra row is fetched instead of counting matches.
+    """
+    match = build_match(query)
+    if not match:
+        return [], False
+
+    sql = """
+        SELECT e.id, e.date, e.rr_no, e.ship_from, e.ship_to, e.parcels, e.total_paise / 100.0 AS grand_total,
+               e.vendor_id, f.vendor_name, e.invoice_id,
+               bm25(entry_fts, 10.0, 1.0, 3.0, 2.0) AS rank
+          FROM entry_fts f
+          JOIN entry e ON e.id = f.rowid
+         WHERE entry_fts MATCH :match
+    """
+    params = {'match': match, 'limit': per_page + 1, 'offset': (page - 1) * per_page}
+    if vendor_id:
+        sql += " AND e.vendor_id = :vendor_id"
+        params['vendor_id'] = vendor_id
+    sql += " ORDER BY rank, e.date DESC LIMIT :limit OFFSET :offset"
+
+    rows = db.session.execute(text(sql), params).mappings().all()
+    return rows[:per_page], len(rows) > per_page
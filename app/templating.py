@@ -0,0 +1,121 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from flask import g, before_render_template, template_rendered
+from jinja2 import FileSystemBytecodeCache, nodes
+from jinja2.ext import Extension
+from app import metrics, versions
+
+
+# --- FRAGMENT CACHE (LRU) ---
+class FragmentCache:
+    def __init__(self, maxsize=256):
+        self.maxsize = maxsize
+        self._items = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            value = self._items.get(key)
+            if value is not None:
+                self._items.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._items[key] = value
+            self._items.move_to_end(key)
+            while len(self._items) > self.maxsize:
+                self._items.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._items.clear()
+
+    def __len__(self):
+        return len(self._items)
+
+
+class FragmentCacheExtension(Extension):
+    """
+    Adds a {% cache %} tag. The first argument names the fragment, the rest
+    are the version inputs it depends on:
+
+        {% cache 'vendor_select', vendor_version, selected %} ... {% endcache %}
+
+    Anything the fragment renders that is not in the key will go stale,
+    so list every input explicitly.
+    """
+    tags = {'cache'}
+
+    def __init__(self, environment):
+        super().__init__(environment)
+        environment.extend(fragment_cache=FragmentCache())
+
+    def parse(self, parser):
+        lineno = next(parser.stream).lineno
+        args = [parser.parse_expression()]
+        while parser.stream.skip_if('comma'):
+            args.append(parser.parse_expression())
+        body = parser.parse_statements(('name:endcache',), drop_needle=True)
+        return nodes.CallBlock(self.call_method('_render_cached', [nodes.List(args)]), [], [], body).set_lineno(lineno)
+
+    def _render_cached(self, key, caller):
+        cache = self.environment.fragment_cache
+        key = tuple(key)
+        html = cache.get(key)
+        if html is not None:
+            metrics.incr('fragment_cache.hit')
+            return html
+
+        metrics.incr('fragment_cache.miss')
+        html = caller()
+        cache.set(key, html)
+        return html
+
+
+# --- RENDER TIMING ---
+def _render_started(sender, template, context, **extra):
+    g.setdefault('_render_started', {})[template.name] = time.perf_counter()
+
+
+def _render_finished(sender, template, context, **extra):
+    started = g.get('_render_started', {}).pop(template.name, None)
+    if started is not None:
+        metrics.observe(f'render.{template.name}', time.perf_counter() - started)
+
+
+# --- SETUP ---
+def init_app(app):
+    # Must run before anything touches app.jinja_env, which is built lazily
+    options = dict(app.jinja_options)
+    options['extensions'] = list(options.get('extensions', ())) + [FragmentCacheExtension]
+
+    bytecode_dir = app.config.get('JINJA_BYTECODE_DIR')
+    if bytecode_dir:
+        os.makedirs(bytecode_dir, exist_ok=True)
+        options['bytecode_cache'] = FileSystemBytecodeCache(bytecode_dir)
+    app.jinja_options = options
+
+    app.jinja_env.fragment_cache.maxsize = app.config.get('FRAGMENT_CACHE_SIZE', 256)
+
+    @app.context_processor
+    def inject_cache_versions():
+        return {'vendor_version': versions.get('vendor'), 'rate_version': versions.get('vendor_rate'),
+                'user_version': versions.get('user')}
+
+    before_render_template.connect(_render_started, app)
+    template_rendered.connect(_render_finished, app)
+
+
+def warm_templates(app):
+    """
+    Compiles every template once so the bytecode cache is populated before
+    workers fork. Returns the number of templates compiled.
+    """
+    count = 0
+    for name in app.jinja_env.list_templates(extensions=['html']):
+        app.jinja_env.get_template(name)
+        count += 1
+    return count
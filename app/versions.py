@@ -0,0 +1,105 @@
+import os
+import threading
+import time
+from itertools import chain
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# --- TABLE VERSION COUNTERS ---
+# Every committed write bumps a counter for the tables it touched. Caches
+# use these counters as part of their keys, so a write anywhere makes the
+# old entries unreachable without having to track them down.
+#
+# With TABLE_VERSION_DIR set, each table gets a marker file whose mtime is
+# the version, which lets every worker process see every other worker's writes.
+_lock = threading.Lock()
+_local = {}
+_directory = None
+
+
+def init_app(app):
+    global _directory
+    _directory = app.config.get('TABLE_VERSION_DIR')
+    if _directory:
+        os.makedirs(_directory, exist_ok=True)
+
+
+def get(table):
+    if _directory:
+        try:
+            return os.stat(os.path.join(_directory, table)).st_mtime_ns
+        except FileNotFoundError:
+            return 0
+    return _local.get(table, 0)
+
+
+def get_many(tables):
+    return tuple(get(t) for t in tables)
+
+
+def file_stamp(path):
+    """
+    Version of a SQLite file written by another server, which bumps no
+    counters here: commits land in the -wal file and checkpoints in the file itself.
+    """
+    stamp = []
+    for name in (path, path + '-wal'):
+        try:
+            st = os.stat(name)
+            stamp += [st.st_mtime_ns, st.st_size]
+        except FileNotFoundError:
+            stamp += [0, 0]
+    return tuple(stamp)
+
+
+def bump(*tables):
+    with _lock:
+        for table in tables:
+            _local[table] = _local.get(table, 0) + 1
+            if _directory:
+                path = os.path.join(_directory, table)
+                try:
+                    previous = os.stat(path).st_mtime_ns
+                except FileNotFoundError:
+                    open(path, 'a').close()
+                    previous = 0
+                # Never move backwards, even if two bumps land on the same clock tick
+                stamp = max(time.time_ns(), previous + 1)
+                os.utime(path, ns=(stamp, stamp))
+
+
+# --- SESSION HOOKS ---
+# Tables are collected while the transaction is open and only bumped once it
+# commits, so a rolled back write never invalidates anything.
+def _pending(session):
+    return session.info.setdefault('versioned_tables', set())
+
+
+@event.listens_for(Session, 'after_flush')
+def _collect_flushed(session, flush_context):
+    pending = _pending(session)
+    for obj in chain(session.new, session.dirty, session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            pending.add(table.name)
+
+
+@event.listens_for(Session, 'do_orm_execute')
+def _collect_bulk(orm_execute_state):
+    # Query.update() / Query.delete() and 2.0-style update()/delete() skip the flush
+    if orm_execute_state.is_update or orm_execute_state.is_delete or orm_execute_state.is_insert:
+        pending = _pending(orm_execute_state.session)
+        for mapper in orm_execute_state.all_mappers:
+            pending.add(mapper.local_table.name)
+
+
+@event.listens_for(Session, 'after_commit')
+def _bump_committed(session):
+    pending = session.info.pop('versioned_tables', None)
+    if pending:
+        bump(*pending)
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_pending(session):
+    session.info.pop('versioned_tables', None)
@@ -0,0 +1,49 @@
+import multiprocessing
+import os
+
+# --- GUNICORN (Production Server) ---
+# Run 'flask db upgrade' first, then:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# Every knob below can be overridden from the environment (KPS_WORKERS=4 ...).
+#
+# Deploying new code: preload_app means a plain HUP only restarts workers
+# from the already loaded code. Send USR2 to start a new master on the new
+# code, then TERM the old master once the new workers are up.
+bind = os.environ.get('KPS_BIND', '0.0.0.0:8000')
+pidfile = os.environ.get('KPS_PIDFILE') or None
+
+# --- WORKERS ---
+# SQLite takes one writer at a time, so a few processes with a handful of
+# threads each beats many single-threaded workers queueing on the write lock.
+# Threads also cover the time spent waiting on that lock. Every open live
+# counter stream (/api/stream) holds a thread, capped by KPS_MAX_STREAMS.
+workers = int(os.environ.get('KPS_WORKERS', min(multiprocessing.cpu_count() + 1, 4)))
+threads = int(os.environ.get('KPS_THREADS', 8))
+worker_class = 'gthread'
+
+# Import the app once in the master and fork it, instead of once per worker
+preload_app = True
+
+# --- TIMEOUTS & RECYCLING ---
+timeout = int(os.environ.get('KPS_TIMEOUT', 60))       # Kill a worker stuck on one request
+graceful_timeout = int(os.environ.get('KPS_GRACEFUL_TIMEOUT', 30))
+keepalive = 5
+
+# Replace each worker after a few thousand requests so slow leaks never pile
+# up; the jitter keeps them from all restarting at the same moment.
+max_requests = int(os.environ.get('KPS_MAX_REQUESTS', 2000))
+max_requests_jitter = int(os.environ.get('KPS_MAX_REQUESTS_JITTER', 200))
+
+# --- LOGGING ---
+accesslog = os.environ.get('KPS_ACCESS_LOG') or None   # '-' for stdout
+errorlog = '-'
+loglevel = os.environ.get('KPS_LOG_LEVEL', 'info')
+
+
+def post_fork(server, worker):
+    # Pooled SQLite connections must not be shared across a fork
+    from wsgi import app
+    from app.extensions import db
+
+    with app.app_context():
+        db.engine.dispose(close=False)
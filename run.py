@@ -3,4 +3,12 @@ from app import create_app
 app = create_app()
 
 if __name__ == '__main__':
-    app.run(debug=True)
\ No newline at end of file
+    # The dev server is a single process, so it can bring its own schema up to date
+    from app import migrations
+    with app.app_context():
+        migrations.upgrade()
+        migrations.seed_admin()
+
+    # Development only: set FLASK_DEBUG=1 for the reloader and debugger.
+    # Production runs under gunicorn (see gunicorn.conf.py).
+    app.run(threaded=True)
@@ -0,0 +1,131 @@
+"""
+Read-model benchmark.
+
+Loads one month of N entries the way the ledger view and billing did before
+(ORM Entry instances, vendor through the relationship) and the way they do
+now (app.readmodels.EntryRow tuples with the vendor name joined in), and
+touches every field a listing renders. Reports the best wall time and the
+tracemalloc peak of each path.
+
+Usage:
+    python scripts/bench_readmodel.py                       # 10k, 100k and 1M rows
+    python scripts/bench_readmodel.py --sizes 10000 --runs 5
+"""
+import argparse
+import gc
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import date
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+MONTH = '2024-05'
+
+
+def seed(db, Entry, Vendor, count):
+    from sqlalchemy import insert
+    from app import pricing
+
+    for i in range(20):
+        vendor = Vendor(name=f'Vendor {i}')
+        db.session.add(vendor)
+        db.session.flush()
+        pricing.set_rate(vendor, pricing.OPENING_DATE, 70.0, 0.0)
+    db.session.commit()
+    rng = random.Random(count)
+    for start in range(0, count, 50000):
+        rows = []
+        for i in range(start, min(start + 50000, count)):
+            parcels = rng.randint(1, 12)
+            rows.append({'date': date(2024, 5, rng.randint(1, 31)), 'vendor_id': rng.randint(1, 20),
+                         'ship_from': 'Mumbai', 'ship_to': 'Udupi', 'rr_no': f'RR{i}', 'parcels': parcels,
+                         'handling_chg': parcels * 70.0, 'railway_chg': 20.0, 'transport_chg': 0.0,
+                         'grand_total': parcels * 70.0 + 20.0})
+        db.session.execute(insert(Entry), rows)
+    db.session.commit()
+
+
+def orm_path(Entry):
+    from app import archive
+
+    start, end = archive.month_bounds(MONTH)
+    return Entry.query.filter(Entry.date >= start, Entry.date < end).all()
+
+
+def readmodel_path(Entry):
+    from app import archive
+    from app.readmodels import entry_select, entry_rows
+
+    start, end = archive.month_bounds(MONTH)
+    return entry_rows(entry_select().where(Entry.date >= start, Entry.date < end))
+
+
+def render(rows):
+    """What view_data.html reads from each row."""
+    total = 0.0
+    for e in rows:
+        total += e.grand_total
+        (e.id, e.date, e.vendor.name, e.rr_no, e.ship_from, e.ship_to, e.parcels,
+         e.handling_chg, e.railway_chg, e.transport_chg, e.archived)
+    return total
+
+
+def measure(db, load, Entry, runs):
+    """(best seconds, peak MiB); the session is cleared between runs like between requests."""
+    best = None
+    for _ in range(runs):
+        db.session.remove()
+        gc.collect()
+        t0 = time.perf_counter()
+        render(load(Entry))
+        elapsed = time.perf_counter() - t0
+        best = elapsed if best is None else min(best, elapsed)
+
+    db.session.remove()
+    gc.collect()
+    tracemalloc.start()
+    rows = load(Entry)
+    render(rows)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    del rows
+    return best, peak / (1024 * 1024)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='10000,100000,1000000', help='Comma-separated row counts.')
+    parser.add_argument('--runs', type=int, default=3, help='Timed runs per path; the best is reported.')
+    args = parser.parse_args()
+
+    from app import create_app, migrations
+    from app.extensions import db
+    from app.models import Entry, Vendor
+
+    print(f"{'rows':>9} | {'orm ms':>9} {'orm MiB':>8} | {'rows ms':>9} {'rows MiB':>8} | {'speedup':>7} {'memory':>7}")
+    for size in [int(s) for s in args.sizes.split(',') if s.strip()]:
+        workdir = tempfile.mkdtemp(prefix='kps-readmodel-')
+        os.chdir(workdir)
+        os.makedirs('instance', exist_ok=True)
+        app = create_app()
+        with app.app_context():
+            migrations.upgrade()
+            seed(db, Entry, Vendor, size)
+            orm_s, orm_mb = measure(db, orm_path, Entry, args.runs)
+            rows_s, rows_mb = measure(db, readmodel_path, Entry, args.runs)
+            db.session.remove()
+            db.engine.dispose()
+        print(f"{size:>9} | {orm_s * 1000:>9.0f} {orm_mb:>8.1f} | {rows_s * 1000:>9.0f} {rows_mb:>8.1f} | "
+              f"{orm_s / rows_s:>6.1f}x {orm_mb / rows_mb:>6.1f}x")
+        os.chdir(ROOT)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == '__main__':
+    main()
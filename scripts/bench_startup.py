@@ -0,0 +1,128 @@
+"""
+Startup benchmark.
+
+Measures what a freshly forked worker pays before it can serve:
+  * `python -X importtime` import cost per top-level package
+  * wall time for import, create_app() and the first request
+
+Usage:
+    python scripts/bench_startup.py                  # this checkout
+    python scripts/bench_startup.py --baseline HEAD~1 # delta against a git ref
+"""
+import argparse
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Runs inside a clean interpreter. The schema is created before the clock
+# starts for the first request, because workers no longer create it themselves.
+PROBE = r"""
+import json, os, sys, time
+t0 = time.perf_counter()
+from app import create_app
+t1 = time.perf_counter()
+app = create_app()
+t2 = time.perf_counter()
+with app.app_context():
+    from app.extensions import db
+    try:
+        from app import migrations
+        migrations.upgrade()
+    except ImportError:
+        db.create_all()
+t3 = time.perf_counter()
+client = app.test_client()
+status = client.get('/login').status_code
+t4 = time.perf_counter()
+print(json.dumps({'import_ms': (t1 - t0) * 1000, 'create_app_ms': (t2 - t1) * 1000,
+                  'first_request_ms': (t4 - t3) * 1000, 'status': status}))
+"""
+
+
+def run_probe(source_dir, runs):
+    """Returns (best timings dict, import microseconds per top-level package)."""
+    best = None
+    imports = {}
+    for _ in range(runs):
+        workdir = tempfile.mkdtemp(prefix='kps-startup-')
+        os.makedirs(os.path.join(workdir, 'instance'))
+        try:
+            env = dict(os.environ, PYTHONPATH=source_dir, PYTHONDONTWRITEBYTECODE='1')
+            proc = subprocess.run([sys.executable, '-X', 'importtime', '-c', PROBE],
+                                  cwd=workdir, env=env, capture_output=True, text=True, check=True)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+        timings = json.loads(proc.stdout.strip().splitlines()[-1])
+        if best is None or timings['import_ms'] + timings['create_app_ms'] < best['import_ms'] + best['create_app_ms']:
+            best = timings
+            imports = parse_importtime(proc.stderr)
+    return best, imports
+
+
+def parse_importtime(stderr):
+    # Lines look like "import time:  self_us | cumulative_us | <indent>name".
+    # Self times don't overlap, so summing them per top-level package attributes
+    # the whole import cost without double counting nested imports.
+    totals = {}
+    for line in stderr.splitlines():
+        if not line.startswith('import time:'):
+            continue
+        fields = line[len('import time:'):].split('|')
+        if len(fields) != 3 or not fields[0].strip().isdigit():
+            continue
+        package = fields[2].strip().split('.')[0]
+        totals[package] = totals.get(package, 0) + int(fields[0])
+    return totals
+
+
+def export_ref(ref):
+    target = tempfile.mkdtemp(prefix='kps-baseline-')
+    archive = subprocess.run(['git', 'archive', ref], cwd=ROOT, capture_output=True, check=True)
+    subprocess.run(['tar', '-x', '-C', target], input=archive.stdout, check=True)
+    return target
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--baseline', help='git ref to compare against (e.g. HEAD~1)')
+    parser.add_argument('--runs', type=int, default=5, help='best-of-N runs per tree')
+    parser.add_argument('--top', type=int, default=15, help='packages to list')
+    args = parser.parse_args()
+
+    current, current_imports = run_probe(ROOT, args.runs)
+    baseline, baseline_imports = None, {}
+    if args.baseline:
+        baseline_dir = export_ref(args.baseline)
+        try:
+            baseline, baseline_imports = run_probe(baseline_dir, args.runs)
+        finally:
+            shutil.rmtree(baseline_dir, ignore_errors=True)
+
+    print(f"{'phase':<20}{'current':>12}" + (f"{'baseline':>12}{'delta':>12}" if baseline else ''))
+    for key in ('import_ms', 'create_app_ms', 'first_request_ms'):
+        line = f"{key:<20}{current[key]:>12.1f}"
+        if baseline:
+            line += f"{baseline[key]:>12.1f}{current[key] - baseline[key]:>+12.1f}"
+        print(line)
+
+    print()
+    print(f"{'package (import ms)':<28}{'current':>10}" + (f"{'baseline':>10}{'delta':>10}" if baseline else ''))
+    packages = sorted(set(current_imports) | set(baseline_imports),
+                      key=lambda p: max(current_imports.get(p, 0), baseline_imports.get(p, 0)), reverse=True)
+    for package in packages[:args.top]:
+        now = current_imports.get(package, 0) / 1000
+        line = f"{package:<28}{now:>10.1f}"
+        if baseline:
+            before = baseline_imports.get(package, 0) / 1000
+            line += f"{before:>10.1f}{now - before:>+10.1f}"
+        print(line)
+
+
+if __name__ == '__main__':
+    main()
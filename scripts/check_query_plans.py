@@ -0,0 +1,262 @@
+"""
+Query-plan check.
+
+Seeds a throwaway database, requests every hot page through the test client
+and records each SQL statement the page issues (SQLAlchemy cursor events).
+Every SELECT / UPDATE / DELETE is then run through EXPLAIN QUERY PLAN. The
+check fails on:
+  * a full SCAN of a large table, or a SCAN of any table to look rows up
+    (the statement has a WHERE clause), unless listed in ALLOWED_SCANS.
+    An index walk in ORDER BY order that stops at a LIMIT (newest 10
+    invoices, one page of the audit log) is not a full scan.
+  * a temp B-tree (ORDER BY / GROUP BY / DISTINCT sort) over a large table
+  * a page issuing more statements than its budget, or the same statement
+    more times than its repeat limit (an N+1 loop)
+
+This is the regression gate for query counts and plans. The repo has no
+pytest suite, so it is a script: run it before merging any change under app/
+(and from CI, as the same command); it exits 1 on any problem.
+
+Usage:
+    python scripts/check_query_plans.py              # exit status 1 on any problem
+    python scripts/check_query_plans.py --verbose    # also print every plan
+    python scripts/check_query_plans.py --entries 50000
+"""
+import argparse
+import os
+import random
+import re
+import sys
+import tempfile
+from collections import Counter
+from datetime import date, datetime, timedelta
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+# Tables that grow with the business; anything else is a handful of rows
+LARGE_TABLES = {'entry', 'audit_log', 'invoice', 'anomaly', 'job', 'vendor_rate'}
+
+# Deliberate full reads and sorts: (pattern matched against the statement
+# with its whitespace collapsed, why it is fine)
+ALLOWED = [
+    (r"FROM entry ORDER BY id$", "analytics cube full load, once per process"),
+    (r"^SELECT count\(\*\) AS count_1 FROM \(SELECT entry\.", "settings: total entry count"),
+    (r"WHERE vendor\.is_default = 1", "vendor holds a few dozen rows and the flag is not selective"),
+    (r"FROM entry_fts .* ORDER BY rank", "search results are ranked by bm25 after the FTS match"),
+    (r"^SELECT COUNT\(\*\) FROM entry$", "cube deletion check after entry writes; counts the smallest index"),
+]
+
+# (statements per request, times one statement may repeat)
+DEFAULT_BUDGET = (15, 3)
+BUDGETS = {
+    'POST /generate_bill': (25, 3),
+    'POST /api/entries/batch': (15, 2),  # A fixed number per batch: no statement may repeat per item
+    'POST /edit/1': (12, 2),
+    'GET /entry/delete/2': (8, 2),
+    'POST /entries/bulk': (18, 2),  # One UPDATE/DELETE for the whole selection, whatever its size
+    'POST /settings/vendor/2/reprice': (22, 2),  # Dry run reads plus the UPDATE ... FROM and anomaly re-check
+}
+
+MONTH = date.today().strftime('%Y-%m')
+PAGES = [
+    ('GET', '/', None),
+    ('POST', '/', {'vendor': 'Vendor 1', 'date': date.today().isoformat(), 'parcels': '3', 'handling': '210',
+                   'railway': '50', 'transport': '', 'rr_no': 'RRCHECK1', 'from': 'Mumbai', 'to': 'Udupi'}),
+    ('GET', '/view', None),
+    ('GET', f'/view?mode=admin&vendor=All&month={MONTH}', None),
+    ('GET', f'/view?vendor=2&month={MONTH}', None),
+    ('GET', '/edit/1', None),
+    ('GET', '/analytics', None),
+    ('GET', '/analytics?vendor=2&period=quarter', None),
+    ('GET', '/api/analytics?group=route', None),
+    ('GET', '/invoices', None),
+    ('POST', '/generate_bill', {'month': MONTH, 'vendor': '3'}),
+    ('GET', '/invoice/1', None),
+    ('GET', '/api/invoices?vendor=3', None),
+    ('GET', f'/api/invoices?month={MONTH}', None),
+    ('GET', '/api/search?q=RR10', None),
+    ('GET', '/api/anomalies', None),
+    ('GET', '/api/anomalies?rule=missing_rr', None),
+    ('GET', '/api/anomalies/summary', None),
+    ('GET', '/api/today', None),
+    ('GET', '/settings', None),
+    ('GET', '/settings/audit', None),
+    ('GET', '/settings/audit?user=admin', None),
+    ('GET', '/settings/audit?action=LOGIN&start=2024-01-01&end=2030-01-01', None),
+    ('GET', '/settings/vendor/2/rates', None),
+    ('GET', '/settings/jobs', None),
+    ('JSON', '/api/chat', {'message': 'hello'}),
+    ('JSON', '/api/chat', {'message': 'revenue'}),
+    ('JSON', '/api/chat', {'message': 'top route'}),
+    ('JSON', '/api/chat', {'message': 'vendor 4 balance'}),
+    ('JSON', '/api/chat', {'message': 'any errors'}),
+    ('JSON', '/api/chat', {'message': 'last log'}),
+    ('JSON', '/api/entries/batch', {'entries': [
+        {'key': f'check-{i}', 'vendor': 'Vendor 2', 'date': date.today().isoformat(), 'parcels': 2,
+         'rr_no': f'RRB{i}', 'to': 'Karwar'} for i in range(10)]}),
+    # Writes: edit, delete, bulk actions and reprice (the rate CTE plus UPDATE ... FROM)
+    ('POST', '/edit/1', {'vendor': '2', 'date': date.today().isoformat(), 'parcels': '4', 'handling': '280',
+                         'railway': '50', 'transport': '0', 'rr_no': 'RR100000', 'from': 'Mumbai', 'to': 'Udupi'}),
+    ('GET', '/entry/delete/2', None),
+    ('JSON', '/entries/bulk', {'action': 'vendor', 'vendor': '3', 'ids': list(range(10, 60))}),
+    ('JSON', '/entries/bulk', {'action': 'date', 'date': date.today().isoformat(), 'ids': list(range(60, 110))}),
+    ('JSON', '/entries/bulk', {'action': 'route', 'ship_to': 'Karwar', 'ids': list(range(110, 160))}),
+    ('JSON', '/entries/bulk', {'action': 'delete', 'ids': list(range(160, 210))}),
+    ('JSON', '/settings/vendor/2/reprice', {'start': (date.today() - timedelta(days=90)).isoformat(),
+                                            'end': date.today().isoformat()}),
+    ('JSON', '/settings/vendor/2/reprice', {'start': (date.today() - timedelta(days=90)).isoformat(),
+                                            'end': date.today().isoformat(), 'apply': True}),
+]
+
+EXPLAINABLE = ('SELECT', 'UPDATE', 'DELETE', 'WITH')
+
+
+def seed(db, count):
+    from sqlalchemy import insert
+    from app import pricing
+    from app.models import AuditLog, Entry, Vendor
+
+    for i in range(1, 16):
+        vendor = Vendor(name=f'Vendor {i}', is_default=(i == 1))
+        db.session.add(vendor)
+        db.session.flush()
+        pricing.set_rate(vendor, pricing.OPENING_DATE, 70.0, 0.0)
+    rng, today = random.Random(7), date.today()
+    # A rate rise for Vendor 2 that its recent entries do not reflect yet, so the reprice apply writes
+    pricing.set_rate(db.session.get(Vendor, 2), today - timedelta(days=60), 75.0, 0.0)
+    db.session.commit()
+    routes = ['Udupi', 'Manipal', 'Karwar', 'Kundapur', 'Mangalore', 'Bhatkal']
+    rows = []
+    for i in range(count):
+        parcels = rng.randint(1, 12)
+        rows.append({'date': today - timedelta(days=rng.randint(0, 400)), 'vendor_id': rng.randint(1, 15),
+                     'ship_from': 'Mumbai', 'ship_to': rng.choice(routes),
+                     'rr_no': f'RR{100000 + i}' if rng.random() > 0.05 else None, 'parcels': parcels,
+                     'handling_chg': parcels * 70.0, 'railway_chg': 20.0, 'transport_chg': 0.0,
+                     'grand_total': parcels * 70.0 + 20.0})
+    db.session.execute(insert(Entry), rows)
+    db.session.execute(insert(AuditLog), [
+        {'username': rng.choice(['admin', 'staff']), 'action': rng.choice(['LOGIN', 'ADD ENTRY', 'DELETE ENTRY']),
+         'details': f'seed {i}', 'timestamp': datetime.utcnow() - timedelta(minutes=i)} for i in range(count // 4)])
+    db.session.commit()
+
+
+def problems_in_plan(statement, plan, tables):
+    """Plan rows are (id, parent, notused, detail); tables are the schema's (CTEs and subqueries also SCAN)."""
+    flat = ' '.join(statement.split())
+    if any(re.search(pattern, flat) for pattern, _ in ALLOWED):
+        return []
+    sorts = [row[3] for row in plan if 'USE TEMP B-TREE' in row[3]]
+    # Walking an index in the requested order and stopping at the LIMIT reads only the rows returned
+    ordered_walk = ' ORDER BY ' in flat and ' LIMIT ' in flat and not sorts
+
+    problems = []
+    for row in plan:
+        detail = row[3]
+        scan = re.match(r"SCAN (\w+)", detail)
+        if scan:
+            table = scan.group(1)
+            if table not in tables:
+                continue
+            if 'VIRTUAL TABLE' in detail or 'USING INTEGER PRIMARY KEY' in detail or ordered_walk:
+                continue  # FTS match, rowid range or top-N walk
+            if table in LARGE_TABLES or re.search(r'\bWHERE\b', flat):
+                problems.append(detail)
+    tables = {t for pair in re.findall(r'\bFROM (\w+)|\bJOIN (\w+)', flat) for t in pair if t}
+    if tables & LARGE_TABLES:
+        problems += sorts
+    return problems
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--entries', type=int, default=20000, help='Entries to seed.')
+    parser.add_argument('--verbose', action='store_true', help='Print every statement and its plan.')
+    args = parser.parse_args()
+
+    os.environ['KPS_RESPONSE_CACHE'] = 'off'  # Every request has to reach the database
+    os.environ['KPS_JOB_WORKERS'] = '0'
+    os.environ.pop('KPS_SHARDS', None)
+    os.chdir(tempfile.mkdtemp(prefix='kps-plans-'))
+    os.makedirs('instance')
+
+    from sqlalchemy import event
+    from sqlalchemy.engine import Engine
+    from app import create_app, migrations
+    from app.extensions import db
+
+    app = create_app()
+    with app.app_context():
+        migrations.upgrade()
+        migrations.seed_admin()
+        seed(db, args.entries)
+
+    captured = []
+
+    @event.listens_for(Engine, 'before_cursor_execute')
+    def capture(conn, cursor, statement, parameters, context, executemany):
+        if captured is not None:
+            captured.append((statement, parameters, executemany))
+
+    client = app.test_client()
+    client.post('/login', data={'username': 'admin', 'password': 'admin123'})
+
+    with app.app_context():
+        tables = set(db.session.connection().exec_driver_sql(
+            "SELECT name FROM sqlite_master WHERE type = 'table'").scalars())
+
+    failures = 0
+    explained = {}
+    print(f"{'page':<70} {'queries':>7}")
+    for method, path, data in PAGES:
+        captured.clear()
+        if method == 'JSON':
+            response = client.post(path, json=data)
+            method = 'POST'
+        elif method == 'POST':
+            response = client.post(path, data=data)
+        else:
+            response = client.get(path)
+        page = f"{method} {path}"
+        statements = [s for s in captured if s[0].lstrip().upper().startswith(EXPLAINABLE)]
+
+        notes = []
+        if response.status_code >= 400:
+            notes.append(f"status {response.status_code}")
+        budget, repeat_limit = BUDGETS.get(f"{method} {path.split('?')[0]}", DEFAULT_BUDGET)
+        if len(captured) > budget:
+            notes.append(f"{len(captured)} statements, budget {budget}")
+        for statement, count in Counter(s[0] for s in statements).items():
+            if count > repeat_limit:
+                notes.append(f"repeated {count}x (N+1?): {statement.splitlines()[0][:90]}")
+
+        with app.app_context():
+            for statement, parameters, executemany in statements:
+                if executemany:
+                    continue
+                key = statement
+                if key not in explained:
+                    plan = db.session.connection().exec_driver_sql(
+                        "EXPLAIN QUERY PLAN " + statement, parameters).fetchall()
+                    explained[key] = (plan, problems_in_plan(statement, plan, tables))
+                    if args.verbose:
+                        print(f"\n{statement}\n" + "\n".join(f"    {row[3]}" for row in plan))
+                for problem in explained[key][1]:
+                    notes.append(f"{problem}: {' '.join(statement.split())[:160]}")
+            db.session.rollback()
+
+        notes = list(dict.fromkeys(notes))
+        print(f"{page[:70]:<70} {len(captured):>7} {'OK' if not notes else 'FAIL'}")
+        for note in notes:
+            print(f"    - {note}")
+        failures += bool(notes)
+
+    captured = None
+    print()
+    print(f" {len(PAGES) - failures} of {len(PAGES)} pages passed, {len(explained)} distinct statements checked")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,344 @@
+"""
+Load test.
+
+Starts gunicorn (gunicorn.conf.py) against a freshly seeded database once per
+worker configuration, replays a weighted mix of counter traffic with a pool
+of logged-in clients and reports throughput and tail latency:
+  entry      POST /                  new counter entry
+  view       GET  /view              a month of the ledger (admin, all vendors)
+  analytics  GET  /analytics
+  invoice    POST /generate_bill     this month's bill for a random vendor
+  chat       POST /api/chat
+
+Usage:
+    python scripts/loadtest.py                                # 1x4, 2x4, 4x2 (workers x threads)
+    python scripts/loadtest.py --configs 1x1,2x8 --clients 32 --duration 30
+    python scripts/loadtest.py --mix entry=60,view=40 --by-op
+    python scripts/loadtest.py --url http://127.0.0.1:8000    # a server that is already running
+"""
+import argparse
+import http.client
+import json
+import os
+import random
+import shutil
+import signal
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from datetime import date
+from urllib.parse import urlencode, urlsplit
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_MIX = {'entry': 35, 'view': 30, 'analytics': 10, 'invoice': 5, 'chat': 20}
+VENDORS = ['Shiva', 'Udupi Traders', 'Karwar Freight', 'Malpe Exports', 'Kundapur Agencies']
+ROUTES = ['Udupi', 'Manipal', 'Karwar', 'Kundapur', 'Mangalore', 'Bhatkal']
+CHAT_MESSAGES = ['hello', 'revenue', 'profit margin', 'check errors', 'top route', 'show log', 'shiva balance']
+
+# Runs inside a clean interpreter in the work directory: schema, admin and a
+# year of history, inserted in bulk so seeding stays quick.
+SEED = r"""
+import random, sys
+from datetime import date, timedelta
+from sqlalchemy import insert
+from app import create_app, migrations, pricing
+from app.extensions import db
+from app.models import Entry, Vendor
+
+vendors, routes, count = sys.argv[1].split(','), sys.argv[2].split(','), int(sys.argv[3])
+app = create_app()
+with app.app_context():
+    migrations.upgrade()
+    migrations.seed_admin()
+    for i, name in enumerate(vendors):
+        vendor = Vendor(name=name, is_default=(i == 0))
+        db.session.add(vendor)
+        db.session.flush()
+        pricing.set_rate(vendor, pricing.OPENING_DATE, 70.0, 0.0)
+    db.session.commit()
+    rng, today = random.Random(7), date.today()
+    rows = []
+    for i in range(count):
+        parcels = rng.randint(1, 12)
+        handling, railway = parcels * 70.0, rng.choice([0.0, 20.0, 50.0])
+        rows.append({'date': today - timedelta(days=rng.randint(0, 365)), 'vendor_id': rng.randint(1, len(vendors)),
+                     'ship_from': 'Mumbai', 'ship_to': rng.choice(routes), 'rr_no': f'RR{100000 + i}',
+                     'parcels': parcels, 'handling_chg': handling, 'railway_chg': railway,
+                     'transport_chg': 0.0, 'grand_total': handling + railway})
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Entry), rows[start:start + 5000])
+    db.session.commit()
+"""
+
+
+# --- HTTP CLIENT ---
+class Client:
+    """One keep-alive connection with its own session cookie, like one browser tab."""
+
+    def __init__(self, base_url):
+        parts = urlsplit(base_url)
+        self.host, self.port = parts.hostname, parts.port or 80
+        self.conn = None
+        self.cookie = None
+
+    def request(self, method, path, body=None, content_type=None):
+        headers = {}
+        if self.cookie:
+            headers['Cookie'] = self.cookie
+        if content_type:
+            headers['Content-Type'] = content_type
+        for attempt in range(2):
+            if self.conn is None:
+                self.conn = http.client.HTTPConnection(self.host, self.port, timeout=120)
+            try:
+                self.conn.request(method, path, body=body, headers=headers)
+                response = self.conn.getresponse()
+                response.read()
+                break
+            except (http.client.HTTPException, OSError):
+                # The server closes idle or recycled keep-alive connections; reconnect once
+                self.conn.close()
+                self.conn = None
+                if attempt:
+                    raise
+        cookie = response.getheader('Set-Cookie')
+        if cookie and cookie.startswith('session='):
+            self.cookie = cookie.split(';', 1)[0]
+        return response.status
+
+    def get(self, path, **params):
+        return self.request('GET', path + ('?' + urlencode(params) if params else ''))
+
+    def post_form(self, path, data):
+        return self.request('POST', path, urlencode(data), 'application/x-www-form-urlencoded')
+
+    def post_json(self, path, data):
+        return self.request('POST', path, json.dumps(data), 'application/json')
+
+    def login(self, username, password):
+        return self.post_form('/login', {'username': username, 'password': password})
+
+
+# --- TRAFFIC MIX ---
+def recent_month(rng):
+    today = date.today()
+    index = today.year * 12 + today.month - 1 - rng.randint(0, 11)
+    return f"{index // 12}-{index % 12 + 1:02d}"
+
+
+def op_entry(client, rng):
+    parcels = rng.randint(1, 10)
+    return client.post_form('/', {
+        'vendor': rng.choice(VENDORS), 'date': date.today().isoformat(), 'parcels': parcels,
+        'handling': parcels * 70, 'railway': rng.choice([0, 20, 50]), 'transport': '',
+        'rr_no': f"LT{rng.randint(0, 10**8)}", 'from': 'Mumbai', 'to': rng.choice(ROUTES),
+    })
+
+
+def op_view(client, rng):
+    return client.get('/view', month=recent_month(rng), vendor='All', mode='admin')
+
+
+def op_analytics(client, rng):
+    return client.get('/analytics')
+
+
+def op_invoice(client, rng):
+    return client.post_form('/generate_bill', {'month': date.today().strftime('%Y-%m'),
+                                               'vendor': rng.randint(1, len(VENDORS))})
+
+
+def op_chat(client, rng):
+    return client.post_json('/api/chat', {'message': rng.choice(CHAT_MESSAGES)})
+
+
+OPERATIONS = {'entry': op_entry, 'view': op_view, 'analytics': op_analytics, 'invoice': op_invoice, 'chat': op_chat}
+
+
+def parse_mix(text):
+    mix = {}
+    for part in text.split(','):
+        name, _, weight = part.partition('=')
+        if name not in OPERATIONS:
+            raise SystemExit(f"unknown operation '{name}' (choose from {', '.join(OPERATIONS)})")
+        mix[name] = int(weight or 1)
+    return mix
+
+
+# --- DRIVER ---
+def drive(base_url, mix, clients, duration, warmup, seed):
+    """Runs the closed-loop mix and returns [(op, seconds, ok)] for the measured window."""
+    names, weights = list(mix), list(mix.values())
+    samples = []
+    samples_lock = threading.Lock()
+    start_at = time.perf_counter() + warmup
+    stop_at = start_at + duration
+
+    def worker(index):
+        rng = random.Random(seed + index)
+        client = Client(base_url)
+        client.login('admin', 'admin123')
+        local = []
+        while True:
+            now = time.perf_counter()
+            if now >= stop_at:
+                break
+            op = rng.choices(names, weights)[0]
+            began = time.perf_counter()
+            try:
+                ok = OPERATIONS[op](client, rng) < 400
+            except (http.client.HTTPException, OSError):
+                ok = False
+            if began >= start_at:
+                local.append((op, time.perf_counter() - began, ok))
+        with samples_lock:
+            samples.extend(local)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(clients)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    return samples
+
+
+def percentile(values, q):
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, int(round(q * (len(values) - 1))))]
+
+
+def summarize(samples, duration):
+    latencies = sorted(seconds for _, seconds, _ in samples)
+    return {
+        'requests': len(samples),
+        'errors': sum(1 for _, _, ok in samples if not ok),
+        'rps': len(samples) / duration if duration else 0.0,
+        'p50': percentile(latencies, 0.50) * 1000,
+        'p95': percentile(latencies, 0.95) * 1000,
+        'p99': percentile(latencies, 0.99) * 1000,
+    }
+
+
+# --- SERVER ---
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def seed_database(workdir, entries):
+    os.makedirs(os.path.join(workdir, 'instance'))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    subprocess.run([sys.executable, '-c', SEED, ','.join(VENDORS), ','.join(ROUTES), str(entries)],
+                   cwd=workdir, env=env, check=True)
+
+
+def start_server(template_dir, workers, threads):
+    """Copies the seeded instance folder and starts gunicorn on it. Returns (process, url, workdir)."""
+    workdir = tempfile.mkdtemp(prefix='kps-load-')
+    shutil.copytree(os.path.join(template_dir, 'instance'), os.path.join(workdir, 'instance'))
+    port = free_port()
+    env = dict(os.environ, PYTHONPATH=ROOT, KPS_BIND=f'127.0.0.1:{port}',
+               KPS_WORKERS=str(workers), KPS_THREADS=str(threads), KPS_LOG_LEVEL='warning')
+    process = subprocess.Popen([sys.executable, '-m', 'gunicorn', '-c', os.path.join(ROOT, 'gunicorn.conf.py'), 'wsgi:app'],
+                               cwd=workdir, env=env)
+    url = f'http://127.0.0.1:{port}'
+
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if process.poll() is not None:
+            raise SystemExit(f"gunicorn exited with code {process.returncode}")
+        try:
+            if Client(url).get('/login') == 200:
+                return process, url, workdir
+        except OSError:
+            pass
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit("gunicorn did not come up within 60s")
+
+
+def stop_server(process, workdir):
+    process.send_signal(signal.SIGTERM)
+    try:
+        process.wait(timeout=30)
+    except subprocess.TimeoutExpired:
+        process.kill()
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+# --- REPORT ---
+def print_row(label, stats):
+    print(f"{label:<14}{stats['requests']:>9}{stats['errors']:>8}{stats['rps']:>10.1f}"
+          f"{stats['p50']:>10.1f}{stats['p95']:>10.1f}{stats['p99']:>10.1f}")
+
+
+def print_header(first):
+    print(f"{first:<14}{'requests':>9}{'errors':>8}{'req/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--configs', default='1x4,2x4,4x2', help='comma separated WORKERSxTHREADS')
+    parser.add_argument('--url', help='test this running server instead of starting gunicorn')
+    parser.add_argument('--clients', type=int, default=16, help='concurrent logged-in clients')
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds per configuration')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds before each run')
+    parser.add_argument('--entries', type=int, default=20000, help='ledger rows to seed')
+    parser.add_argument('--mix', default=','.join(f'{k}={v}' for k, v in DEFAULT_MIX.items()))
+    parser.add_argument('--by-op', action='store_true', help='also break each run down per operation')
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+    mix = parse_mix(args.mix)
+
+    if args.url:
+        runs = [(args.url, args.url, None)]
+        template_dir = None
+    else:
+        runs = []
+        for config in args.configs.split(','):
+            workers, _, threads = config.partition('x')
+            runs.append((config, int(workers), int(threads or 1)))
+        template_dir = tempfile.mkdtemp(prefix='kps-load-seed-')
+        print(f"Seeding {args.entries} entries...")
+        seed_database(template_dir, args.entries)
+
+    results = []
+    try:
+        for label, workers, threads in runs:
+            process = workdir = None
+            if template_dir:
+                process, url, workdir = start_server(template_dir, workers, threads)
+            else:
+                url = label
+            try:
+                print(f"Running {label} with {args.clients} clients for {args.duration:g}s...")
+                samples = drive(url, mix, args.clients, args.duration, args.warmup, args.seed)
+            finally:
+                if process:
+                    stop_server(process, workdir)
+            results.append((label, samples))
+    finally:
+        if template_dir:
+            shutil.rmtree(template_dir, ignore_errors=True)
+
+    print()
+    print_header('workers x thr')
+    for label, samples in results:
+        print_row(label, summarize(samples, args.duration))
+
+    if args.by_op:
+        for label, samples in results:
+            print()
+            print_header(label)
+            for op in mix:
+                print_row(f"  {op}", summarize([s for s in samples if s[0] == op], args.duration))
+
+
+if __name__ == '__main__':
+    main()
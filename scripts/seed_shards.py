@@ -0,0 +1,99 @@
+"""
+Local multi-branch setup.
+
+Creates one instance folder per branch under --dir, each with its own
+logistics.db holding a few months of entries. Every branch seeds the same
+vendors in a different order, so vendor ids differ between branches the way
+they do on real branch servers and the reports have to merge by name.
+
+Usage:
+    python scripts/seed_shards.py                              # mumbai, pune, goa under instance/shards
+    python scripts/seed_shards.py --branches mumbai,pune --entries 5000 --dir /tmp/kps
+
+Then run the first branch with the others attached as shards (printed at the end):
+    cd instance/shards/mumbai && KPS_BRANCH=mumbai KPS_SHARDS=pune=...,goa=... python ../../../run.py
+"""
+import argparse
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+VENDORS = ['Shiva', 'Udupi Traders', 'Karwar Freight', 'Malpe Exports', 'Kundapur Agencies']
+ROUTES = ['Udupi', 'Manipal', 'Karwar', 'Kundapur', 'Mangalore', 'Bhatkal']
+
+# Runs inside a clean interpreter with the branch folder as working
+# directory, so create_app() puts the database in <branch>/instance/.
+SEED = r"""
+import random, sys
+from datetime import date, timedelta
+from sqlalchemy import insert
+from app import create_app, migrations, pricing
+from app.extensions import db
+from app.models import Entry, Vendor
+
+branch, offset, count = sys.argv[1], int(sys.argv[2]), int(sys.argv[3])
+vendors, routes = sys.argv[4].split(','), sys.argv[5].split(',')
+vendors = vendors[offset:] + vendors[:offset]
+app = create_app()
+with app.app_context():
+    migrations.upgrade()
+    migrations.seed_admin()
+    if Vendor.query.first():
+        sys.exit(f" {branch}: already seeded, skipped")
+    for i, name in enumerate(vendors):
+        vendor = Vendor(name=name, is_default=(i == 0))
+        db.session.add(vendor)
+        db.session.flush()
+        pricing.set_rate(vendor, pricing.OPENING_DATE, 70.0, 0.0)
+    db.session.commit()
+    rng, today = random.Random(branch), date.today()
+    rows = []
+    for i in range(count):
+        parcels = rng.randint(1, 12)
+        handling, railway = parcels * 70.0, rng.choice([0.0, 20.0, 50.0])
+        rows.append({'date': today - timedelta(days=rng.randint(0, 120)), 'vendor_id': rng.randint(1, len(vendors)),
+                     'ship_from': branch.capitalize(), 'ship_to': rng.choice(routes),
+                     'rr_no': f'{branch[:3].upper()}{100000 + i}', 'parcels': parcels,
+                     'handling_chg': handling, 'railway_chg': railway,
+                     'transport_chg': 0.0, 'grand_total': handling + railway})
+    for start in range(0, len(rows), 5000):
+        db.session.execute(insert(Entry), rows[start:start + 5000])
+    db.session.commit()
+    print(f" {branch}: {count} entries")
+"""
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--dir', default=os.path.join(ROOT, 'instance', 'shards'), help='Where the branch folders go.')
+    parser.add_argument('--branches', default='mumbai,pune,goa', help='Comma-separated; the first is the reporting branch.')
+    parser.add_argument('--entries', type=int, default=2000, help='Entries per branch.')
+    args = parser.parse_args()
+
+    branches = [b.strip().lower() for b in args.branches.split(',') if b.strip()]
+    if len(branches) < 2:
+        parser.error('need at least two branches')
+
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    env.pop('KPS_SHARDS', None)
+    paths = {}
+    for offset, branch in enumerate(branches):
+        folder = os.path.join(os.path.abspath(args.dir), branch)
+        os.makedirs(folder, exist_ok=True)
+        subprocess.run([sys.executable, '-c', SEED, branch, str(offset % len(VENDORS)), str(args.entries),
+                        ','.join(VENDORS), ','.join(ROUTES)],
+                       cwd=folder, env=dict(env, KPS_BRANCH=branch), check=True)
+        paths[branch] = os.path.join(folder, 'instance', 'logistics.db')
+
+    home, others = branches[0], branches[1:]
+    shards = ','.join(f"{b}={paths[b]}" for b in others)
+    print()
+    print(f" Run the {home} branch with the others attached:")
+    print(f"   cd {os.path.dirname(os.path.dirname(paths[home]))} && \\")
+    print(f"   KPS_BRANCH={home} KPS_SHARDS={shards} python {os.path.join(ROOT, 'run.py')}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,8 @@
+from app import create_app, templating
+
+# Entry point for production servers:
+#     gunicorn -c gunicorn.conf.py wsgi:app
+# With preload_app the master imports this once, so templates are compiled
+# here and every forked worker starts with them already in memory.
+app = create_app()
+templating.warm_templates(app)